@@ -0,0 +1,36 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+from ...peripheral_models.timer_model import TimerModel
+from ..bp_handler import BPHandler, bp_handler, fast_forward_delay
+import logging
+log = logging.getLogger(__name__)
+
+
+class Delay(BPHandler):
+    '''
+        ASF delay service. Delays are skipped, with a virtual clock time
+        is fast forwarded by the delay, see fast_forward_delay
+    '''
+
+    def __init__(self, model=TimerModel):
+        self.model = model
+
+    @bp_handler(['delay_cycles_us'])
+    def delay_us(self, qemu, bp_addr):
+        # void delay_cycles_us(uint32_t n);
+        us = qemu.regs.r0
+        log.debug("Delay %i us" % us)
+        ret = fast_forward_delay(qemu, bp_addr, self.model, us / 1000000.0,
+                                 lambda left: int(round(left * 1000000)))
+        return (True, None) if ret is None else ret
+
+    @bp_handler(['delay_cycles_ms'])
+    def delay_ms(self, qemu, bp_addr):
+        # void delay_cycles_ms(uint32_t n);
+        ms = qemu.regs.r0
+        log.debug("Delay %i ms" % ms)
+        ret = fast_forward_delay(qemu, bp_addr, self.model, ms / 1000.0,
+                                 lambda left: int(round(left * 1000)))
+        return (True, None) if ret is None else ret
@@ -4,6 +4,7 @@
 
 
 from ...peripheral_models.ethernet import EthernetModel
+from ...peripheral_models import virtual_clock
 from ..intercepts import tx_map, rx_map
 from ..bp_handler import BPHandler, bp_handler
 from collections import defaultdict, deque
@@ -135,7 +136,7 @@ class Ksz8851Eth(BPHandler):
             log.info("Fifo Read, Blocking")
             frame, rx_time = self.model.get_rx_frame(self.get_id(qemu), True)
         log.info("Frame Received: Delay %s, Frame: %s" %
-                 (str(time.time()-rx_time), binascii.hexlify(frame[:10])))
+                 (str(virtual_clock.time()-rx_time), binascii.hexlify(frame[:10])))
         buf_ptr = qemu.regs.r0
         length = qemu.regs.r1
         log.info("Reading into: %s, %i" % (hex(buf_ptr), length))
@@ -5,6 +5,7 @@
 
 import IPython
 from ...peripheral_models.ethernet import EthernetModel
+from ...peripheral_models import virtual_clock
 from ..intercepts import tx_map, rx_map
 from ..bp_handler import BPHandler, bp_handler
 from collections import defaultdict, deque
@@ -58,7 +59,7 @@ class Ksz8851HLE(BPHandler):
     def __init__(self, model=EthernetModel):
         BPHandler.__init__(self)
         self.model = model
-        self.last_rx_time = time.time()
+        self.last_rx_time = virtual_clock.time()
         self.last_exec_time = time.time()
         self.dev_ptr = None
         self.netif_ptr = None
@@ -119,7 +120,10 @@ class Ksz8851HLE(BPHandler):
                 # and this one to be freed by stack
                 qemu.write_memory(self.dev_ptr + DEVICE_RX_PBUF, 4, 0, 1)
 
-                self.last_rx_time = time.time()
+                # Frame times are on the virtual clock, see get_rx_frame
+                rx_now = virtual_clock.time()
+                inter_packet = rx_now - self.last_rx_time
+                self.last_rx_time = rx_now
 
                 # Get payload_ptr
                 payload_ptr = qemu.read_memory(rx_pbuf_ptr+PBUF_PAYLOAD, 4, 1)
@@ -143,7 +147,7 @@ class Ksz8851HLE(BPHandler):
                 self.dev_ptr = None
                 self.netif_ptr = None
                 log.info("Got Frame: LATENCY %f, inter packet time %f" %
-                         (time.time()-rx_time, (time.time() - self.last_rx_time)))
+                         (rx_now - rx_time, inter_packet))
                 log.info("Execution Time rx_packet %f " %
                          (time.time()-start_time))
                 return False, None
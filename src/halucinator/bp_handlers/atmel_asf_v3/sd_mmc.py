@@ -127,13 +127,12 @@ class SDCard(BPHandler):
                  (dest, number_blocks))
         log.info("LR: %s", hex(qemu.regs.lr))
 
-        blocks = []
-        for i in range(number_blocks):
-            blocks.append(self.model.read_block(self.active_read_slot,
-                                                self.active_read_block))
-            self.active_read_block += 1
-        data = ''.join(blocks)
-        qemu.write_memory(dest, 1, data, len(data), raw=True)
+        if number_blocks:
+            data = self.model.read_blocks(self.active_read_slot,
+                                          self.active_read_block,
+                                          number_blocks)
+            qemu.write_memory(dest, 1, data, len(data), raw=True)
+            self.active_read_block += number_blocks
 
         return True, 0
 
@@ -170,12 +169,12 @@ class SDCard(BPHandler):
         log.info("LR: %s", hex(qemu.regs.lr))
 
         block_size = self.slot_configs[self.active_write_slot]['block_size']
-        for i in range(nb_blocks):
-            addr = i * block_size
-            data = qemu.read_memory(addr, 1, block_size, raw=True)
-            self.model.write_block(self.active_write_slot,
-                                   self.active_write_block, data)
-            self.active_write_block += 1
+        if nb_blocks:
+            data = qemu.read_memory(src_ptr, 1, nb_blocks * block_size,
+                                    raw=True)
+            self.model.write_blocks(self.active_write_slot,
+                                    self.active_write_block, data)
+            self.active_write_block += nb_blocks
 
         return True, 0
 
@@ -4,6 +4,8 @@
 
 
 from functools import wraps
+from ..peripheral_models import virtual_clock
+from ..peripheral_models.timer_scheduler import TOLERANCE
 
 
 def bp_handler(arg):
@@ -26,15 +28,81 @@ def bp_handler(arg):
         return bp_decorator
 
 
-class BPHandler(object):
+def hypercall_safe(func):
+    '''
+        @hypercall_safe decorator, for bp_handlers that can be called
+        through the hypercall channel: they always intercept and only use
+        registers r0-r3, sp, and lr (no memory access or execution
+        control). Intercepts with hypercall set are only accepted for
+        these handlers
+    '''
+    func.hypercall_safe = True
+    return func
+
+
+class BPHandlerMeta(type):
+    '''
+        Builds the table of function name to @bp_handler method for each
+        BPHandler class when the class is created, so registering a
+        handler is a dictionary lookup
+    '''
+    def __init__(cls, name, bases, namespace):
+        super(BPHandlerMeta, cls).__init__(name, bases, namespace)
+        handlers = {}
+        for attr_name in dir(cls):
+            method = getattr(cls, attr_name)
+            for func_name in getattr(method, 'bp_func_list', ()):
+                handlers.setdefault(func_name, method)
+        cls.bp_handlers = handlers
+
+
+class BPHandler(object, metaclass=BPHandlerMeta):
 
     def register_handler(self, qemu, addr, func_name):
-        canidate_methods = [getattr(self.__class__, x) for x in dir(
-            self.__class__) if hasattr(getattr(self.__class__, x), 'bp_func_list')]
-        for canidate in canidate_methods:
-            if func_name in canidate.bp_func_list:
-                return canidate
+        handler = self.bp_handlers.get(func_name)
+        if handler is not None:
+            return handler
 
         error_str = "%s does not have bp_handler for %s" % \
                     (self.__class__.__name__, func_name)
         raise ValueError(error_str)
+
+    def get_static_return(self, addr):
+        '''
+            Handlers that always return the same thing, with no other side
+            effects, can be replaced by a stub written into the firmware.
+
+            :param addr:  Address the handler is registered for
+            :returns: (is_static, ret_value) ret_value of None just returns
+        '''
+        return False, None
+
+
+def fast_forward_delay(qemu, bp_addr, model, seconds, remaining_arg):
+    '''
+        For handlers of delay functions (e.g., HAL_Delay) with a virtual
+        clock. Time is fast forwarded up to the next timer deadline, see
+        TimerModel.delay. If time is left, the function is called again
+        with remaining_arg(seconds left) as its first argument, by
+        continuing at the BL that called it, so the firmware runs the
+        timers' ISRs first and each tick is seen. remaining_arg returns 0
+        if what is left rounds to nothing
+
+        If the function can't be called again (e.g., it was tail called)
+        its own delay runs.
+
+        :returns (intercept, ret_value) for the handler to return, None
+                 without a virtual clock
+    '''
+    if not virtual_clock.clock.is_virtual:
+        return None
+    site = qemu.call_site(bp_addr)
+    if site is None:
+        return False, None
+    left = seconds - model.delay(seconds)
+    arg = remaining_arg(left) if left > TOLERANCE else 0
+    if not arg:
+        return True, None
+    qemu.regs.r0 = arg
+    qemu.regs.pc = site | 1
+    return False, None
@@ -1,4 +1,4 @@
-from ..bp_handler import BPHandler, bp_handler
+from ..bp_handler import BPHandler, bp_handler, hypercall_safe
 import logging
 from ... import hal_log
 
@@ -25,6 +25,7 @@ class ReturnZero(BPHandler):
         return ReturnZero.return_zero
 
     @bp_handler
+    @hypercall_safe
     def return_zero(self, qemu, addr):
         '''
             Intercept Execution and return 0
@@ -33,6 +34,9 @@ class ReturnZero(BPHandler):
             hal_log.info("ReturnZero: %s " %(self.func_names[addr]))
         return True, 0
 
+    def get_static_return(self, addr):
+        return True, 0
+
 
 class ReturnConstant(BPHandler):
     '''
@@ -56,6 +60,7 @@ class ReturnConstant(BPHandler):
         return ReturnConstant.return_constant
 
     @bp_handler
+    @hypercall_safe
     def return_constant(self, qemu, addr):
         '''
             Intercept Execution and return 0
@@ -64,6 +69,9 @@ class ReturnConstant(BPHandler):
             hal_log.info("ReturnConstant: %s : %#x" %(self.func_names[addr], self.ret_values[addr]))
         return True, self.ret_values[addr]
 
+    def get_static_return(self, addr):
+        return True, self.ret_values[addr]
+
 
 class SkipFunc(BPHandler):
     '''
@@ -85,10 +93,14 @@ class SkipFunc(BPHandler):
         return SkipFunc.skip
 
     @bp_handler
+    @hypercall_safe
     def skip(self, qemu, addr):
         '''
             Just return
         '''
         if not self.silent[addr]:
             hal_log.info("SkipFunc: %s " %(self.func_names[addr]))
-        return True, None
\ No newline at end of file
+        return True, None
+
+    def get_static_return(self, addr):
+        return True, None
@@ -6,7 +6,7 @@ import re
 from binascii import hexlify
 from os import path
 import sys
-from ..bp_handler import BPHandler, bp_handler
+from ..bp_handler import BPHandler, bp_handler, hypercall_safe
 
 # sys.path.insert(0,path.dirname(path.dirname(path.abspath(__file__))))
 
@@ -36,6 +36,7 @@ class Counter(BPHandler):
         return Counter.get_value
 
     @bp_handler
+    @hypercall_safe
     def get_value(self, qemu, addr):
         '''
             Gets the counter value
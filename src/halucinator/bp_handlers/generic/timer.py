@@ -6,8 +6,8 @@ import re
 from binascii import hexlify
 from os import path
 import sys
-from ..bp_handler import BPHandler, bp_handler
-import time
+from ..bp_handler import BPHandler, bp_handler, hypercall_safe
+from ...peripheral_models import virtual_clock
 import logging
 log = logging.getLogger(__name__)
 # log.setLevel(logging.DEBUG)
@@ -16,7 +16,7 @@ log = logging.getLogger(__name__)
 
 class Timer(BPHandler):
     '''
-        Returns an increasing value based of host system time 
+        Returns an increasing value based of virtual_clock time
 
         - class: halucinator.bp_handlers.Timer
           function: <func_name> (Can be anything)
@@ -32,18 +32,19 @@ class Timer(BPHandler):
         '''
 
         '''
-        self.start_time[addr] = time.time()
+        self.start_time[addr] = virtual_clock.now()
         self.scale[addr] = scale
 
         return Timer.get_value
 
     @bp_handler
+    @hypercall_safe
     def get_value(self, qemu, addr):
         '''
             Gets the current timer value
         '''
         time_ms = int(
-            (time.time() - self.start_time[addr]) * 1000 / float(self.scale[addr]))
+            (virtual_clock.now() - self.start_time[addr]) * 1000 / float(self.scale[addr]))
         log.info("Time: %i" % time_ms)
 
         return True, time_ms
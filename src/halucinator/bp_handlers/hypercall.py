@@ -0,0 +1,207 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+from avatar2.peripherals.avatar_peripheral import AvatarPeripheral
+from struct import pack
+from ..util import cortex_m_helpers as CM
+import logging
+log = logging.getLogger(__name__)
+
+from .. import hal_log as hal_log_conf
+hal_log = hal_log_conf.getHalLogger()
+
+# Layout of the hypercall MMIO page
+ARG1_OFFSET = 0x00
+ARG2_OFFSET = 0x04
+ARG3_OFFSET = 0x08
+LR_OFFSET = 0x0C
+SP_OFFSET = 0x10
+RET_OFFSET = 0x14
+DISPATCH_OFFSET = 0x100  # Storing r0 to DISPATCH_OFFSET + 4*id calls id
+PAGE_SIZE = 0x1000
+MAX_HYPERCALLS = (PAGE_SIZE - DISPATCH_OFFSET) // 4
+
+LATCHED_REGS = {ARG1_OFFSET: 'r1', ARG2_OFFSET: 'r2', ARG3_OFFSET: 'r3',
+                LR_OFFSET: 'lr', SP_OFFSET: 'sp'}
+
+
+class HypercallRegs(object):
+    '''
+        Register view given to handlers run from a hypercall. Only the
+        registers stored by the trampoline are available, writing r0 sets
+        the return value.
+    '''
+
+    def __init__(self, values):
+        self.__dict__['_values'] = values
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise NotImplementedError(
+                "Register %s not available in hypercall handlers" % name)
+
+    def __setattr__(self, name, value):
+        if name != 'r0':
+            raise NotImplementedError(
+                "Only r0 can be written in hypercall handlers")
+        self._values['r0'] = value
+
+
+class HypercallTarget(object):
+    '''
+        Stand in for the QemuTarget passed to handlers called through the
+        hypercall channel.  QEMU is blocked in the MMIO write while the
+        handler runs, so only the argument registers, lr and sp
+        (latched by the trampoline) are available.  Memory and execution
+        control are not.
+    '''
+
+    def __init__(self, qemu, values):
+        self.qemu = qemu
+        self.avatar = qemu.avatar
+        self.regs = HypercallRegs(values)
+
+    def get_arg(self, idx):
+        if idx >= 0 and idx < 4:
+            return getattr(self.regs, "r%i" % idx)
+        raise NotImplementedError(
+            "Stack arguments not available in hypercall handlers")
+
+    def get_ret_addr(self):
+        return self.regs.lr
+
+    def read_register(self, reg):
+        return getattr(self.regs, reg)
+
+    def _unavailable(self, *args, **kwargs):
+        raise NotImplementedError(
+            "Target access not available in hypercall handlers")
+
+    read_memory = _unavailable
+    write_memory = _unavailable
+    write_register = _unavailable
+    execute_return = _unavailable
+    cont = _unavailable
+
+
+class HypercallChannel(AvatarPeripheral):
+    '''
+        Alternative to break point intercepts. The entry of an
+        intercepted function is patched to jump to a trampoline in patch
+        memory, which stores the arguments to this MMIO page and then
+        stores r0 to the function's dispatch slot.  The write is handled
+        by hw_write, which calls the registered bp_handler without
+        stopping QEMU. The trampoline then loads the return value from
+        the page and returns.
+
+        Handlers used this way must be @hypercall_safe: always intercept
+        the function, and only use registers r0-r3, sp, and lr.
+    '''
+
+    def __init__(self, address, dispatch, name='hypercalls'):
+        '''
+            :param address:     Base address of the MMIO page
+            :param dispatch:    Called as dispatch(key, target, bp_addr)
+                                when a hypercall is made, returns
+                                (intercept, ret_value)
+        '''
+        AvatarPeripheral.__init__(self, name, address, PAGE_SIZE)
+        self.dispatch = dispatch
+        self.keys = []  # Index is hypercall id
+        self.latched = {}
+        self.ret_value = 0
+        self.qemu = None
+        self.read_handler[0:PAGE_SIZE] = self.hw_read
+        self.write_handler[0:PAGE_SIZE] = self.hw_write
+
+    def get_mmio_info(self):
+        return self.name, self.address, self.size, 'rw-'
+
+    def hw_read(self, offset, size, pc=0xBAADBAAD):
+        if offset == RET_OFFSET:
+            return self.ret_value
+        return self.latched.get(offset, 0)
+
+    def hw_write(self, offset, size, value, pc=0xBAADBAAD):
+        if offset < DISPATCH_OFFSET:
+            self.latched[offset] = value
+            return True
+
+        hc_id = (offset - DISPATCH_OFFSET) // 4
+        values = {LATCHED_REGS[k]: v for k, v in self.latched.items()}
+        values['r0'] = value
+        key, bp_addr = self.keys[hc_id]
+        values['pc'] = bp_addr
+        target = HypercallTarget(self.qemu, values)
+        intercept, ret_value = self.dispatch(key, target, bp_addr)
+        if not intercept:
+            # Handlers are checked to be @hypercall_safe when registered
+            hal_log.error("Hypercall_safe handler for %s did not intercept, "
+                          "function will return anyway" % key)
+        if ret_value is None:
+            ret_value = target.regs.r0
+        self.ret_value = ret_value & 0xFFFFFFFF
+        return True
+
+    def trampoline(self, addr, hc_id):
+        '''
+            Code that stores the arguments to the page and makes the
+            hypercall, placed at addr
+        '''
+        body = CM.thumb_str_imm(1, CM.IP, ARG1_OFFSET)
+        body += CM.thumb_str_imm(2, CM.IP, ARG2_OFFSET)
+        body += CM.thumb_str_imm(3, CM.IP, ARG3_OFFSET)
+        body += CM.thumb_str_imm(CM.LR, CM.IP, LR_OFFSET)
+        body += CM.thumb_str_imm(CM.SP, CM.IP, SP_OFFSET)
+        body += CM.thumb_str_imm(0, CM.IP, DISPATCH_OFFSET + 4 * hc_id)
+        body += CM.thumb_ldr_imm(0, CM.IP, RET_OFFSET)
+        body += CM.thumb_bx_lr()
+        # ip = page address, loaded from literal after the code
+        literal_addr = (addr + 4 + len(body) + 3) & ~3
+        code = CM.thumb_ldr_literal(CM.IP, addr, literal_addr) + body
+        code += b'\x00' * (literal_addr - addr - len(code))
+        code += pack('<I', self.address)
+        return code
+
+    def install(self, qemu, intercept, key, func_size=0):
+        '''
+            Patches the intercepted function to use the hypercall
+
+            :param qemu:        QemuTarget, with patch memory helpers
+            :param intercept:   HalInterceptConfig being installed
+            :param key:         Key passed to dispatch for this intercept
+            :param func_size:   Size of the function if known, 0 otherwise
+            :returns:           True if installed, False if a break point
+                                must be used instead
+        '''
+        self.qemu = qemu
+        hc_id = len(self.keys)
+        if hc_id >= MAX_HYPERCALLS:
+            log.warning("Hypercall page full, using breakpoint for %s"
+                        % intercept)
+            return False
+        bp_addr = intercept.bp_addr & 0xFFFFFFFE
+        # Size unknown so use a temporary address to get the length
+        jump = CM.thumb_long_jump(bp_addr, 0)
+        if func_size and func_size < len(jump):
+            log.warning("Function too small for hypercall, using breakpoint "
+                        "for %s" % intercept)
+            return False
+        try:
+            tramp_size = len(self.trampoline(0, hc_id))
+            tramp_addr = qemu.alloc_patch_memory(tramp_size)
+        except ValueError as e:
+            log.warning("%s, using breakpoint for %s" % (e, intercept))
+            return False
+
+        tramp = self.trampoline(tramp_addr, hc_id)
+        qemu.write_memory(tramp_addr, 1, tramp, len(tramp), raw=True)
+        jump = CM.thumb_long_jump(bp_addr, tramp_addr)
+        qemu.write_memory(bp_addr, 1, jump, len(jump), raw=True)
+        self.keys.append((key, intercept.bp_addr))
+        log.info("Hypercall %i installed for %s, trampoline %#x" %
+                 (hc_id, intercept, tramp_addr))
+        return True
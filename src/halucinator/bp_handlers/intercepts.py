@@ -5,11 +5,17 @@
 from functools import wraps
 from . import bp_handler as bp_handler
 import importlib
+import json
 import yaml
 from ..util import hexyaml
 import os
+import time
 import logging
 from .. import hal_stats as hal_stats
+from .. import hal_latency as hal_latency
+from ..peripheral_models import virtual_clock
+from ..peripheral_models.interrupts import Interrupts
+from . import static_stubs
 log = logging.getLogger(__name__)
 
 from .. import hal_log as hal_log_conf
@@ -68,6 +74,20 @@ def rx_map(per_model_funct):
 
 initalized_classes = {}
 bp2handler_lut = {}
+bp2mem_cache = {}  # bp: line size of memory transaction used by its handler
+hypercall_channel = None  # HypercallChannel, set if hypercall intercepts used
+static_stub_counters = {}  # key: address of static stub's call counter
+intercept_trace = None  # File break point hits are recorded to
+
+
+def set_trace_file(filename):
+    '''
+        Records every break point hit (function, address and registers)
+        to filename as json lines, which tools/replay_intercepts.py replays
+    '''
+    global intercept_trace
+    intercept_trace = open(filename, 'w', buffering=1)
+
 
 def get_bp_handler(intercept):
     '''
@@ -107,6 +127,56 @@ def register_bp_handler(qemu, intercept):
     if intercept.bp_addr is None:
         log.debug("No address specified for %s ignoring intercept" % intercept)
         return
+    bp_cls, handler, bp = _setup_bp_handler(qemu, intercept)
+    if bp is None:
+        bp = qemu.set_breakpoint(intercept.bp_addr,
+                                 temporary=intercept.run_once)
+    _add_bp_handler(intercept, bp_cls, handler, bp)
+
+
+def register_bp_handlers(qemu, intercept_list):
+    '''
+        Registers BP handlers for many intercepts, all break points are
+        inserted together at the end using qemu.set_breakpoints
+
+        :param qemu:    Avatar qemu target
+        :param intercept_list: List of HALInterceptConfig
+        :returns: Dictionary of seconds spent registering handlers
+                  ('handlers') and inserting break points ('breakpoints')
+    '''
+    start = time.time()
+    pending = []
+    for intercept in intercept_list:
+        if intercept.bp_addr is None:
+            log.debug("No address specified for %s ignoring intercept" % intercept)
+            continue
+        log.info("Registering Intercept: %s" % intercept)
+        bp_cls, handler, bp = _setup_bp_handler(qemu, intercept)
+        if bp is None:
+            pending.append((intercept, bp_cls, handler))
+        else:
+            _add_bp_handler(intercept, bp_cls, handler, bp)
+    handlers_done = time.time()
+
+    bp_nums = qemu.set_breakpoints(
+        [(intercept.bp_addr, intercept.run_once) for intercept, _, _ in pending])
+    for (intercept, bp_cls, handler), bp in zip(pending, bp_nums):
+        if bp < 0:
+            hal_log.error("Failed to set break point for %s" % intercept)
+            continue
+        _add_bp_handler(intercept, bp_cls, handler, bp)
+    return {'handlers': handlers_done - start,
+            'breakpoints': time.time() - handlers_done}
+
+
+def _setup_bp_handler(qemu, intercept):
+    '''
+        Gets the handler for the intercept and installs it if it is not a
+        break point (hypercall, static stub, or watch point)
+
+        :returns: (bp_cls, handler, bp)  bp is None if a break point
+                  needs to be inserted
+    '''
     bp_cls = get_bp_handler(intercept)
 
     try:
@@ -130,12 +200,51 @@ def register_bp_handler(qemu, intercept):
         exit(-1)
 
     if intercept.run_once:
-        bp_temp = True
         log.debug("Setting as Tempory")
-    else:
-        bp_temp = False
-        
-    if intercept.watchpoint:
+
+    bp = None
+    config = getattr(qemu.avatar, 'config', None)
+    func_size = config.get_symbol_size(intercept.bp_addr) if config else 0
+    options = config.options if config else {}
+    if intercept.hypercall and not getattr(handler, 'hypercall_safe', False):
+        hal_log.error("Handler %s.%s is not @hypercall_safe, it can't be used "
+                      "with hypercall: %s" % (intercept.cls, handler.__name__,
+                                              intercept))
+        exit(-1)
+    if intercept.hypercall and \
+            (config is None or config.machine.arch != 'cortex-m3'):
+        # The hypercall stub is Thumb-2 code
+        hal_log.error("Hypercalls need a Thumb target, hypercall can not be "
+                      "used on: %s" % intercept)
+        exit(-1)
+    if intercept.hypercall and hypercall_channel is not None:
+        key = 'hypercall_%#x' % intercept.bp_addr
+        if hypercall_channel.install(qemu, intercept, key, func_size):
+            bp = key
+
+    elif (intercept.static or options.get('static_stubs', False)) and \
+            not intercept.run_once and not intercept.watchpoint:
+        is_static, ret_value = bp_cls.get_static_return(intercept.bp_addr)
+        if not is_static:
+            if intercept.static:
+                log.warning("%s does not support static stubs, using "
+                            "breakpoint" % intercept.cls)
+        elif config is None or config.machine.arch != 'cortex-m3':
+            log.warning("Static stubs need a Thumb target, using "
+                        "breakpoint for %s" % intercept)
+        else:
+            key = 'static_%#x' % intercept.bp_addr
+            count = options.get('static_stub_counts', False)
+            installed, counter_addr = static_stubs.install(
+                qemu, intercept, ret_value, func_size, count)
+            if installed:
+                bp = key
+                if counter_addr is not None:
+                    static_stub_counters[key] = counter_addr
+
+    if bp is not None:
+        log.debug("Using %s for %s" % (bp, intercept))
+    elif intercept.watchpoint:
         if intercept.watchpoint == "r":
              bp = qemu.set_watchpoint(intercept.bp_addr, write=False, read=True)
         elif intercept_desc['watchpoint'] == "w":
@@ -143,18 +252,25 @@ def register_bp_handler(qemu, intercept):
             
         else:
             bp = qemu.set_watchpoint(intercept.bp_addr, write=True, read=True)
-
-    else:
-        bp = qemu.set_breakpoint(intercept.bp_addr, temporary=bp_temp)
+    return bp_cls, handler, bp
 
 
+def _add_bp_handler(intercept, bp_cls, handler, bp):
+    '''
+        Adds the handler to the lookup tables used when bp is hit
+    '''
     hal_stats.stats[bp] = {'function': intercept.function, 
                            'desc': str(intercept), 
                            'count': 0, 
-                           'method': handler.__name__}
+                           'method': handler.__name__,
+                           'reg_round_trips_saved': 0}
 
     bp2handler_lut[bp] = (bp_cls, handler)
-    log.info("BP is %i" % bp)
+    hal_latency.register(bp, intercept.function)
+    if intercept.mem_cache:
+        bp2mem_cache[bp] = intercept.mem_cache_line_size()
+        hal_stats.stats[bp]['mem_round_trips_saved'] = 0
+    log.info("BP is %s" % bp)
 
 
 def interceptor(avatar, message):
@@ -167,8 +283,16 @@ def interceptor(avatar, message):
         bp = int(message.watchpoint_number)
     else:
         bp = int(message.breakpoint_number)
+    hal_latency.hit(bp)
+    virtual_clock.on_intercept()
     target = message.origin
+    # Read all registers at once so handler reads don't each go to GDB
+    target.snapshot_registers()
     pc = target.regs.pc & 0xFFFFFFFE  # Clear Thumb bit
+    if intercept_trace is not None:
+        intercept_trace.write(json.dumps(
+            {'function': hal_stats.stats[bp]['function'], 'addr': pc,
+             'regs': target.registers_snapshot()}) + '\n')
 
 
     cls, method = bp2handler_lut[bp]
@@ -176,14 +300,72 @@ def interceptor(avatar, message):
     hal_stats.write_on_update(
         'used_intercepts', hal_stats.stats[bp]['function'])
 
+    line_size = bp2mem_cache.get(bp)
+    if line_size:
+        target.begin_mem_transaction(line_size)
     # print method
+    start = hal_latency.start_handler()
     try:
         intercept, ret_value = method(cls, target, pc)
         if intercept:
             hal_stats.write_on_update('bypassed_funcs', hal_stats.stats[bp]['function'])
     except:
         log.exception("Error executing handler %s" % (repr(method)))
+        target.release_registers()
+        if line_size:
+            target.end_mem_transaction(flush=False)
         raise
+    if line_size:
+        transaction = target.end_mem_transaction()
+        hal_stats.stats[bp]['mem_round_trips_saved'] += \
+            transaction.reads_saved + transaction.writes_saved
+    handler_done = hal_latency.now()
+    hal_latency.record_handler(bp, start, handler_done)
     if intercept:
         target.execute_return(ret_value)
+    hal_stats.stats[bp]['reg_round_trips_saved'] += target.release_registers()
+    # IRQs the handler raised are injected before the firmware continues
+    Interrupts.flush()
     target.cont()
+    hal_latency.record(bp, 'return', handler_done)
+    hal_latency.continued()
+
+
+def update_static_stub_counts(qemu):
+    '''
+        Copies the call counts of static stubs into the stats, target
+        must be stopped
+    '''
+    if not static_stub_counters:
+        return
+    for key, count in static_stubs.read_counts(
+            qemu, static_stub_counters).items():
+        hal_stats.stats[key]['count'] = count
+        if count:
+            hal_stats.write_on_update(
+                'used_intercepts', hal_stats.stats[key]['function'])
+            hal_stats.write_on_update(
+                'bypassed_funcs', hal_stats.stats[key]['function'])
+
+
+def hypercall_interceptor(key, target, bp_addr):
+    '''
+        Callback for the HypercallChannel, dispatches to correct handler.
+        Unlike interceptor QEMU is not stopped, so the returned values
+        are handed back to the trampoline instead of set on the target
+    '''
+    virtual_clock.on_intercept()
+    cls, method = bp2handler_lut[key]
+    hal_stats.stats[key]['count'] += 1
+    hal_stats.write_on_update(
+        'used_intercepts', hal_stats.stats[key]['function'])
+    start = hal_latency.start_handler()
+    try:
+        intercept, ret_value = method(cls, target, bp_addr)
+        if intercept:
+            hal_stats.write_on_update('bypassed_funcs', hal_stats.stats[key]['function'])
+    except:
+        log.exception("Error executing handler %s" % (repr(method)))
+        raise
+    hal_latency.record_handler(key, start)
+    return intercept, ret_value
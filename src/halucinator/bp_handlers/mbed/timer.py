@@ -3,7 +3,8 @@
 # certain rights in this software.
 
 from time import sleep
-from ..bp_handler import BPHandler, bp_handler
+from ..bp_handler import BPHandler, bp_handler, fast_forward_delay
+from ...peripheral_models.timer_model import TimerModel
 import struct
 import logging
 log = logging.getLogger(__name__)
@@ -11,8 +12,8 @@ log = logging.getLogger(__name__)
 
 class MbedTimer(BPHandler):
 
-    def __init__(self, impl=None):
-        pass
+    def __init__(self, impl=None, model=TimerModel):
+        self.model = model
 
     @bp_handler(['wait'])
     def wait(self, qemu, bp_addr):
@@ -20,7 +21,12 @@ class MbedTimer(BPHandler):
         param0 = qemu.regs.r0  # a floating point value
         value = struct.pack("<I", param0)
         stuff = struct.unpack("<f", value)[0]
-        sleep(stuff)
-        return False, 0  # , (param0,)
+        ret = fast_forward_delay(qemu, bp_addr, self.model, stuff,
+                                 lambda left: struct.unpack(
+                                     "<I", struct.pack("<f", left))[0])
+        if ret is None:
+            sleep(stuff)
+            ret = True, None  # Already waited, skip the firmware's wait
+        return ret
 
 # TODO: Timer-based callbacks
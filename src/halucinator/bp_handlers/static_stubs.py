@@ -0,0 +1,96 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+from struct import pack
+from ..util import cortex_m_helpers as CM
+import logging
+log = logging.getLogger(__name__)
+
+COUNTER_REG = 3  # Scratch register used to increment the call counter
+
+
+def return_code(ret_value):
+    '''
+        Code that sets r0 to ret_value (if not None) and returns
+    '''
+    code = b''
+    if ret_value is not None:
+        ret_value &= 0xFFFFFFFF
+        if ret_value <= 0xFF:
+            code += CM.thumb_movs_imm(0, ret_value)
+        else:
+            code += CM.thumb_mov32(0, ret_value)
+    return code + CM.thumb_bx_lr()
+
+
+def counting_stub(addr, ret_value):
+    '''
+        Code placed at addr that increments a counter, placed after the
+        code, then returns ret_value
+
+        :returns: (code, counter_addr)
+    '''
+    body = CM.thumb_ldr_imm(COUNTER_REG, CM.IP, 0)
+    body += CM.thumb_adds_imm(COUNTER_REG, 1)
+    body += CM.thumb_str_imm(COUNTER_REG, CM.IP, 0)
+    body += return_code(ret_value)
+    literal_addr = (addr + 4 + len(body) + 3) & ~3
+    counter_addr = literal_addr + 4
+    code = CM.thumb_ldr_literal(CM.IP, addr, literal_addr) + body
+    code += b'\x00' * (literal_addr - addr - len(code))
+    code += pack('<II', counter_addr, 0)
+    return code, counter_addr
+
+
+def install(qemu, intercept, ret_value, func_size=0, count=False):
+    '''
+        Replaces the start of the intercepted function with code that
+        returns ret_value, no break point is needed.
+
+        :param qemu:        QemuTarget
+        :param intercept:   HalInterceptConfig being installed
+        :param ret_value:   Value to return, None to leave r0 unchanged
+        :param func_size:   Size of the function if known, 0 otherwise
+        :param count:       Count calls using a counter in patch memory
+        :returns:  (installed, counter_addr) counter_addr is None if
+                   count is False
+    '''
+    bp_addr = intercept.bp_addr & 0xFFFFFFFE
+    counter_addr = None
+    if count:
+        # Size unknown so use temporary addresses to get the lengths
+        stub, _ = counting_stub(0, ret_value)
+        code = CM.thumb_long_jump(bp_addr, 0)
+    else:
+        code = return_code(ret_value)
+
+    if func_size and func_size < len(code):
+        log.warning("Function too small for static stub, using breakpoint "
+                    "for %s" % intercept)
+        return False, None
+
+    if count:
+        try:
+            stub_addr = qemu.alloc_patch_memory(len(stub))
+        except ValueError as e:
+            log.warning("%s, using breakpoint for %s" % (e, intercept))
+            return False, None
+        stub, counter_addr = counting_stub(stub_addr, ret_value)
+        qemu.write_memory(stub_addr, 1, stub, len(stub), raw=True)
+        code = CM.thumb_long_jump(bp_addr, stub_addr)
+
+    qemu.write_memory(bp_addr, 1, code, len(code), raw=True)
+    log.info("Static stub installed for %s" % intercept)
+    return True, counter_addr
+
+
+def read_counts(qemu, counters):
+    '''
+        Reads the call counters of installed stubs
+
+        :param counters:  Dictionary of key:counter_addr
+        :returns: Dictionary of key:count
+    '''
+    return {key: qemu.read_memory(addr, 4, 1)
+            for key, addr in counters.items()}
@@ -5,7 +5,7 @@
 
 from ...peripheral_models.gpio import GPIO
 from ..intercepts import tx_map, rx_map
-from ..bp_handler import BPHandler, bp_handler
+from ..bp_handler import BPHandler, bp_handler, hypercall_safe
 from collections import defaultdict, deque
 import struct
 import binascii
@@ -44,6 +44,7 @@ class STM32F4GPIO(BPHandler):
         return True, 0
 
     @bp_handler(['HAL_GPIO_WritePin'])
+    @hypercall_safe
     def write_pin(self, qemu, bp_addr):
         '''
             Reads the frame out of the emulated device, returns it and an 
@@ -62,6 +63,7 @@ class STM32F4GPIO(BPHandler):
         return intercept, ret_val
 
     @bp_handler(['HAL_GPIO_TogglePin'])
+    @hypercall_safe
     def toggle_pin(self, qemu, bp_addr):
         '''
             Toggles the pin
@@ -5,20 +5,54 @@
 
 from ...peripheral_models.sd_card import SDCardModel
 from ..bp_handler import BPHandler, bp_handler
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 import struct
 import binascii
 import os
+import logging
+log = logging.getLogger(__name__)
 
 
 class SD_Card(BPHandler):
+    '''
+        verify_blocks: Number of most recently written blocks to keep a
+            copy of, blocks read back are checked against their copy.
+            0 (default) disables the check
+    '''
 
     CSD_Struct = binascii.unhexlify(
         '0100000e0032b50509000000000001408a1d0000142c014020017f0000000209000000000100000000')
 
-    blocks = {}
     sd_block_size = 0x200
 
+    def __init__(self, verify_blocks=0):
+        self.verify_blocks = verify_blocks
+        self.blocks = OrderedDict()  # block: data written, oldest first
+
+    def keep_blocks(self, block_addr, data, block_size):
+        '''
+            Keeps a copy of the written blocks, for verify_blocks
+        '''
+        for i in range(0, len(data), block_size):
+            block = block_addr + i // block_size
+            self.blocks.pop(block, None)
+            self.blocks[block] = bytes(data[i:i + block_size])
+        while len(self.blocks) > self.verify_blocks:
+            self.blocks.popitem(last=False)
+
+    def check_blocks(self, block_addr, data, block_size):
+        '''
+            Compares read blocks with the copies kept when written
+        '''
+        for i in range(0, len(data), block_size):
+            block = block_addr + i // block_size
+            written = self.blocks.get(block)
+            if written is not None and written != data[i:i + block_size]:
+                log.warning("SD block %i differs from data written" % block)
+                log.debug("Written: %s" % binascii.hexlify(written))
+                log.debug("Read:    %s" %
+                          binascii.hexlify(data[i:i + block_size]))
+
     def get_hw_instance(self, qemu):
         '''
             Gets the instance ID from the hsd
@@ -47,20 +81,12 @@ class SD_Card(BPHandler):
 
         print("SD_CARD Read Block, BlockAddr %i, #Blocks: %i" %
               (block_addr, num_blocks))
-        for i in range(num_blocks):
-            block = block_addr + i
-            addr = pdata + (i*SDCardModel.get_block_size(hw_id))
-            data = SDCardModel.read_block(hw_id, block)
-            if block not in SD_Card.blocks:
-                print("Block not in blocks", block)
-            else:
-                if SD_Card.blocks[block] != data:
-                    print("Data Different:", block)
-                    print("Block", binascii.hexlify(SD_Card.blocks[block]))
-                    print("Data:", binascii.hexlify(data))
-            if len(data) != SDCardModel.get_block_size(hw_id):
-                print("Block lengths wrong", binascii.hexlify(data))
-            qemu.write_memory(addr, 1, data, len(data), raw=True)
+        if num_blocks:
+            block_size = SDCardModel.get_block_size(hw_id)
+            data = SDCardModel.read_blocks(hw_id, block_addr, num_blocks)
+            if self.verify_blocks:
+                self.check_blocks(block_addr, data, block_size)
+            qemu.write_memory(pdata, 1, data, len(data), raw=True)
         return True, 0
 
     # HAL_StatusTypeDef HAL_SD_WriteBlocks(SD_HandleTypeDef *hsd, uint8_t *pData, uint32_t BlockAdd, uint32_t NumberOfBlocks, uint32_t Timeout)
@@ -75,13 +101,13 @@ class SD_Card(BPHandler):
 
         print("SD_CARD Write Block, BlockAddr %i, #Blocks: %i" %
               (block_addr, num_blocks))
-        for i in range(num_blocks):
-            block = block_addr + i
-            addr = pdata + (i*SDCardModel.get_block_size(hw_id))
-            sd_data = qemu.read_memory(
-                addr, 1, SDCardModel.get_block_size(hw_id), raw=True)
-            SD_Card.blocks[block] = sd_data
-            SDCardModel.write_block(hw_id, block, sd_data)
+        if num_blocks:
+            block_size = SDCardModel.get_block_size(hw_id)
+            sd_data = qemu.read_memory(pdata, 1, num_blocks * block_size,
+                                       raw=True)
+            if self.verify_blocks:
+                self.keep_blocks(block_addr, sd_data, block_size)
+            SDCardModel.write_blocks(hw_id, block_addr, sd_data)
 
         return True, 0
 
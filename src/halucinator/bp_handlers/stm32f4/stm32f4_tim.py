@@ -6,7 +6,7 @@ from ...peripheral_models.interrupts import Interrupts
 from ...peripheral_models.timer_model import TimerModel
 from avatar2.peripherals.avatar_peripheral import AvatarPeripheral
 from ..intercepts import tx_map, rx_map
-from ..bp_handler import BPHandler, bp_handler
+from ..bp_handler import BPHandler, bp_handler, fast_forward_delay
 import time
 from collections import defaultdict
 
@@ -97,11 +97,13 @@ class STM32_TIM(BPHandler):
         return True, 0
 
     @bp_handler(['HAL_Delay'])
-    def sleep(self, qemu, bp_handler):
+    def sleep(self, qemu, bp_addr):
         amt = qemu.regs.r0 / 1000.0
         log.debug("sleeping for %f" % amt)
-        # time.sleep(amt)
-        return True, 0
+        # Time only passes with a virtual clock, else returns immediately
+        ret = fast_forward_delay(qemu, bp_addr, self.model, amt,
+                                 lambda left: int(round(left * 1000)))
+        return (True, 0) if ret is None else ret
 
     @bp_handler(['HAL_SYSTICK_Config'])
     def systick_config(self, qemu, bp_addr):
@@ -19,6 +19,8 @@ class IEEE802_15_4(object):
         '''
         self.ioservers = []
         self.host_socket = None
+        self.paused = set()  # (server, interface_id) whose rx queue is full
+        self.dropped = 0
         for server in ioservers:
             self.add_server(server)
 
@@ -26,10 +28,28 @@ class IEEE802_15_4(object):
         self.ioservers.append(ioserver)
         ioserver.register_topic('Peripheral.IEEE802_15_4.tx_frame',
                                 self.received_frame)
+        ioserver.register_topic('Peripheral.IEEE802_15_4.rx_flow',
+                                self.flow_control)
+
+    def flow_control(self, from_server, msg):
+        '''
+            Pauses or resumes forwarding to the interface that signalled,
+            other interfaces of from_server keep receiving
+        '''
+        interface = (from_server, msg.get('interface_id'))
+        log.info('Flow control %s: paused %s' % (interface, msg['paused']))
+        if msg['paused']:
+            self.paused.add(interface)
+        else:
+            self.paused.discard(interface)
 
     def received_frame(self, from_server, msg):
         for server in self.ioservers:
-            if server != from_server:
+            if server == from_server:
+                continue
+            if (server, msg.get('interface_id')) in self.paused:
+                self.dropped += 1
+            else:
                 log.info('Forwarding, msg')
                 server.send_msg('Peripheral.IEEE802_15_4.rx_frame', msg)
         if self.host_socket is not None:
@@ -50,6 +70,10 @@ def main():
                    help='Port numbers to send IO messages via zmq, length must match --rx_ports')
     p.add_argument('-l', '--logs', nargs='+', default=['Receiver.txt', 'Sender.txt'],
                    help='Log files to write IO frames to, length must match --rx_ports')
+    p.add_argument('-T', '--transport', default='tcp',
+                   choices=('tcp', 'ipc', 'shm'),
+                   help='Transport, must match halucinator\'s '
+                        'peripheral_transport option')
     args = p.parse_args()
 
     if len(args.rx_ports) != len(args.tx_ports):
@@ -64,7 +88,8 @@ def main():
 
     for idx, rx_port in enumerate(args.rx_ports):
         print(idx)
-        server = IOServer(rx_port, args.tx_ports[idx], args.logs[idx])
+        server = IOServer(rx_port, args.tx_ports[idx], args.logs[idx],
+                          transport=args.transport)
         hub.add_server(server)
         server.start()
 
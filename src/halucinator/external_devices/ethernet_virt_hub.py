@@ -48,7 +48,7 @@ class HostEthernetServer(Thread):
         log.debug("Shutting Down Host Ethernet RX")
 
     def send_msg(self, topic, msg):
-        frame = msg['frame']
+        frame = bytes(msg['frame'])
         p = scapy.Raw(frame)
         scapy.sendp(p, iface=self.interface)
 
@@ -66,6 +66,8 @@ class ViruatalEthHub(object):
         self.ioservers = []
         self.host_socket = None
         self.host_interface = None
+        self.paused = set()  # (server, interface_id) whose rx queue is full
+        self.dropped = 0
         for server in ioservers:
             self.add_server(server)
 
@@ -73,11 +75,29 @@ class ViruatalEthHub(object):
         self.ioservers.append(ioserver)
         ioserver.register_topic('Peripheral.EthernetModel.tx_frame',
                                 self.received_frame)
+        ioserver.register_topic('Peripheral.EthernetModel.rx_flow',
+                                self.flow_control)
+
+    def flow_control(self, from_server, msg):
+        '''
+            Pauses or resumes forwarding to the interface that signalled,
+            other interfaces of from_server keep receiving
+        '''
+        interface = (from_server, msg.get('interface_id'))
+        log.info('Flow control %s: paused %s' % (interface, msg['paused']))
+        if msg['paused']:
+            self.paused.add(interface)
+        else:
+            self.paused.discard(interface)
 
     def received_frame(self, from_server, msg):
         for server in self.ioservers:
             log.info('Forwarding, msg')
-            if server != from_server:
+            if server == from_server:
+                continue
+            if (server, msg.get('interface_id')) in self.paused:
+                self.dropped += 1
+            else:
                 server.send_msg('Peripheral.EthernetModel.rx_frame', msg)
 
     def shutdown(self):
@@ -98,6 +118,10 @@ def main():
     p.add_argument('-p', '--enable_host_rx', required=False, default=False,
                    action='store_true',
                    help='Enable Recieving data from host interface, requires -i')
+    p.add_argument('-T', '--transport', default='tcp',
+                   choices=('tcp', 'ipc', 'shm'),
+                   help='Transport, must match halucinator\'s '
+                        'peripheral_transport option')
     args = p.parse_args()
 
     if len(args.rx_ports) != len(args.tx_ports):
@@ -118,7 +142,8 @@ def main():
 
     for idx, rx_port in enumerate(args.rx_ports):
         print(idx)
-        server = IOServer(rx_port, args.tx_ports[idx])
+        server = IOServer(rx_port, args.tx_ports[idx],
+                          transport=args.transport)
         hub.add_server(server)
         if idx == 0:
             interrupter = SendInterrupt(server)
@@ -8,6 +8,7 @@ from multiprocessing import Process
 import os
 import time
 from ..peripheral_models.peripheral_server import encode_zmq_msg, decode_zmq_msg
+from ..peripheral_models.peripheral_server import recv_zmq_msg
 
 
 __run_server = True
@@ -25,12 +26,12 @@ def rx_from_emulator(emu_rx_port):
     mq_socket = context.socket(zmq.SUB)
     mq_socket.connect("tcp://localhost:%s" % emu_rx_port)
     #mq_socket.setsockopt(zmq.SUBSCRIBE, "GPIO.write_pin")
-    mq_socket.setsockopt(zmq.SUBSCRIBE, '')
+    mq_socket.setsockopt_string(zmq.SUBSCRIBE, '')
     #mq_socket.setsockopt(zmq.SUBSCRIBE, "GPIO.toggle_pin")
 
     print("Setup GPIO Listener")
     while (__run_server):
-        msg = mq_socket.recv_string()
+        msg = recv_zmq_msg(mq_socket)
         print("Got from emulator:", msg)
         topic, data = decode_zmq_msg(msg)
         print("Pin: ", data['id'], "Value", data['value'])
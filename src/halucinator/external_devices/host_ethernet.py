@@ -4,6 +4,7 @@
 
 from os import sys, path
 from ..peripheral_models.peripheral_server import encode_zmq_msg, decode_zmq_msg
+from ..peripheral_models.peripheral_server import recv_zmq_msg
 import zmq
 from multiprocessing import Process
 import os
@@ -29,10 +30,10 @@ def rx_from_emulator(emu_rx_port, interface):
     context = zmq.Context()
     mq_socket = context.socket(zmq.SUB)
     mq_socket.connect("tcp://localhost:%s" % emu_rx_port)
-    mq_socket.setsockopt(zmq.SUBSCRIBE, topic)
+    mq_socket.setsockopt_string(zmq.SUBSCRIBE, topic)
 
     while (__run_server):
-        msg = mq_socket.recv_string()
+        msg = recv_zmq_msg(mq_socket)
         # print "Got from emulator:", msg
         topic, data = decode_zmq_msg(msg)
         frame = data['frame']
@@ -8,6 +8,7 @@ from multiprocessing import Process
 import os
 import time
 from ..peripheral_models.peripheral_server import encode_zmq_msg, decode_zmq_msg
+from ..peripheral_models.peripheral_server import recv_zmq_msg
 from threading import Thread, Event
 import binascii
 import logging
@@ -34,12 +35,12 @@ class IOServer(Thread):
 
     def register_topic(self, topic, method):
         log.debug("Registering RX_Port: %s, Topic: %s" % (self.rx_port, topic))
-        self.rx_socket.setsockopt(zmq.SUBSCRIBE, topic)
+        self.rx_socket.setsockopt_string(zmq.SUBSCRIBE, topic)
         self.handlers[topic] = method
 
     def run(self):
         while not self.__stop.is_set():
-            msg = self.rx_socket.recv_string()
+            msg = recv_zmq_msg(self.rx_socket)
             log.debug("Received: %s" % str(msg))
             topic, data = decode_zmq_msg(msg)
             if self.packet_log:
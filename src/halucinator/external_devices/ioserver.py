@@ -8,6 +8,8 @@ from multiprocessing import Process
 import os
 import time
 from ..peripheral_models.peripheral_server import encode_zmq_msg, decode_zmq_msg
+from ..peripheral_models.peripheral_server import send_zmq_msg, recv_zmq_msg
+from ..peripheral_models.peripheral_server import open_socket, subscribe
 from threading import Thread, Event
 import binascii
 import logging
@@ -16,19 +18,25 @@ log = logging.getLogger(__name__)
 
 class IOServer(Thread):
 
-    def __init__(self, rx_port=5556, tx_port=5555, log_file=None):
+    def __init__(self, rx_port=5556, tx_port=5555, log_file=None,
+                 codec='binary', transport='tcp'):
+        '''
+            :param codec:  Encoding of sent messages, 'binary' or 'yaml'.
+                           Received messages may use either
+            :param transport:  tcp, ipc or shm, must match the
+                               peripheral_transport of halucinator
+        '''
         Thread.__init__(self)
-        self.rx_port = rx_port
-        self.tx_port = tx_port
+        self.rx_port = int(rx_port)
+        self.tx_port = int(tx_port)
+        self.codec = codec
         self.__stop = Event()
         self.context = zmq.Context()
-        self.rx_socket = self.context.socket(zmq.SUB)
-        self.rx_socket.connect("tcp://localhost:%s" % self.rx_port)
-        self.tx_socket = self.context.socket(zmq.PUB)
-        self.tx_socket.bind("tcp://*:%s" % self.tx_port)
+        self.rx_socket = open_socket(self.context, zmq.SUB, self.rx_port,
+                                     transport, subscribe_all=False)
+        self.tx_socket = open_socket(self.context, zmq.PUB, self.tx_port,
+                                     transport)
 
-        self.poller = zmq.Poller()
-        self.poller.register(self.rx_socket, zmq.POLLIN)
         self.handlers = {}
         self.packet_log = None
         if log_file is not None:
@@ -37,18 +45,19 @@ class IOServer(Thread):
 
     def register_topic(self, topic, method):
         log.debug("Registering RX_Port: %s, Topic: %s" % (self.rx_port, topic))
-        self.rx_socket.setsockopt(zmq.SUBSCRIBE, topic.encode("utf-8"))
+        subscribe(self.rx_socket, topic)
         self.handlers[topic] = method
 
     def run(self):
 
         while not self.__stop.is_set():
-            socks = dict(self.poller.poll(1000))
-            if self.rx_socket in socks and socks[self.rx_socket] == zmq.POLLIN:
-                msg = self.rx_socket.recv_string()
-                log.debug("Received: %s" % str(msg))
+            if self.rx_socket.poll(1000):
+                msg = recv_zmq_msg(self.rx_socket)
+                log.debug("Received: %s", msg)
                 topic, data = decode_zmq_msg(msg)
-                if self.packet_log:
+                if topic not in self.handlers:
+                    continue  # Only with shm, ZMQ filters by topic
+                if self.packet_log and 'frame' in data:
                     self.packet_log.write("Sent, %i, %s, %s\n" % (
                         time.time(), topic, binascii.hexlify(data['frame'])))
                     self.packet_log.flush()
@@ -63,8 +72,8 @@ class IOServer(Thread):
             self.packet_log.close()
 
     def send_msg(self, topic, data):
-        msg = encode_zmq_msg(topic, data)
-        self.tx_socket.send_string(msg)
+        msg = encode_zmq_msg(topic, data, self.codec, zero_copy=True)
+        send_zmq_msg(self.tx_socket, msg)
         if self.packet_log:
             # TODO, make logging more generic so will work for non-frames
             if 'frame' in data:
@@ -80,12 +89,16 @@ def main():
                    help='Port number to receive zmq messages for IO on')
     p.add_argument('-t', '--tx_port', default=5555,
                    help='Port number to send IO messages via zmq')
+    p.add_argument('-T', '--transport', default='tcp',
+                   choices=('tcp', 'ipc', 'shm'),
+                   help='Transport, must match halucinator\'s '
+                        'peripheral_transport option')
     args = p.parse_args()
 
     import halucinator.hal_log as hal_log
     hal_log.setLogConfig()
     
-    io_server = IOServer(args.rx_port, args.tx_port)
+    io_server = IOServer(args.rx_port, args.tx_port, transport=args.transport)
     io_server.start()
 
     try:
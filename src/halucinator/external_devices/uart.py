@@ -19,7 +19,7 @@ class UARTPrintServer(object):
             'Peripheral.UARTPublisher.write', self.write_handler)
 
     def write_handler(self, ioserver, msg):
-        txt = msg['chars'].decode('latin-1')
+        txt = bytes(msg['chars']).decode('latin-1')
         if self.prev_print == '-> ' and txt == '-> ':
             return
         else:
@@ -43,12 +43,17 @@ def main():
                    help="Id to use when sending data")
     p.add_argument('-n', '--newline', default=False, action='store_true',
                    help="Append Newline")
+    p.add_argument('-T', '--transport', default='tcp',
+                   choices=('tcp', 'ipc', 'shm'),
+                   help='Transport, must match halucinator\'s '
+                        'peripheral_transport option')
     args = p.parse_args()
 
     import halucinator.hal_log as hal_log
     hal_log.setLogConfig()
 
-    io_server = IOServer(args.rx_port, args.tx_port)
+    io_server = IOServer(args.rx_port, args.tx_port,
+                         transport=args.transport)
     uart = UARTPrintServer(io_server)
 
     io_server.start()
@@ -62,11 +62,37 @@ class HalMemConfig(object):
           (self.config_file, self.name, self.base_addr, self.size, self.emulate)
 
 
+# Intercepts share handler classes, so resolving and inspecting them is
+# done once per class and method
+_class_cache = {}  # (module_str, class_str): class or None
+_args_cache = {}  # function: frozenset of argument names
+
+
+def _get_class(module_str, class_str):
+    '''
+        Returns the class, None if module doesn't have it.  Raises ImportError
+        if module can't be imported
+    '''
+    key = (module_str, class_str)
+    if key not in _class_cache:
+        module = importlib.import_module(module_str)
+        _class_cache[key] = getattr(module, class_str, None)
+    return _class_cache[key]
+
+
+def _get_args(func):
+    if func not in _args_cache:
+        argspec = inspect.getfullargspec(func)
+        _args_cache[func] = frozenset(argspec.args + argspec.kwonlyargs)
+    return _args_cache[func]
+
+
 class HalInterceptConfig(object):
 
     def __init__(self, config_file, cls, function, addr=None, symbol=None,
                  class_args=None, registration_args=None,
-                 run_once=False, watchpoint=False):
+                 run_once=False, watchpoint=False, mem_cache=False,
+                 hypercall=False, static=False):
         self.config_file = config_file
         self.symbol = symbol
         
@@ -82,6 +108,17 @@ class HalInterceptConfig(object):
             del self.registration_args['self']
         self.run_once = run_once
         self.watchpoint = watchpoint  # Valid 'r', 'w' ,'rw'
+        self.mem_cache = mem_cache  # Valid False, True, or line size in bytes
+        self.hypercall = hypercall
+        self.static = static
+
+    def mem_cache_line_size(self):
+        '''
+            Gets the line size to use for the handler's memory transaction
+        '''
+        if self.mem_cache is True:
+            return 64
+        return self.mem_cache
 
 
     def _check_handler_is_valid(self):
@@ -91,31 +128,41 @@ class HalInterceptConfig(object):
         module_str = ".".join(split_str[:-1])
         class_str = split_str[-1]
         try:
-            module = importlib.import_module(module_str)
+            cls_obj = _get_class(module_str, class_str)
         except ImportError as e:
             hal_log.error("No module %s on Intercept %s"%(module_str, self))
             return False
 
-        cls_obj = getattr(module, class_str, None)
         if cls_obj is None:
             hal_log.error("Intercept No Class for %s" % self)
             return False
 
         # See if could init class
-        argspec = inspect.getargspec(cls_obj.__init__)
-        if not set(self.class_args).issubset(set(argspec.args)):
+        args = _get_args(cls_obj.__init__)
+        if not set(self.class_args).issubset(args):
             hal_log.error("class_arg are invalid for %s" % self)
-            hal_log.error("    Valid options %s" % argspec.args)
+            hal_log.error("    Valid options %s" % list(args))
             hal_log.error("    Input options %s" % self.class_args)
             valid = False
 
-        argspec = inspect.getargspec(cls_obj.register_handler)
-        if not set(self.registration_args).issubset(set(argspec.args)):
+        args = _get_args(cls_obj.register_handler)
+        if not set(self.registration_args).issubset(args):
             hal_log.error("class_arg are invalid for %s" % self)
-            hal_log.error("    Valid options %s" % argspec.args)
+            hal_log.error("    Valid options %s" % list(args))
             hal_log.error("    Input options %s" % self.registration_args)
-            valid = False        
-        return valid        
+            valid = False
+
+        # Classes using BPHandler's handler table can be checked now,
+        # others are checked when their handler is registered
+        if self.hypercall and cls_obj.register_handler.__qualname__ == \
+                'BPHandler.register_handler':
+            method = cls_obj.bp_handlers.get(self.function)
+            if method is not None and \
+                    not getattr(method, 'hypercall_safe', False):
+                hal_log.error("Intercept: handler is not @hypercall_safe, "
+                              "hypercall can not be used on: %s" % self)
+                valid = False
+        return valid
 
     def is_valid(self):
         valid = True
@@ -124,6 +171,20 @@ class HalInterceptConfig(object):
             hal_log.error('Intercept: Watchpoints must be false, true, r, w, or rw on: %s' % self)
             valid = False
         
+        if self.mem_cache not in (False, True) and \
+           (type(self.mem_cache) != int or self.mem_cache < 4 or
+                self.mem_cache & (self.mem_cache - 1)):
+            hal_log.error('Intercept: mem_cache must be true, false, or a power of 2 line size on: %s' % self)
+            valid = False
+
+        if self.hypercall and (self.watchpoint or self.run_once):
+            hal_log.error('Intercept: hypercall can not be used with watchpoint or run_once on: %s' % self)
+            valid = False
+
+        if self.static and (self.watchpoint or self.run_once or self.hypercall):
+            hal_log.error('Intercept: static can not be used with watchpoint, run_once, or hypercall on: %s' % self)
+            valid = False
+
         valid &= self._check_handler_is_valid()
 
         if self.bp_addr is not None and type(self.bp_addr) != int:
@@ -184,6 +245,8 @@ class HalucinatorConfig(object):
         self.watchpoints = []
         self.symbols = []
         self.callables = []
+        self._symbol_index = ({}, {})
+        self._symbol_index_len = 0
 
     def add_yaml(self, yaml_filename):
         with open(yaml_filename, 'rb') as infile:
@@ -260,6 +323,21 @@ class HalucinatorConfig(object):
             sym = HalSymbolConfig(yaml_file, name=sym_name, addr=addr)
             self.symbols.append(sym)
 
+    def _get_symbol_index(self):
+        '''
+            Returns dictionaries of name:addr and addr:size for the symbols,
+            rebuilt when symbols are added. First symbol wins on duplicates
+        '''
+        if self._symbol_index_len != len(self.symbols):
+            addrs = {}
+            sizes = {}
+            for sym in self.symbols:
+                addrs.setdefault(sym.name, sym.addr)
+                sizes.setdefault(sym.addr & 0xFFFFFFFE, sym.size)
+            self._symbol_index = (addrs, sizes)
+            self._symbol_index_len = len(self.symbols)
+        return self._symbol_index
+
     def get_addr_for_symbol(self, sym_name):
         '''
             Gets that address for specified symbol
@@ -268,10 +346,7 @@ class HalucinatorConfig(object):
             :ret_val None or Address: 
         '''
 
-        for sym in self.symbols:
-            if sym_name == sym.name:
-                return sym.addr
-        return None
+        return self._get_symbol_index()[0].get(sym_name)
 
     def resolve_intercept_bp_addrs(self):
         '''
@@ -289,6 +364,15 @@ class HalucinatorConfig(object):
                 else:
                     log.warning("Unresolved symbol: %s, %s" % (inter.symbol, inter))
 
+    def get_symbol_size(self, addr):
+        '''
+            Gets the size of the symbol starting at addr
+
+            :param addr:  Address of the symbol, thumb bit is ignored
+            :ret_val size: 0 if unknown
+        '''
+        return self._get_symbol_index()[1].get(addr & 0xFFFFFFFE, 0)
+
     def get_symbol_name(self, addr):
         '''
             Gets symbol name that contains address
@@ -318,6 +402,12 @@ class HalucinatorConfig(object):
         '''
         self.resolve_intercept_bp_addrs()
 
+        # Functions listed in options use hypercalls instead of break points
+        hypercall_funcs = self.options.get('hypercall_functions', [])
+        for inter in self.intercepts:
+            if inter.function in hypercall_funcs:
+                inter.hypercall = True
+
         valid = True
         # Validate Memories
         for mem in self.memories.values():
@@ -0,0 +1,131 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Latency of intercepts, kept as one histogram per breakpoint and phase.
+    All times are recorded in microseconds.
+
+    Phases:
+        handler: Running the bp_handler, less any time spent waiting
+        wait:    Blocked in a peripheral model waiting for input (e.g., a
+                 UART read with block=True)
+        return:  execute_return and cont, (i.e., GDB transport)
+        gap:     From the previous intercept's cont until this hit, guest
+                 execution plus break point notification
+'''
+import time
+import yaml
+from .util.histogram import LatencyHistogram
+
+PHASES = ('handler', 'wait', 'return', 'gap')
+
+histograms = {}  # bp: {phase: LatencyHistogram}
+functions = {}  # bp: function name
+_latency_file = None
+_last_cont = None
+_waited = 0.0  # Seconds waiting for input during the current handler
+
+
+def set_filename(filename):
+    global _latency_file
+    _latency_file = filename
+
+
+def now():
+    return time.perf_counter()
+
+
+def register(bp, function):
+    functions[bp] = function
+    histograms[bp] = {phase: LatencyHistogram() for phase in PHASES}
+
+
+def record(bp, phase, start, end=None):
+    '''
+        Records end - start seconds for the phase of bp
+    '''
+    if end is None:
+        end = now()
+    histograms[bp][phase].record((end - start) * 1000000)
+
+
+def add_wait(seconds):
+    '''
+        Adds seconds spent blocked waiting for input, call from models
+        that block the handler
+    '''
+    global _waited
+    _waited += seconds
+
+
+def take_wait():
+    '''
+        Returns the seconds waited since the last call, and resets it
+    '''
+    global _waited
+    waited = _waited
+    _waited = 0.0
+    return waited
+
+
+def start_handler():
+    '''
+        Returns the start time for record_handler, discards waits made
+        outside of a handler
+    '''
+    take_wait()
+    return now()
+
+
+def record_handler(bp, start, end=None):
+    '''
+        Records the handler phase of bp, splitting out the time the
+        handler spent waiting for input into the wait phase
+    '''
+    if end is None:
+        end = now()
+    waited = take_wait()
+    if waited:
+        histograms[bp]['wait'].record(waited * 1000000)
+    record(bp, 'handler', start + waited, end)
+
+
+def hit(bp):
+    '''
+        Records the gap since the last intercept continued, call on break
+        point hit
+    '''
+    if _last_cont is not None:
+        record(bp, 'gap', _last_cont)
+
+
+def continued():
+    global _last_cont
+    _last_cont = now()
+
+
+def summary():
+    '''
+        Percentiles of each phase for each intercepted function
+    '''
+    by_function = {}
+    for bp, phases in histograms.items():
+        func = functions[bp]
+        if func not in by_function:
+            by_function[func] = {phase: LatencyHistogram() for phase in PHASES}
+        for phase, hist in phases.items():
+            by_function[func][phase].merge(hist)
+
+    return {func: {phase: hist.summary() for phase, hist in phases.items()}
+            for func, phases in by_function.items()}
+
+
+def write():
+    '''
+        Writes the latency percentiles to the latency file
+    '''
+    if _latency_file is None:
+        return
+    with open(_latency_file, 'w') as outfile:
+        yaml.safe_dump(summary(), outfile)
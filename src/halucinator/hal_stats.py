@@ -2,25 +2,146 @@
 # Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains 
 # certain rights in this software.
 
+import atexit
+import json
+import os
+import threading
+import time
 import yaml
 
 stats = {}
 _stats_file = None
+_journal_file = None
+_journal = None
+_start_time = None
+_last_compaction = 0
+_compaction_timer = None  # Compacts entries journaled since the last write
+_lock = threading.RLock()  # Guards stats sets against the compaction timer
+_export_hooks = []  # Called before writing to fill in stats kept elsewhere
+
+# Seconds between rewrites of the stats file, new set entries in between
+# are only appended to the journal. Entries are compacted at most this
+# long after they are journaled, even if no more entries follow
+COMPACTION_INTERVAL = 10
 
 
 def set_filename(filename):
-    global _stats_file
+    '''
+        Sets the stats file, new entries to sets in stats are journaled
+        to the same name with extension .journal
+    '''
+    global _stats_file, _journal_file, _start_time
     _stats_file = filename
+    _journal_file = os.path.splitext(filename)[0] + '.journal'
+    _start_time = time.time()
+
+
+def _append_journal(set_key, value):
+    '''
+        Appends a line of json, {"time", "key", "value"}, to the journal.
+        Time is seconds since set_filename was called
+    '''
+    global _journal
+    if _journal is None:
+        _journal = open(_journal_file, 'w', buffering=1)
+    _journal.write(json.dumps({'time': round(time.time() - _start_time, 6),
+                               'key': set_key, 'value': value}) + '\n')
 
 
 def write_on_update(set_key, value):
     '''
-        Writes the stats information when if value is added to the set in 
-        the stats dictionary
+        Records value if it is new to the set in the stats dictionary.
+        New values are appended to the journal, the stats file is
+        rewritten at most every COMPACTION_INTERVAL seconds
     '''
-    global stats
-    if value not in stats[set_key]:
+    global stats, _compaction_timer
+    if value in stats[set_key]:
+        return
+    with _lock:
+        if value in stats[set_key]:
+            return
         stats[set_key].add(value)
         stats[set_key+'_length'] = len(stats[set_key])
+        if _stats_file is None:
+            return
+        _append_journal(set_key, value)
+        wait = _last_compaction + COMPACTION_INTERVAL - time.time()
+        if wait <= 0:
+            write()
+        elif _compaction_timer is None:
+            _compaction_timer = threading.Timer(wait, _compact)
+            _compaction_timer.daemon = True
+            _compaction_timer.start()
+
+
+def _compact():
+    global _compaction_timer
+    with _lock:
+        _compaction_timer = None
+        write()
+
+
+def add_export_hook(hook):
+    '''
+        Registers hook to be called, with no args, before stats are
+        written. Lets modules keep stats in compact forms and only
+        convert them to the stats dictionary when they are written
+    '''
+    _export_hooks.append(hook)
+
+
+def write():
+    '''
+        Writes the stats information to the stats file
+    '''
+    global _last_compaction, _compaction_timer
+    if _stats_file is None:
+        return
+    with _lock:
+        if _compaction_timer is not None:
+            _compaction_timer.cancel()
+            _compaction_timer = None
+        for hook in _export_hooks:
+            hook()
         with open(_stats_file, 'w') as outfile:
             yaml.safe_dump(stats, outfile)
+        _last_compaction = time.time()
+
+
+def read_journal(journal_file, until=None):
+    '''
+        Rebuilds the sets in stats from a journal
+
+        :param journal_file:  Path to the journal
+        :param until:  Only use entries up to this many seconds after
+                       start, None uses all entries
+        :returns: Dictionary of set_key: set and set_key_length: length
+    '''
+    sets = {}
+    with open(journal_file, 'r') as infile:
+        for line in infile:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # Partially written last line
+            if until is not None and entry['time'] > until:
+                break
+            value = entry['value']
+            if type(value) == list:
+                value = tuple(value)
+            sets.setdefault(entry['key'], set()).add(value)
+    rebuilt = {}
+    for key, values in sets.items():
+        rebuilt[key] = values
+        rebuilt[key + '_length'] = len(values)
+    return rebuilt
+
+
+def _write_at_exit():
+    if _journal is not None:
+        _journal.close()
+    if _stats_file is not None and os.path.isdir(os.path.dirname(_stats_file)):
+        write()
+
+
+atexit.register(_write_at_exit)
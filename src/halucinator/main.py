@@ -17,10 +17,16 @@ import sys
 from .util import hexyaml
 #from . import bp_handlers
 from .bp_handlers import intercepts as intercepts
+from .bp_handlers.hypercall import HypercallChannel
 from .peripheral_models import peripheral_server as periph_server
+from .peripheral_models import async_peripheral_server as async_server
+from .peripheral_models import frame_queue
+from .peripheral_models import virtual_clock
+from .peripheral_models.interrupts import Interrupts
 from .util.profile_hals import State_Recorder
 from .util import cortex_m_helpers as CM_helpers
 from . import hal_stats
+from . import hal_latency
 from . import hal_log, hal_config
 import signal
 log = logging.getLogger(__name__)
@@ -30,6 +36,7 @@ hal_log.setLogConfig()
 
 PATCH_MEMORY_SIZE = 4096
 INTERCEPT_RETURN_INSTR_ADDR = 0x20000000 - PATCH_MEMORY_SIZE
+HYPERCALL_BASE = INTERCEPT_RETURN_INSTR_ADDR - 0x1000
 ARCH_LUT={'cortex-m3': ARM_CORTEX_M3, 'arm': ARM}
 QEMU_ARCH_LUT={'cortex-m3': ARMv7mQemuTarget, 'arm': ARMQemuTarget}
 
@@ -52,14 +59,25 @@ def write_patch_memory(qemu):
     BXLR = 0x4770
     BXR0 = 0x4700
     BLXR0 = 0x4780
-    MOVS_R0_0 = 0x0020
-    POP_PC = 0x00BD
+    MOVS_R0_0 = 0x2000
+    POP_PC = 0xBD00
 
     qemu.write_memory(INTERCEPT_RETURN_INSTR_ADDR, 2, BXLR, 1)
 
     # Sets R0 to 0, then return to address on stack
-    qemu.write_memory(CALL_RETURN_ZERO_ADDR, 2, MOVS_R0_0, 1)
-    qemu.write_memory(CALL_RETURN_ZERO_ADDR+2, 2, POP_PC, 1)
+    qemu.write_memory(CALL_RETURN_ZERO_ADDR & 0xFFFFFFFE, 2, MOVS_R0_0, 1)
+    qemu.write_memory((CALL_RETURN_ZERO_ADDR & 0xFFFFFFFE) + 2, 2, POP_PC, 1)
+
+    # Rest of patch memory is handed out by alloc_patch_memory
+    next_free = [INTERCEPT_RETURN_INSTR_ADDR + 8]
+
+    def alloc_patch_memory(size):
+        addr = next_free[0]
+        if addr + size > INTERCEPT_RETURN_INSTR_ADDR + PATCH_MEMORY_SIZE:
+            raise ValueError("Insufficient patch memory for %i bytes" % size)
+        next_free[0] = (addr + size + 3) & 0xFFFFFFFC  # Keep 4 byte aligned
+        return addr
+    qemu.alloc_patch_memory = alloc_patch_memory
 
     def exec_return(value=None):
         if value is not None:
@@ -121,10 +139,41 @@ def find_qemu():
     exit(1)
 
 
+class StartupTimer(object):
+    '''
+        Records how long each phase of startup takes, reported in the log
+        and in stats.yaml under startup_time
+    '''
+    def __init__(self):
+        self.phases = []
+        self.last = time.time()
+
+    def phase_done(self, name):
+        now = time.time()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def add_phase(self, name, seconds):
+        '''
+            Adds a phase timed elsewhere, it must have ended just now
+        '''
+        self.phases.append((name, seconds))
+        self.last = time.time()
+
+    def report(self):
+        total = sum(secs for _, secs in self.phases)
+        log.info("Startup time %.3fs:" % total)
+        for name, secs in self.phases:
+            log.info("    %-20s %8.3fs" % (name, secs))
+        hal_stats.stats['startup_time'] = dict(self.phases)
+        hal_stats.stats['startup_time']['total'] = total
+
+
 def get_qemu_target(name, config, firmware=None, log_basic_blocks=False, gdb_port=1234):
     qemu_path = find_qemu()
     outdir = os.path.join('tmp', name)
     hal_stats.set_filename(outdir+"/stats.yaml")
+    hal_latency.set_filename(outdir+"/intercept_latency.yaml")
     
     # Get info from config
     arch = ARCH_LUT[config.machine.arch]
@@ -191,6 +240,7 @@ def setup_memory(avatar, memory, record_memories=None):
 def emulate_binary(config, target_name=None, log_basic_blocks=None,
                    rx_port=5555, tx_port=5556, gdb_port=1234, elf_file=None, db_name=None):
 
+    startup = StartupTimer()
     # Bug in QEMU about init stack pointer/entry point this works around
     if config.machine.arch == 'cortex-m3':
         mem = config.memories['init_mem'] if 'init_mem' in config.memories else config.memories['flash']
@@ -203,6 +253,7 @@ def emulate_binary(config, target_name=None, log_basic_blocks=None,
     avatar, qemu = get_qemu_target(target_name, config,
                                    log_basic_blocks=log_basic_blocks,
                                    gdb_port=gdb_port)
+    startup.phase_done('target_setup')
 
     if 'remove_bitband' in config.options and config.options['remove_bitband']:
         log.info("Removing Bitband")
@@ -236,6 +287,22 @@ def emulate_binary(config, target_name=None, log_basic_blocks=None,
                 avatar.add_memory_range(addr, size, name=name, permissions=per,
                                         forwarded=True, forwarded_to=bp_cls)
                 added_classes.append(bp_cls)
+
+    # Hypercall intercepts need an MMIO page and patch memory for trampolines
+    use_patch_memory = config.options.get('static_stub_counts', False)
+    if any(intercept.hypercall for intercept in config.intercepts):
+        base = config.options.get('hypercall_base', HYPERCALL_BASE)
+        channel = HypercallChannel(base, intercepts.hypercall_interceptor)
+        log.info("Adding Hypercall Memory Region (Addr: %s, Size:%s)"
+                 % (hex(base), hex(channel.size)))
+        avatar.add_memory_range(base, channel.size, name=channel.name,
+                                permissions='rw-', forwarded=True,
+                                forwarded_to=channel)
+        intercepts.hypercall_channel = channel
+        use_patch_memory = True
+    if use_patch_memory:
+        add_patch_memory(avatar, qemu)
+
    # Setup Intecepts
     avatar.watchmen.add_watchman('BreakpointHit', 'before',
                                  intercepts.interceptor, is_async=True)
@@ -251,13 +318,19 @@ def emulate_binary(config, target_name=None, log_basic_blocks=None,
 
     qemu.gdb_port = gdb_port
     avatar.config = config
+    startup.phase_done('memory_setup')
     log.info("Initializing Avatar Targets")
     avatar.init_targets()
+    startup.phase_done('init_targets')
 
-    for intercept in config.intercepts:
-        if intercept.bp_addr is not None:
-            log.info("Registering Intercept: %s" % intercept)
-            intercepts.register_bp_handler(qemu, intercept)
+    if use_patch_memory:
+        write_patch_memory(qemu)
+        startup.phase_done('patch_memory')
+
+    virtual_clock.configure(**config.options.get('clock', {}))
+    reg_times = intercepts.register_bp_handlers(qemu, config.intercepts)
+    startup.add_phase('intercept_handlers', reg_times['handlers'])
+    startup.add_phase('breakpoints', reg_times['breakpoints'])
 
 
     # Work around Avatar-QEMU's improper init of Cortex-M3
@@ -268,29 +341,64 @@ def emulate_binary(config, target_name=None, log_basic_blocks=None,
     
 
     # Emulate the Binary
-    periph_server.start(rx_port, tx_port, qemu)
+    codec = config.options.get('peripheral_codec', 'auto')
+    transport = config.options.get('peripheral_transport', 'tcp')
+    if config.options.get('peripheral_server', 'thread') == 'asyncio':
+        rx_ports = [rx_port] + config.options.get('peripheral_rx_ports', [])
+        async_server.start(rx_ports, tx_port, qemu, codec=codec,
+                           transport=transport)
+        server_stop, server_run = async_server.stop, async_server.run
+    else:
+        periph_server.start(rx_port, tx_port, qemu, codec=codec,
+                            transport=transport)
+        server_stop, server_run = periph_server.stop, periph_server.run_server
+    for topic, settings in config.options.get('tx_coalesce', {}).items():
+        periph_server.coalesce(topic, **(settings or {}))
+    frame_queue.configure_models(config.options.get('frame_queues', {}))
+    Interrupts.configure(config.options.get('interrupt_coalescing', True))
+    peripheral_emulators.idle_loops.configure(
+        **config.options.get('idle_loops', {}))
+    if config.options.get('record_intercepts', False):
+        intercepts.set_trace_file(
+            os.path.join(avatar.output_directory, 'intercept_trace.jsonl'))
+    startup.phase_done('cpu_and_server_init')
+    startup.report()
     # import os; os.system('stty sane') # Make so display works
     # import IPython; IPython.embed()
 
+    def write_stats():
+        # Static stubs count calls in guest memory, read before shutdown
+        if intercepts.static_stub_counters:
+            try:
+                if qemu.state == TargetStates.RUNNING:
+                    qemu.stop()
+                intercepts.update_static_stub_counts(qemu)
+            except Exception:
+                log.exception("Failed to read static stub counters")
+        hal_stats.write()
+        hal_latency.write()
+
     def signal_handler(signal, frame):
         print('You pressed Ctrl+C!')
+        write_stats()
         avatar.stop()
         avatar.shutdown()
-        periph_server.stop()
+        server_stop()
         sys.exit(0)
     signal.signal(signal.SIGINT, signal_handler)
     log.info("Letting QEMU Run")
     qemu.cont()
 
     try:
-        periph_server.run_server()
+        server_run()
         # while 1:
 
         #    time.sleep(0.5)
     except KeyboardInterrupt:
         # import os; os.system('stty sane') # Make so display works
         # import IPython; IPython.embed()
-        periph_server.stop()
+        server_stop()
+        write_stats()
         avatar.stop()
         avatar.shutdown()
         quit(-1)
@@ -0,0 +1,127 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    asyncio implementation of the peripheral server's receive loop.
+
+    Each external device can have its own RX socket, all read by one
+    event loop.  Handlers registered with peripheral_server.reg_rx_handler
+    may be plain functions, which run inline, or coroutine functions,
+    which run as tasks so a slow handler doesn't hold up other messages.
+    Transmission still uses peripheral_server.tx_msg.
+'''
+import asyncio
+import logging
+import zmq
+import zmq.asyncio
+
+from . import peripheral_server
+
+log = logging.getLogger(__name__)
+
+_context = None
+_rx_sockets = []
+_loop = None
+_stop_event = None
+_stopping = False
+_tasks = set()  # Running coroutine handlers
+
+
+def add_rx_port(rx_port, transport='tcp'):
+    '''
+        Adds a socket receiving from an external device's publisher on
+        rx_port, may be called while the server is running.  Transport
+        is tcp or ipc, see peripheral_server.open_socket
+    '''
+    global _context
+    if transport == 'shm':
+        raise ValueError("asyncio server doesn't support shm transport")
+    if _context is None:
+        _context = zmq.asyncio.Context()
+    socket = peripheral_server.open_socket(_context, zmq.SUB, rx_port,
+                                           transport)
+    _rx_sockets.append(socket)
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_start_reader, socket)
+    return socket
+
+
+def start(rx_ports=(5555,), tx_port=5556, qemu=None, codec='auto',
+          transport='tcp'):
+    log.info('Starting asyncio Peripheral Server, In ports %s, outport %i' %
+             (list(rx_ports), tx_port))
+    for rx_port in rx_ports:
+        add_rx_port(rx_port, transport)
+    peripheral_server.start_tx(tx_port, qemu, codec, transport)
+
+
+def _handler_done(task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("Error in rx handler", exc_info=task.exception())
+
+
+def _start_reader(socket):
+    task = asyncio.ensure_future(_read_socket(socket))
+    _tasks.add(task)
+    task.add_done_callback(_handler_done)
+
+
+async def _read_socket(socket):
+    while True:
+        frames = await socket.recv_multipart(copy=False)
+        frames[0] = frames[0].bytes
+        topic, msg = peripheral_server.decode_zmq_msg(frames)
+        log.info("Got message: Topic %s  Msg: %s", topic, msg)
+        peripheral_server.note_peer_codec(topic, frames)
+        try:
+            result = peripheral_server.dispatch(topic, msg)
+        except Exception:
+            log.exception("Error handling %s" % topic)
+            continue
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            _tasks.add(task)
+            task.add_done_callback(_handler_done)
+
+
+async def run_server():
+    '''
+        Reads all RX sockets until stop is called
+    '''
+    global _loop, _stop_event, _stopping
+    _loop = asyncio.get_running_loop()
+    _stop_event = asyncio.Event()
+    if _stopping:
+        _stop_event.set()
+    for socket in _rx_sockets:
+        _start_reader(socket)
+    await _stop_event.wait()
+
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _loop = None
+    _stopping = False
+    log.info("Peripheral Server Shutdown Normally")
+
+
+def run():
+    '''
+        Runs the server on a new event loop, returns after stop is called
+    '''
+    asyncio.run(run_server())
+
+
+def stop():
+    '''
+        Stops the server, may be called from any thread
+    '''
+    global _stopping
+    _stopping = True
+    peripheral_server.run_stop_hooks()
+    loop = _loop
+    if loop is not None:
+        loop.call_soon_threadsafe(_stop_event.set)
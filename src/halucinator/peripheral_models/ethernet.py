@@ -5,12 +5,11 @@
 
 from . import peripheral_server
 # from peripheral_server import PeripheralServer, peripheral_model
-from collections import deque, defaultdict
 from .interrupts import Interrupts
+from . import frame_queue
 import binascii
 import struct
 import logging
-import time
 log = logging.getLogger(__name__)
 # log.setLevel(logging.DEBUG)
 
@@ -19,16 +18,22 @@ log = logging.getLogger(__name__)
 @peripheral_server.peripheral_model
 class EthernetModel(object):
 
-    frame_queues = defaultdict(deque)
     calc_crc = True
     rx_frame_isr = None
     rx_isr_enabled = False
-    frame_times = defaultdict(deque)  # Used to record reception time
+
+    @classmethod
+    def get_queue(cls, interface_id):
+        '''
+            Returns the frame_queue.FrameQueue of interface_id, entries
+            are (frame, reception time)
+        '''
+        return frame_queue.get_queue(cls.__name__, interface_id, cls.rx_flow)
 
     @classmethod
     def enable_rx_isr(cls, interface_id):
         cls.rx_isr_enabled = True
-        if cls.frame_queues[interface_id] and cls.rx_frame_isr is not None:
+        if cls.get_queue(interface_id) and cls.rx_frame_isr is not None:
             Interrupts.trigger_interrupt(cls.rx_frame_isr, 'Ethernet_RX_Frame')
 
     @classmethod
@@ -47,6 +52,15 @@ class EthernetModel(object):
         msg = {'interface_id': interface_id, 'frame': frame}
         return msg
 
+    @classmethod
+    @peripheral_server.tx_msg
+    def rx_flow(cls, interface_id, paused):
+        '''
+            Tells senders to stop (paused) or resume sending frames to
+            interface_id, published when its queue uses backpressure
+        '''
+        return {'interface_id': interface_id, 'paused': paused}
+
     @classmethod
     @peripheral_server.reg_rx_handler
     def rx_frame(cls, msg):
@@ -57,9 +71,8 @@ class EthernetModel(object):
         interface_id = msg['interface_id']
         log.info("Adding Frame to: %s" % interface_id)
         frame = msg['frame']
-        cls.frame_queues[interface_id].append(frame)
-        cls.frame_times[interface_id].append(time.time())
-        log.info("Adding Frame to: %s" % interface_id)
+        if not cls.get_queue(interface_id).append(frame):
+            return
         if cls.rx_frame_isr is not None and cls.rx_isr_enabled:
             Interrupts.trigger_interrupt(cls.rx_frame_isr, 'Ethernet_RX_Frame')
 
@@ -68,10 +81,11 @@ class EthernetModel(object):
         frame = None
         rx_time = None
         log.info("Checking for: %s" % str(interface_id))
-        if cls.frame_queues[interface_id]:
+        queue = cls.get_queue(interface_id)
+        entry = queue.popleft()
+        if entry is not None:
             log.info("Returning frame")
-            frame = cls.frame_queues[interface_id].popleft()
-            rx_time = cls.frame_times[interface_id].popleft()
+            frame, rx_time = entry
 
         if get_time:
             return frame, rx_time
@@ -83,7 +97,4 @@ class EthernetModel(object):
         '''
             return number of frames and length of first frame
         '''
-        queue = cls.frame_queues[interface_id]
-        if queue:
-            return len(queue), len(queue[0])
-        return 0, 0
+        return cls.get_queue(interface_id).info()
@@ -0,0 +1,189 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Bounded receive queues for frame based peripheral models (e.g.,
+    EthernetModel, IEEE802_15_4).
+
+    When a queue is at capacity its policy decides what happens:
+        tail_drop:     The new frame is dropped
+        head_drop:     The oldest frame is dropped to make room
+        backpressure:  The model publishes its rx_flow topic with
+                       paused True when the queue fills, and paused False
+                       once it drains to half capacity. Senders should
+                       stop sending while paused, frames that arrive when
+                       full are dropped as with tail_drop
+
+    Capacity and policy are set with configure, per model and optionally
+    per interface. Queue depths and drop counts are exported to stats.yaml
+    under frame_queues.
+'''
+import logging
+import threading
+from collections import deque
+
+from . import virtual_clock
+from .. import hal_stats
+
+log = logging.getLogger(__name__)
+
+POLICIES = ('tail_drop', 'head_drop', 'backpressure')
+
+_settings = {}  # (model, interface_id or None): {'capacity', 'policy'}
+_queues = {}  # (model, interface_id): FrameQueue
+_lock = threading.Lock()  # Guards _settings and _queues
+
+
+def configure(model, capacity=None, policy='tail_drop', interface_id=None):
+    '''
+        Sets the capacity (None is unbounded) and policy of queues of
+        model (class name), or only the queue of interface_id.  Applies
+        to queues already created
+    '''
+    if policy not in POLICIES:
+        raise ValueError("Unknown frame queue policy %s" % policy)
+    with _lock:
+        _settings[(model, interface_id)] = {'capacity': capacity,
+                                            'policy': policy}
+        for (queue_model, queue_id), queue in _queues.items():
+            if queue_model == model and interface_id in (None, queue_id):
+                queue.capacity = capacity
+                queue.policy = policy
+
+
+def configure_models(settings):
+    '''
+        Configures from the frame_queues option,
+        {model: {capacity, policy, interfaces: {interface_id: {capacity,
+        policy}}}}
+    '''
+    for model, model_settings in settings.items():
+        model_settings = dict(model_settings)
+        interfaces = model_settings.pop('interfaces', {})
+        configure(model, **model_settings)
+        for interface_id, interface_settings in interfaces.items():
+            configure(model, interface_id=interface_id, **interface_settings)
+
+
+def get_queue(model, interface_id=None, on_flow=None):
+    '''
+        Returns the queue of model's interface_id, creating it if needed.
+        on_flow(interface_id, paused) is called for backpressure. Called
+        from the rx thread and from handlers
+    '''
+    key = (model, interface_id)
+    queue = _queues.get(key)
+    if queue is None:
+        with _lock:
+            queue = _queues.get(key)
+            if queue is None:
+                settings = _settings.get(key,
+                                         _settings.get((model, None), {}))
+                queue = FrameQueue(interface_id, on_flow=on_flow, **settings)
+                _queues[key] = queue
+    return queue
+
+
+class FrameQueue(object):
+    '''
+        Queue of (frame, reception time). Frames are added by the rx
+        thread and taken by handlers, each method holds the queue's lock
+    '''
+
+    def __init__(self, interface_id=None, capacity=None, policy='tail_drop',
+                 on_flow=None):
+        self.interface_id = interface_id
+        self.capacity = capacity
+        self.policy = policy
+        self.on_flow = on_flow
+        self.frames = deque()
+        self.paused = False
+        self.received = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _set_paused(self, paused):
+        '''
+            Called holding lock, so pause and resume are published in order
+        '''
+        if paused != self.paused:
+            self.paused = paused
+            log.debug("Frame queue %s paused: %s" % (self.interface_id,
+                                                     paused))
+            if self.on_flow is not None:
+                self.on_flow(self.interface_id, paused)
+
+    def append(self, frame):
+        '''
+            Adds a received frame, returns False if it was dropped
+        '''
+        with self.lock:
+            self.received += 1
+            frames = self.frames
+            if self.capacity is not None and len(frames) >= self.capacity:
+                self.dropped += 1
+                if self.policy != 'head_drop':
+                    log.debug("Frame queue %s full, dropped frame" %
+                              self.interface_id)
+                    return False
+                frames.popleft()
+            frames.append((frame, virtual_clock.time()))
+            if len(frames) > self.max_depth:
+                self.max_depth = len(frames)
+            if self.policy == 'backpressure' and \
+                    self.capacity is not None and \
+                    len(frames) >= self.capacity:
+                self._set_paused(True)
+            return True
+
+    def popleft(self):
+        '''
+            Returns (frame, reception time) of the oldest frame, None if
+            the queue is empty
+        '''
+        with self.lock:
+            if not self.frames:
+                return None
+            entry = self.frames.popleft()
+            if self.paused and (self.capacity is None or
+                                len(self.frames) <= self.capacity // 2):
+                self._set_paused(False)
+            return entry
+
+    def first(self):
+        '''
+            Returns the oldest frame, None if the queue is empty
+        '''
+        with self.lock:
+            return self.frames[0][0] if self.frames else None
+
+    def info(self):
+        '''
+            Returns (number of frames, length of the oldest frame)
+        '''
+        with self.lock:
+            if not self.frames:
+                return 0, 0
+            return len(self.frames), len(self.frames[0][0])
+
+    def counts(self):
+        return {'depth': len(self.frames), 'max_depth': self.max_depth,
+                'received': self.received, 'dropped': self.dropped,
+                'capacity': self.capacity, 'policy': self.policy}
+
+
+def _export_stats():
+    with _lock:
+        queues = list(_queues.items())
+    if queues:
+        hal_stats.stats['frame_queues'] = {
+            model if interface_id is None else '%s[%s]' % (model, interface_id):
+            queue.counts() for (model, interface_id), queue in queues}
+
+
+hal_stats.add_export_hook(_export_stats)
@@ -4,6 +4,8 @@
 
 from avatar2.peripherals.avatar_peripheral import AvatarPeripheral
 from .. import hal_stats as hal_stats
+from .timer_scheduler import scheduler
+import numpy as np
 import logging
 
 log = logging.getLogger(__name__)
@@ -12,35 +14,178 @@ hal_stats.stats['MMIO_read_addresses'] = set()
 hal_stats.stats['MMIO_write_addresses'] = set()
 hal_stats.stats['MMIO_addresses'] = set()
 hal_stats.stats['MMIO_addr_pc'] = set()
+hal_stats.stats['MMIO_access_counts'] = {}
+
+READ = 0
+WRITE = 1
+
+IDLE_ACTIONS = ('timer', 'ready')
+
+
+class MMIOCounters(object):
+    '''
+        Counts accesses to a peripheral.  Counts are kept in numpy arrays
+        indexed by offset, allocated a page at a time as offsets are
+        touched, and (addr, pc, rw) are packed into 64 bit ints as
+        addr << 32 | pc | rw (pc is halfword aligned so bit 0 is free).
+        Strings for the stats file are only made when a new address or
+        (addr, pc, rw) is seen, and counts when stats are written.
+    '''
+    PAGE_SIZE = 0x1000
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.pages = {}  # page number: array of [READ/WRITE][offset in page]
+        self.addr_pc = set()
+        hal_stats.add_export_hook(self.export)
+
+    def record(self, offset, pc, rw):
+        page_num, page_offset = divmod(offset, self.PAGE_SIZE)
+        page = self.pages.get(page_num)
+        if page is None:
+            page = np.zeros((2, self.PAGE_SIZE), dtype=np.uint64)
+            self.pages[page_num] = page
+        page[rw, page_offset] += 1
+
+        addr = self.address + offset
+        if page[rw, page_offset] == 1:
+            if rw == READ:
+                hal_stats.write_on_update('MMIO_read_addresses', hex(addr))
+            else:
+                hal_stats.write_on_update('MMIO_write_addresses', hex(addr))
+            hal_stats.write_on_update('MMIO_addresses', hex(addr))
+
+        pc &= 0xFFFFFFFE
+        key = (addr << 32) | pc | rw
+        if key not in self.addr_pc:
+            self.addr_pc.add(key)
+            hal_stats.write_on_update(
+                'MMIO_addr_pc', "0x%08x,0x%08x,%s" %
+                (addr, pc, 'w' if rw else 'r'))
+
+    def counts(self):
+        '''
+            Returns {addr: (reads, writes)} for all accessed addresses
+        '''
+        counts = {}
+        for page_num, page in self.pages.items():
+            base = self.address + page_num * self.PAGE_SIZE
+            for page_offset in np.flatnonzero(page[READ] + page[WRITE]):
+                counts[base + int(page_offset)] = \
+                    (int(page[READ, page_offset]), int(page[WRITE, page_offset]))
+        return counts
+
+    def export(self):
+        hal_stats.stats['MMIO_access_counts'][self.name] = \
+            {hex(addr): {'reads': reads, 'writes': writes}
+             for addr, (reads, writes) in sorted(self.counts().items())}
+
+
+class IdleLoopDetector(object):
+    '''
+        Finds the firmware polling an MMIO register in a loop, waiting for
+        an interrupt or a status bit. A loop is threshold reads in a row
+        of the same address from the same pc, with no MMIO write to a
+        GenericPeripheral in between (reads always return the same value).
+        Once found, the detector either:
+            timer:  Skips the virtual clock to the next timer deadline, so
+                    its interrupt fires now rather than after the firmware
+                    has spun for that long (needs clock mode virtual)
+            ready:  Returns the address's ready value (e.g., the mask of
+                    the status bits polled for) from that read
+        and counts reads again. Off while threshold is 0.
+    '''
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, threshold=0, action='timer', ready=None):
+        '''
+            :param threshold:  Reads in a row of one (addr, pc) that are
+                               a loop
+            :param action:     'timer' or 'ready'
+            :param ready:      {addr: value} returned with action ready,
+                               addresses without one return 0
+        '''
+        if action not in IDLE_ACTIONS:
+            raise ValueError("Unknown idle loop action %s" % action)
+        self.threshold = threshold
+        self.action = action
+        self.ready = dict(ready or {})
+        self.last = None  # (addr, pc) of the last read
+        self.repeats = 0
+        self.loops = {}  # (addr, pc): [detected, polls, seconds skipped]
+
+    def read(self, addr, pc):
+        '''
+            Called for each read, returns the value to read or None
+        '''
+        if not self.threshold:
+            return None
+        key = (addr, pc)
+        if key != self.last:
+            self.last = key
+            self.repeats = 1
+            return None
+        self.repeats += 1
+        if self.repeats < self.threshold:
+            return None
+        self.repeats = 0
+        counts = self.loops.get(key)
+        if counts is None:
+            counts = [0, 0, 0.0]
+            self.loops[key] = counts
+            log.info("Idle loop at pc %#x polling %#x" % (pc, addr))
+        counts[0] += 1
+        counts[1] += self.threshold
+        if self.action == 'timer':
+            counts[2] += scheduler.skip_to_next()
+            return None
+        return self.ready.get(addr, 0)
+
+    def write(self):
+        self.last = None
+        self.repeats = 0
+
+    def counts(self):
+        return {"0x%08x,0x%08x" % key: {'detected': detected, 'polls': polls,
+                                        'seconds_skipped': skipped}
+                for key, (detected, polls, skipped) in self.loops.items()}
+
+
+idle_loops = IdleLoopDetector()
+
+
+def _export_idle_loops():
+    if idle_loops.loops:
+        hal_stats.stats['idle_loops'] = idle_loops.counts()
+
+
+hal_stats.add_export_hook(_export_idle_loops)
 
 
 class GenericPeripheral(AvatarPeripheral):
     read_addresses = set()
 
     def hw_read(self, offset, size, pc=0xBAADBAAD):
-        log.info("%s: Read from addr, 0x%08x size %i, pc: %s" %
-                 (self.name, self.address + offset, size, hex(pc)))
-        addr = self.address + offset
-        hal_stats.write_on_update('MMIO_read_addresses', hex(addr))
-        hal_stats.write_on_update('MMIO_addresses', hex(addr))
-        hal_stats.write_on_update(
-            'MMIO_addr_pc', "0x%08x,0x%08x,%s" % (addr, pc, 'r'))
+        log.info("%s: Read from addr, 0x%08x size %i, pc: %#x",
+                 self.name, self.address + offset, size, pc)
+        self.counters.record(offset, pc, READ)
 
-        ret = 0
-        return ret
+        ret = idle_loops.read(self.address + offset, pc)
+        return 0 if ret is None else ret
 
     def hw_write(self, offset, size, value, pc=0xBAADBAAD):
-        log.info("%s: Write to addr: 0x%08x, size: %i, value: 0x%08x, pc %s" % (
-            self.name, self.address + offset, size, value, hex(pc)))
-        addr = self.address + offset
-        hal_stats.write_on_update('MMIO_write_addresses', hex(addr))
-        hal_stats.write_on_update('MMIO_addresses', hex(addr))
-        hal_stats.write_on_update(
-            'MMIO_addr_pc', "0x%08x,0x%08x,%s" % (addr, pc, 'w'))
+        log.info("%s: Write to addr: 0x%08x, size: %i, value: 0x%08x, pc %#x",
+                 self.name, self.address + offset, size, value, pc)
+        self.counters.record(offset, pc, WRITE)
+        idle_loops.write()
         return True
 
     def __init__(self, name, address, size, **kwargs):
         AvatarPeripheral.__init__(self, name, address, size)
+        self.counters = MMIOCounters(name, address)
 
         self.read_handler[0:size] = self.hw_read
         self.write_handler[0:size] = self.hw_write
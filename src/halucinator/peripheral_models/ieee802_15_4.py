@@ -5,12 +5,11 @@
 
 from . import peripheral_server
 # from peripheral_server import PeripheralServer, peripheral_model
-from collections import deque, defaultdict
 from .interrupts import Interrupts
+from . import frame_queue
 import binascii
 import struct
 import logging
-import time
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
@@ -20,16 +19,22 @@ log.setLevel(logging.DEBUG)
 class IEEE802_15_4(object):
 
     IRQ_NAME = '802_15_4_RX_Frame'
-    frame_queue = deque()
     calc_crc = True
     rx_frame_isr = None
     rx_isr_enabled = False
-    frame_time = deque()  # Used to record reception time
+
+    @classmethod
+    def get_queue(cls):
+        '''
+            Returns the frame_queue.FrameQueue, entries are (frame,
+            reception time)
+        '''
+        return frame_queue.get_queue(cls.__name__, on_flow=cls.rx_flow)
 
     @classmethod
     def enable_rx_isr(cls, interface_id):
         cls.rx_isr_enabled = True
-        if cls.frame_queue and cls.rx_frame_isr is not None:
+        if cls.get_queue() and cls.rx_frame_isr is not None:
             Interrupts.trigger_interrupt(cls.rx_frame_isr, cls.IRQ_NAME)
 
     @classmethod
@@ -47,6 +52,15 @@ class IEEE802_15_4(object):
         msg = {'frame': frame}
         return msg
 
+    @classmethod
+    @peripheral_server.tx_msg
+    def rx_flow(cls, interface_id, paused):
+        '''
+            Tells senders to stop (paused) or resume sending frames,
+            published when the queue uses backpressure
+        '''
+        return {'paused': paused}
+
     @classmethod
     @peripheral_server.reg_rx_handler
     def rx_frame(cls, msg):
@@ -57,8 +71,8 @@ class IEEE802_15_4(object):
         frame = msg['frame']
         log.info("Received Frame: %s" % binascii.hexlify(frame))
 
-        cls.frame_queue.append(frame)
-        cls.frame_time.append(time.time())
+        if not cls.get_queue().append(frame):
+            return
         if cls.rx_frame_isr is not None and cls.rx_isr_enabled:
             Interrupts.trigger_interrupt(cls.rx_frame_isr,  cls.IRQ_NAME)
 
@@ -67,10 +81,11 @@ class IEEE802_15_4(object):
         frame = None
         rx_time = None
         log.info("Checking for frame")
-        if cls.frame_queue > 0:
+        queue = cls.get_queue()
+        entry = queue.popleft()
+        if entry is not None:
             log.info("Returning frame")
-            frame = cls.frame_queue.popleft()
-            rx_time = cls.frame_time.popleft()
+            frame, rx_time = entry
 
         if get_time:
             return frame, rx_time
@@ -79,14 +94,11 @@ class IEEE802_15_4(object):
 
     @classmethod
     def has_frame(cls):
-        return len(cls.frame_queue) > 0
+        return len(cls.get_queue()) > 0
 
     @classmethod
     def get_frame_info(cls):
         '''
             return number of frames and length of first frame
         '''
-        queue = cls.frame_queue
-        if queue:
-            return len(queue), len(queue[0])
-        return 0, 0
+        return cls.get_queue().info()
@@ -3,8 +3,10 @@
 # certain rights in this software.
 
 from . import peripheral_server
-from collections import deque, defaultdict
+from .. import hal_stats
+from collections import deque, defaultdict, OrderedDict
 import logging
+import threading
 log = logging.getLogger(__name__)
 # log.setLevel(logging.DEBUG)
 
@@ -16,8 +18,33 @@ class Interrupts(object):
         Models and external interrupt controller
         Use when need to trigger and interrupt and need additional state
         about it
+
+        Triggers are sent to QEMU by a sender thread, which sends all the
+        IRQs waiting when it wakes as one batch. An IRQ is pending from
+        its trigger until it is sent, and triggers of a pending IRQ are
+        coalesced into it, as the NVIC would hold the line pending only
+        once. Triggers after an IRQ is sent are sent again, so an IRQ
+        raised while its handler runs still re-enters it. Intercepts call
+        flush before continuing the target, so IRQs a handler raises are
+        injected before the firmware runs. Delivered and coalesced
+        triggers per source are in stats.yaml under interrupts
     '''
     Active_Interrupts = defaultdict(bool)
+    Pending = OrderedDict()  # isr_num: None, triggered but not yet sent
+    Counts = defaultdict(lambda: [0, 0])  # source: [delivered, coalesced]
+    batches = 0
+    coalesce = True
+    _cond = threading.Condition()
+    _sender = None
+    _sending = False  # A batch is being sent
+    _stopping = False
+
+    @classmethod
+    def configure(cls, coalesce=True):
+        '''
+            Without coalesce every trigger is sent to QEMU by the caller
+        '''
+        cls.coalesce = coalesce
 
     @classmethod
     @peripheral_server.reg_rx_handler
@@ -32,7 +59,94 @@ class Interrupts(object):
         if source is not None:
             cls.set_active(source)
         log.info("Triggering Interrupt: %i" % isr_num)
-        peripheral_server.trigger_interrupt(isr_num)
+        counts = cls.Counts['irq_%i' % isr_num if source is None else source]
+        if not cls.coalesce:
+            counts[0] += 1
+            peripheral_server.trigger_interrupt(isr_num)
+            return
+        with cls._cond:
+            if isr_num in cls.Pending:
+                counts[1] += 1
+                return
+            counts[0] += 1
+            cls.Pending[isr_num] = None
+            if cls._sender is None:
+                cls._stopping = False
+                cls._sender = threading.Thread(target=cls._send,
+                                               name='InterruptSender',
+                                               daemon=True)
+                cls._sender.start()
+            cls._cond.notify_all()
+
+    @classmethod
+    def is_pending(cls, isr_num):
+        return isr_num in cls.Pending
+
+    @classmethod
+    def _take_batch(cls):
+        '''
+            Waits for any batch being sent, then takes the pending IRQs
+            to send. Called holding _cond
+        '''
+        while cls._sending:
+            cls._cond.wait()
+        nums = list(cls.Pending)
+        cls.Pending.clear()
+        if nums:
+            cls._sending = True
+            cls.batches += 1
+        return nums
+
+    @classmethod
+    def _send_batch(cls, nums):
+        try:
+            peripheral_server.trigger_interrupts(nums)
+        except Exception:
+            log.exception("Sending interrupts %s failed" % nums)
+        finally:
+            with cls._cond:
+                cls._sending = False
+                cls._cond.notify_all()
+
+    @classmethod
+    def _send(cls):
+        while True:
+            with cls._cond:
+                while (not cls.Pending or cls._sending) and \
+                        not cls._stopping:
+                    cls._cond.wait()
+                if cls._stopping:
+                    return
+                nums = cls._take_batch()
+            cls._send_batch(nums)
+
+    @classmethod
+    def flush(cls):
+        '''
+            Sends the pending IRQs from this thread, and waits for a batch
+            being sent, so they are injected when it returns. Call with
+            the target stopped, not from MMIO handlers
+        '''
+        if not cls.Pending and not cls._sending:
+            return
+        with cls._cond:
+            nums = cls._take_batch()
+        if nums:
+            cls._send_batch(nums)
+
+    @classmethod
+    def shutdown(cls):
+        '''
+            Stops the sender, IRQs not yet sent are dropped
+        '''
+        with cls._cond:
+            cls._stopping = True
+            cls.Pending.clear()
+            cls._cond.notify_all()
+            sender = cls._sender
+            cls._sender = None
+        if sender is not None and sender is not threading.current_thread():
+            sender.join()
 
     @classmethod
     def set_active(cls, key):
@@ -48,3 +162,16 @@ class Interrupts(object):
     def is_active(cls, key):
         log.debug("Is Active: %s" % str(key))
         return cls.Active_Interrupts[key]
+
+
+def _export_stats():
+    if Interrupts.Counts:
+        stats = {str(source): {'delivered': delivered, 'coalesced': coalesced}
+                 for source, (delivered, coalesced)
+                 in Interrupts.Counts.items()}
+        stats['batches'] = Interrupts.batches
+        hal_stats.stats['interrupts'] = stats
+
+
+hal_stats.add_export_hook(_export_stats)
+peripheral_server.add_stop_hook(Interrupts.shutdown)
@@ -2,9 +2,17 @@
 # Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains 
 # certain rights in this software.
 
+import asyncio
+import os
+import tempfile
+import threading
 import zmq
 import yaml
 from functools import wraps
+from . import wire_codec
+from . import tx_coalescer
+from .shm_transport import ShmSocket
+from .. import hal_stats
 from multiprocessing import Process
 import logging
 log = logging.getLogger(__name__)
@@ -19,6 +27,11 @@ __tx_socket__ = None
 
 __process = None
 __qemu = None
+__codec = 'auto'  # 'yaml', 'binary', or 'auto' (per model, binary once a peer sends it)
+__binary_models = set()  # With auto, models a peer has sent binary messages to
+__transport = 'tcp'
+__tx_lock = threading.Lock()  # tx_msg and the coalescer's flusher both send
+__stop_hooks = []
 
 output_directory = None
 
@@ -33,9 +46,6 @@ def peripheral_model(cls):
         key = 'Peripheral.%s.%s' % (cls.__name__, m.__name__)
         log.info("Adding method: %s" % key)
         __rx_handlers__[key] = (cls, m)
-        if __rx_socket__ != None:
-            log.info("Subscribing to: %s" % key)
-            __rx_socket__.setsockopt(zmq.SUBSCRIBE, bytes(key))
 
     return cls
 
@@ -51,15 +61,61 @@ def tx_msg(funct):
             Sends a message using the class.funct as topic
             data is a yaml encoded of the calling model_cls.funct
         '''
-        global __tx_socket__
         data = funct(model_cls, *args)
         topic = "Peripheral.%s.%s" % (model_cls.__name__, funct.__name__)
-        msg = encode_zmq_msg(topic, data)
-        log.info("Sending: %s" % msg)
-        __tx_socket__.send_string(msg)
+        if tx_coalescer.is_coalesced(topic):
+            tx_coalescer.add(topic, data)
+        else:
+            publish(topic, data)
     return tx_msg_decorator
 
 
+def publish(topic, data):
+    '''
+        Encodes data and sends it on topic
+    '''
+    msg = encode_zmq_msg(topic, data, get_tx_codec(topic), zero_copy=True)
+    log.info("Sending: %s", msg)
+    with __tx_lock:
+        send_zmq_msg(__tx_socket__, msg)
+
+
+def coalesce(topic, field='chars', max_size=4096, deadline_us=1000,
+             flush_on='\n'):
+    '''
+        Coalesces consecutive messages sent by tx_msg on topic that only
+        differ in field, see tx_coalescer
+    '''
+    tx_coalescer.configure(topic, publish, field=field, max_size=max_size,
+                           deadline_us=deadline_us, flush_on=flush_on)
+
+
+def _export_coalescing_stats():
+    counts = tx_coalescer.counts()
+    if counts:
+        hal_stats.stats['tx_coalescing'] = counts
+
+
+hal_stats.add_export_hook(_export_coalescing_stats)
+
+
+def add_stop_hook(hook):
+    '''
+        Registers hook to be called, with no args, when the server stops.
+        Lets models flush state they buffer (e.g., SD card images)
+    '''
+    __stop_hooks.append(hook)
+
+
+def run_stop_hooks():
+    tx_coalescer.flush_all()
+    for hook in __stop_hooks:
+        try:
+            hook()
+        except Exception:
+            log.exception("Stop hook %s failed" % hook)
+
+
 def reg_rx_handler(funct):
     '''
         This is a decorator that registers a function to handle a specific
@@ -69,44 +125,186 @@ def reg_rx_handler(funct):
     return funct
 
 
-def encode_zmq_msg(topic, msg):
+def encode_zmq_msg(topic, msg, codec='yaml', zero_copy=False):
+    '''
+        Encodes msg for topic, yaml returns a str and binary returns bytes.
+        If zero_copy binary returns a list of message parts, with large
+        bytes values in msg as their own parts
+    '''
+    if codec == 'binary':
+        if zero_copy:
+            parts = []
+            header = topic.encode('utf-8') + b' ' + \
+                wire_codec.encode(msg, parts)
+            return [header] + parts
+        return topic.encode('utf-8') + b' ' + wire_codec.encode(msg)
     data_yaml = yaml.safe_dump(msg)
     return "%s %s" % (topic, data_yaml)
 
 
 def decode_zmq_msg(msg):
+    '''
+        Decodes a message from encode_zmq_msg, msg may be a str, the
+        received bytes, or the list of frames from recv_zmq_msg. Yaml
+        and binary are both accepted unless msg is a str.  Large bytes
+        values sent as their own parts decode as memoryviews of the frames
+    '''
+    parts = ()
+    if isinstance(msg, list):
+        parts = [getattr(frame, 'buffer', frame) for frame in msg[1:]]
+        msg = msg[0]
+    if isinstance(msg, (bytes, bytearray, memoryview)):
+        msg = bytes(msg)
+        topic, encoded_msg = msg.split(b' ', 1)
+        if wire_codec.is_encoded(encoded_msg):
+            return (topic.decode('utf-8'),
+                    wire_codec.decode(encoded_msg, parts))
+        return (topic.decode('utf-8'), yaml.safe_load(encoded_msg))
     topic, encoded_msg = str(msg).split(' ', 1)
     decoded_msg = yaml.safe_load(encoded_msg)
     return (topic, decoded_msg)
 
 
-def start(rx_port=5555, tx_port=5556, qemu=None):
-    # TODO Change from localhost if needed
-    global __rx_socket__
+def send_zmq_msg(socket, msg):
+    '''
+        Sends a msg from encode_zmq_msg, parts are sent without copying
+        (if larger than socket.copy_threshold)
+    '''
+    if isinstance(msg, str):
+        socket.send_string(msg)
+    elif isinstance(msg, list):
+        socket.send_multipart(msg, copy=False)
+    else:
+        socket.send(msg)
+
+
+def recv_zmq_msg(socket):
+    '''
+        Receives all parts of a message, the first part is copied and
+        the rest are not.  Decode with decode_zmq_msg
+    '''
+    if isinstance(socket, ShmSocket):
+        return socket.recv_multipart()
+    frames = [socket.recv()]
+    while socket.getsockopt(zmq.RCVMORE):
+        frames.append(socket.recv(copy=False))
+    return frames
+
+
+def is_binary_msg(frames):
+    '''
+        Returns True if frames from recv_zmq_msg use the binary codec
+    '''
+    header = frames[0]
+    return wire_codec.is_encoded(header[header.find(b' ') + 1:])
+
+
+def set_zero_copy(socket):
+    '''
+        Configures socket to send message parts from encode_zmq_msg
+        without copying them
+    '''
+    socket.copy_threshold = wire_codec.ZERO_COPY_MIN
+
+
+def topic_model(topic):
+    '''
+        Returns the model part of a topic, Peripheral.<Model>.<method>
+    '''
+    return topic.rsplit('.', 1)[0]
+
+
+def get_tx_codec(topic):
+    '''
+        With auto, topics of a model are sent binary once a peer has sent
+        binary to that model, so devices of other models can stay yaml
+    '''
+    if __codec == 'auto':
+        return 'binary' if topic_model(topic) in __binary_models else 'yaml'
+    return __codec
+
+
+def ipc_path(port):
+    return os.path.join(tempfile.gettempdir(), 'halucinator_%i' % port)
+
+
+def open_socket(context, socket_type, port, transport='tcp',
+                subscribe_all=True):
+    '''
+        Returns a PUB socket bound to port, or a SUB socket connected to
+        it, using transport:
+            tcp: ZMQ over localhost TCP
+            ipc: ZMQ over a unix domain socket, see ipc_path
+            shm: shared memory ring, see shm_transport
+        SUB sockets are subscribed to all topics, or none without
+        subscribe_all, see subscribe
+    '''
+    if transport == 'shm':
+        return ShmSocket('halucinator_%i' % port,
+                         producer=socket_type == zmq.PUB)
+    if transport == 'ipc':
+        address = "ipc://%s" % ipc_path(port)
+    elif transport == 'tcp':
+        address = "tcp://%s:%i" % (
+            '*' if socket_type == zmq.PUB else 'localhost', port)
+    else:
+        raise ValueError("Unknown transport %s" % transport)
+    socket = context.socket(socket_type)
+    if socket_type == zmq.PUB:
+        set_zero_copy(socket)
+        socket.bind(address)
+    else:
+        socket.connect(address)
+        if subscribe_all:
+            socket.setsockopt(zmq.SUBSCRIBE, b'')
+    return socket
+
+
+def subscribe(socket, topic):
+    '''
+        Subscribes a SUB socket from open_socket to topic. A shm ring has
+        no subscriptions, its consumers receive every message and filter
+        by topic
+    '''
+    if not isinstance(socket, ShmSocket):
+        socket.setsockopt_string(zmq.SUBSCRIBE, topic)
+
+
+def start_tx(tx_port=5556, qemu=None, codec='auto', transport='tcp'):
+    '''
+        Sets up the publisher used by tx_msg, shared by the threaded and
+        asyncio servers
+    '''
     global __tx_socket__
-    global __rx_context__
     global __tx_context__
-    global __rx_handlers__
-    global __process
     global __qemu
     global output_directory
+    global __codec
+    global __transport
 
+    if codec not in ('auto', 'yaml', 'binary'):
+        raise ValueError("Unknown codec %s" % codec)
+    __codec = codec
+    __transport = transport
     output_directory = qemu.avatar.output_directory
     __qemu = qemu
-    log.info('Starting Peripheral Server, In port %i, outport %i' %
-             (rx_port, tx_port))
-    # Setup subscriber
-    __rx_socket__ = __rx_context__.socket(zmq.SUB)
+    # Setup Publisher
+    __tx_socket__ = open_socket(__tx_context__, zmq.PUB, tx_port, __transport)
 
-    __rx_socket__.connect("tcp://localhost:%i" % rx_port)
 
-    for topic in list(__rx_handlers__.keys()):
-        log.info("Subscribing to: %s" % topic)
-        __rx_socket__.setsockopt_string(zmq.SUBSCRIBE, topic)
+def start(rx_port=5555, tx_port=5556, qemu=None, codec='auto',
+          transport='tcp'):
+    # TODO Change from localhost if needed
+    global __rx_socket__
+    global __rx_context__
+    global __rx_handlers__
+    global __process
 
-    # Setup Publisher
-    __tx_socket__ = __tx_context__.socket(zmq.PUB)
-    __tx_socket__.bind("tcp://*:%i" % tx_port)
+    log.info('Starting Peripheral Server, In port %i, outport %i, %s' %
+             (rx_port, tx_port, transport))
+    start_tx(tx_port, qemu, codec, transport)
+    # Setup subscriber
+    __rx_socket__ = open_socket(__rx_context__, zmq.SUB, rx_port, transport)
 
     #__process = Process(target=run_server).start()
 
@@ -117,6 +315,20 @@ def trigger_interrupt(num):
     __qemu.trigger_interrupt(num)
 
 
+def trigger_interrupts(nums):
+    '''
+        Triggers the interrupts in nums, as one batch if the target can
+    '''
+    global __qemu
+    log.info("Sending Interrupts: %s" % nums)
+    batch = getattr(__qemu, 'trigger_interrupts', None)
+    if batch is not None:
+        batch(nums)
+    else:
+        for num in nums:
+            __qemu.trigger_interrupt(num)
+
+
 def irq_set(irq_num=1, cpu=0):
     global __qemu
     __qemu.irq_set(irq_num, cpu)
@@ -130,6 +342,41 @@ def irq_pulse(self, irq_num=1, cpu=0):
     __qemu.irq_pulse(irq_num, cpu)
 
 
+def note_peer_codec(topic, frames):
+    '''
+        Switches the auto codec of topic's model to binary once a peer
+        sends it binary
+    '''
+    model = topic_model(topic)
+    if model not in __binary_models and is_binary_msg(frames):
+        log.info("Peer of %s uses binary codec" % model)
+        __binary_models.add(model)
+
+
+def dispatch(topic, msg):
+    '''
+        Handles a received message. Returns the result of the rx handler,
+        which is a coroutine to be run if the handler is a coroutine
+        function
+    '''
+    if topic.startswith("Peripheral"):
+        if topic in __rx_handlers__:
+            method_cls, method = __rx_handlers__[topic]
+            return method(msg)
+        else:
+            log.error(
+                "Unhandled peripheral message type received: %s" % topic)
+
+    elif topic.startswith("Interrupt.Trigger"):
+        log.info("Triggering Interrupt %s" % msg['num'])
+        trigger_interrupt(msg['num'])
+    elif topic.startswith("Interrupt.Base"):
+        log.info("Setting Vector Base Addr %s" % msg['num'])
+        __qemu.set_vector_table_base(msg['base'])
+    else:
+        log.error("Unhandled topic received: %s" % topic)
+
+
 def run_server():
     global __rx_handlers__
     global __rx_socket__
@@ -137,33 +384,15 @@ def run_server():
     global __qemu
 
     __stop_server = False
-    __rx_socket__.setsockopt(zmq.SUBSCRIBE, b'')
-
-    poller = zmq.Poller()
-    poller.register(__rx_socket__, zmq.POLLIN)
     while(not __stop_server):
-        socks = dict(poller.poll(500))
-        if __rx_socket__ in socks and socks[__rx_socket__] == zmq.POLLIN:
-            string = __rx_socket__.recv_string()
-            topic, msg = decode_zmq_msg(string)
-            log.info("Got message: Topic %s  Msg: %s" % (str(topic), str(msg)))
-
-            if topic.startswith("Peripheral"):
-                if topic in __rx_handlers__:
-                    method_cls, method = __rx_handlers__[topic]
-                    method(msg)
-                else:
-                    log.error(
-                        "Unhandled peripheral message type received: %s" % topic)
-
-            elif topic.startswith("Interrupt.Trigger"):
-                log.info("Triggering Interrupt %s" % msg['num'])
-                trigger_interrupt(msg['num'])
-            elif topic.startswith("Interrupt.Base"):
-                log.info("Setting Vector Base Addr %s" % msg['num'])
-                __qemu.set_vector_table_base(msg['base'])
-            else:
-                log.error("Unhandled topic received: %s" % topic)
+        if __rx_socket__.poll(500):
+            frames = recv_zmq_msg(__rx_socket__)
+            topic, msg = decode_zmq_msg(frames)
+            log.info("Got message: Topic %s  Msg: %s", topic, msg)
+            note_peer_codec(topic, frames)
+            result = dispatch(topic, msg)
+            if asyncio.iscoroutine(result):
+                asyncio.run(result)
     log.info("Peripheral Server Shutdown Normally")
 
 
@@ -171,4 +400,5 @@ def stop():
     global __process
     global __stop_server
     __stop_server = True
+    run_stop_hooks()
     # __process.join()
@@ -1,14 +1,72 @@
-# Copyright 2019 National Technology & Engineering Solutions of Sandia, LLC (NTESS). 
-# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains 
+# Copyright 2019 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
 # certain rights in this software.
 
 from .peripheral import requires_tx_map, requires_rx_map, requires_interrupt_map
 from . import peripheral_server
 from collections import defaultdict
+import mmap
 import os
 import logging
 log = logging.getLogger(__name__)
 
+GROW_ALIGN = 0x100000  # Images written past their end grow in 1MB steps
+
+
+class SDImage(object):
+    '''
+        An SD card image file, kept open and memory mapped. Reads past its
+        end are zeros, it grows when written past its end
+    '''
+
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            open(filename, 'wb').close()
+        self.filename = filename
+        self.file = open(filename, 'r+b')
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = None
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def grow(self, end):
+        '''
+            Makes the image at least end bytes long
+        '''
+        if end <= self.size:
+            return
+        self.size = (end + GROW_ALIGN - 1) // GROW_ALIGN * GROW_ALIGN
+        self.file.truncate(self.size)
+        log.debug("SD image %s grown to %#x" % (self.filename, self.size))
+        # Views returned by read_blocks keep the old map alive, so it is
+        # replaced rather than resized
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def view(self, start, length):
+        if start + length <= self.size:
+            return memoryview(self.map)[start:start + length]
+        data = bytearray(length)
+        if start < self.size:
+            data[:self.size - start] = self.map[start:self.size]
+        return memoryview(data)
+
+    def write(self, start, data):
+        self.grow(start + len(data))
+        self.map[start:start + len(data)] = data
+
+    def flush(self):
+        if self.map is not None:
+            self.map.flush()
+
+    def close(self):
+        self.flush()
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # Views are still held, closed when they are released
+        self.file.close()
+
 
 # Register the pub/sub calls and methods that need mapped
 # TODO Convert to class that can be instantiated with its parameters
@@ -18,62 +76,86 @@ class SDCardModel(object):
     STATES = {'READY': 1}
     BLOCK_SIZE = {}
     filename = {}
+    images = {}  # sd_id: SDImage
 
     @classmethod
     def set_config(cls, sd_id, filename, block_size):
-        cls.BLOCK_SIZE[sd_id] = 0x200
+        cls.BLOCK_SIZE[sd_id] = block_size
         if filename is not None:
-            if peripheral_server.base_dir is not None:
-                log.info("Setting File name using output dir")
-                cls.filename[sd_id] = os.path.join(
-                    peripheral_server.base_dir, filename)
-            else:
-                log.info("No output found dir")
-                cls.filename[sd_id] = filename
+            cls.filename[sd_id] = filename
 
     @classmethod
     def get_filename(cls, sd_id):
-        if sd_id not in cls.filename:
-            if peripheral_server.base_dir is not None:
-                cls.filename[sd_id] = os.path.join(
-                    peripheral_server.base_dir, "sd_card_%s.bin" % str(sd_id))
-            else:
-                cls.filename[sd_id] = "sd_card_%s.bin" % str(sd_id)
+        '''
+            Relative file names are in the output directory, if there is one
+        '''
+        filename = cls.filename.get(sd_id, "sd_card_%s.bin" % str(sd_id))
+        out_dir = peripheral_server.output_directory
+        if out_dir is not None and not os.path.isabs(filename):
+            return os.path.join(out_dir, filename)
+        return filename
+
+    @classmethod
+    def get_image(cls, sd_id):
+        image = cls.images.get(sd_id)
+        if image is None:
+            filename = cls.get_filename(sd_id)
+            log.info("SDCardModel %s using image %s" % (sd_id, filename))
+            image = SDImage(filename)
+            cls.images[sd_id] = image
+        return image
 
-        return cls.filename[sd_id]
+    @classmethod
+    def read_blocks(cls, sd_id, start, count):
+        '''
+            Returns a memoryview of count blocks starting at block start.
+            The view is of the image, copy it if it is kept past a write
+        '''
+        block_size = cls.BLOCK_SIZE[sd_id]
+        log.debug("SDCardModel Reading: %#x, %i blocks" %
+                  (start * block_size, count))
+        return cls.get_image(sd_id).view(start * block_size,
+                                         count * block_size)
+
+    @classmethod
+    def write_blocks(cls, sd_id, start, data):
+        '''
+            Writes data, a whole number of blocks, starting at block start
+        '''
+        block_size = cls.BLOCK_SIZE[sd_id]
+        log.debug("SDCardModel Writing: %#x, %i bytes" %
+                  (start * block_size, len(data)))
+        cls.get_image(sd_id).write(start * block_size, data)
+        return True
 
     @classmethod
     def read_block(cls, sd_id, block_num):
         '''
-            Reads data from the file, and returns the data if possible 
-            return None
+            Returns the data of the block
         '''
-        data = None
-        with open(cls.get_filename(sd_id), 'rb') as f:
-            addr = block_num * SDCardModel.BLOCK_SIZE[sd_id]
-            log.info("SDCardModle Reading: %s" % hex(addr))
-            f.seek(addr)
-            data = f.read(SDCardModel.BLOCK_SIZE[sd_id])
-        return data
+        return bytes(cls.read_blocks(sd_id, block_num, 1))
 
     @classmethod
     @requires_tx_map
     def write_block(cls, sd_id, block_num, data):
         '''
-            Writes the data to a file, and returns True if no errors else 
-            return False
+            Writes the data to the block, and returns True
         '''
-        filename = cls.get_filename(sd_id)
-        if not os.path.exists(filename):
-            with open(filename, 'wb') as f:
-                pass  # Create the file
-        with open(filename, 'rb+') as f:
-            addr = block_num * SDCardModel.BLOCK_SIZE[sd_id]
-            log.info("SDCardModle Writeing: %s" % hex(addr))
-            f.seek(addr)
-            f.write(data)
-            return True
-        return False
+        return cls.write_blocks(sd_id, block_num, data)
+
+    @classmethod
+    def flush(cls):
+        '''
+            Writes changes to the image files
+        '''
+        for image in cls.images.values():
+            image.flush()
+
+    @classmethod
+    def close(cls):
+        for image in cls.images.values():
+            image.close()
+        cls.images.clear()
 
     @classmethod
     def get_block_size(cls, sd_id):
@@ -83,3 +165,6 @@ class SDCardModel(object):
     @requires_rx_map
     def get_state(cls, sd_id):
         return SDCardModel.STATES['Ready']
+
+
+peripheral_server.add_stop_hook(SDCardModel.flush)
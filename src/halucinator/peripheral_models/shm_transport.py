@@ -0,0 +1,334 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Shared memory transport for peripheral server messages between
+    processes on the same host.
+
+    Each direction is a ring buffer in a multiprocessing.shared_memory
+    segment, with one producer and up to MAX_CONSUMERS consumers (e.g.,
+    the UART and Ethernet hub devices both reading the emulator's tx
+    ring). Each consumer has a slot with its own tail and a named pipe
+    (FIFO) to wake it when it is blocked waiting for a message, and every
+    consumer reads every message. ShmSocket provides the subset of the
+    ZMQ socket interface used by peripheral_server, so messages and
+    handlers are the same as with ZMQ.
+
+    Like ZMQ PUB/SUB a consumer only gets messages sent after it attaches,
+    and messages that don't fit in the ring before the slowest consumer's
+    tail are dropped (and counted). Slots of consumers that exited
+    without detaching are freed once their process is gone. Rings and
+    FIFOs are named after the port they replace (e.g.,
+    /dev/shm/halucinator_5556) and are left in place on exit, so either
+    side can be restarted and reattach. ShmSocket.close(unlink=True)
+    removes them.
+
+    Ring layout, all counters are little endian u64 and count bytes since
+    the ring was created:
+        0:    head, written by the producer
+        64:   MAX_CONSUMERS consumer slots of SLOT_SIZE bytes:
+                0:  pid of the consumer, 0 if free (u32)
+                4:  waiting, set by the consumer while blocked on its
+                    FIFO (u32)
+                8:  tail, written by the consumer
+        DATA: records of a u32 length then the message, padded to 8
+              bytes. A length of WRAP means the next record is at the
+              start of data
+    A message is a u32 count of frames, then a u32 length and the data
+    of each frame.
+'''
+import errno
+import fcntl
+import logging
+import os
+import select
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+from struct import Struct
+
+log = logging.getLogger(__name__)
+
+RING_SIZE = 1 << 20  # Bytes of data in each ring
+HEAD = 0
+SLOTS = 64
+SLOT_SIZE = 16
+MAX_CONSUMERS = 8
+PID = 0  # Offsets in a slot
+WAITING = 4
+TAIL = 8
+DATA = SLOTS + MAX_CONSUMERS * SLOT_SIZE
+WRAP = 0xFFFFFFFF
+# Longest a blocked consumer sleeps without rechecking the ring, in case
+# a wakeup is missed
+MAX_SLEEP = 0.01
+
+_U32 = Struct('<I')
+_U64 = Struct('<Q')
+# Taking a lock is a full memory barrier, keeps the store of head (or
+# waiting) from being reordered after the load of waiting (or head)
+_barrier = threading.Lock()
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _open_shared_memory(name, size):
+    '''
+        Creates the shared memory segment name, or attaches to it if it
+        exists. Returns (SharedMemory, created)
+    '''
+    try:
+        shm, created = shared_memory.SharedMemory(name, True, size), True
+    except FileExistsError:
+        shm, created = shared_memory.SharedMemory(name), False
+    try:
+        # Python < 3.13 unlinks segments when the process that opened them
+        # exits, keep them so either side can restart and reattach
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+    return shm, created
+
+
+def fifo_path(name, slot):
+    return os.path.join(tempfile.gettempdir(), '%s.%i.fifo' % (name, slot))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ShmSocket(object):
+    '''
+        One direction of the transport, either the producer (send) or a
+        consumer (recv) of the ring named name
+    '''
+
+    def __init__(self, name, producer, size=RING_SIZE):
+        self.name = name
+        self.producer = producer
+        self.shm, self.created = _open_shared_memory(name, DATA + size)
+        self.buf = self.shm.buf
+        self.size = len(self.buf) - DATA
+        self.dropped = 0
+        self.slot = None
+        self.fifo_fd = None
+        self._fifo_writer = None
+        self._wake_fds = {}  # slot: FIFO opened for writing, producer only
+        if producer:
+            self._head = _U64.unpack_from(self.buf, HEAD)[0]
+        else:
+            self._attach()
+
+    def _slot_offset(self, slot):
+        return SLOTS + slot * SLOT_SIZE
+
+    def _attach(self):
+        '''
+            Claims a free consumer slot, starting at the current head so
+            only messages sent from now on are received
+        '''
+        # Consumers may attach at the same time, a lock file picks the order
+        with open(os.path.join(tempfile.gettempdir(), self.name + '.lock'),
+                  'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for slot in range(MAX_CONSUMERS):
+                offset = self._slot_offset(slot)
+                pid = _U32.unpack_from(self.buf, offset + PID)[0]
+                if pid == 0 or not _pid_alive(pid):
+                    break
+            else:
+                raise RuntimeError("Ring %s already has %i consumers" %
+                                   (self.name, MAX_CONSUMERS))
+            self._tail = _U64.unpack_from(self.buf, HEAD)[0]
+            _U64.pack_into(self.buf, offset + TAIL, self._tail)
+            _U32.pack_into(self.buf, offset + WAITING, 0)
+            with _barrier:
+                pass
+            _U32.pack_into(self.buf, offset + PID, os.getpid())
+        self.slot = slot
+        self._slot = offset
+        fifo = fifo_path(self.name, slot)
+        try:
+            os.mkfifo(fifo)
+        except FileExistsError:
+            pass
+        self.fifo_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        # Keep a writer open, so the FIFO doesn't read as EOF (always
+        # readable) when the producer isn't attached
+        self._fifo_writer = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+
+    def _min_tail(self, head):
+        '''
+            Returns the tail of the slowest consumer, head if there are
+            none. Frees slots of consumers that are gone when one is
+            holding the ring full
+        '''
+        tail = head
+        for slot in range(MAX_CONSUMERS):
+            offset = self._slot_offset(slot)
+            pid = _U32.unpack_from(self.buf, offset + PID)[0]
+            if pid == 0:
+                continue
+            slot_tail = _U64.unpack_from(self.buf, offset + TAIL)[0]
+            if head - slot_tail > self.size // 2 and not _pid_alive(pid):
+                log.info("Ring %s freeing slot of exited consumer %i" %
+                         (self.name, pid))
+                _U32.pack_into(self.buf, offset + PID, 0)
+                continue
+            tail = min(tail, slot_tail)
+        return tail
+
+    def _wake(self):
+        for slot in range(MAX_CONSUMERS):
+            offset = self._slot_offset(slot)
+            if not _U32.unpack_from(self.buf, offset + WAITING)[0]:
+                continue
+            try:
+                fd = self._wake_fds.get(slot)
+                if fd is None:
+                    fd = os.open(fifo_path(self.name, slot),
+                                 os.O_WRONLY | os.O_NONBLOCK)
+                    self._wake_fds[slot] = fd
+                os.write(fd, b'\x00')
+            except BlockingIOError:
+                pass  # FIFO full, so a wakeup is already pending
+            except OSError as e:
+                # No consumer has the FIFO open, or it doesn't exist yet
+                if e.errno not in (errno.ENXIO, errno.ENOENT):
+                    raise
+    def send_multipart(self, frames, copy=False):
+        size = 4 + sum(4 + len(frame) for frame in frames)
+        record = _align(4 + size)
+        if record > self.size // 2:
+            raise ValueError("Message of %i bytes too large for ring" % size)
+        head = self._head
+        pos = head % self.size
+        skip = self.size - pos if self.size - pos < record else 0
+        tail = self._min_tail(head)
+        if head + skip + record - tail > self.size:
+            self.dropped += 1
+            log.debug("Ring %s full, dropped message" % self.name)
+            return
+        if skip:
+            _U32.pack_into(self.buf, DATA + pos, WRAP)
+            pos = 0
+        offset = DATA + pos
+        _U32.pack_into(self.buf, offset, size)
+        _U32.pack_into(self.buf, offset + 4, len(frames))
+        offset += 8
+        for frame in frames:
+            _U32.pack_into(self.buf, offset, len(frame))
+            offset += 4
+            self.buf[offset:offset + len(frame)] = frame
+            offset += len(frame)
+        self._head = head + skip + record
+        _U64.pack_into(self.buf, HEAD, self._head)
+        with _barrier:
+            pass
+        self._wake()
+
+    def send(self, data, copy=True):
+        self.send_multipart([data])
+
+    def send_string(self, data):
+        self.send_multipart([data.encode('utf-8')])
+
+    def _available(self):
+        return _U64.unpack_from(self.buf, HEAD)[0] != self._tail
+
+    def recv_multipart(self, copy=True):
+        '''
+            Returns the next message as a list of bytes, blocking until
+            one is available
+        '''
+        while not self.poll():
+            pass
+        pos = self._tail % self.size
+        size = _U32.unpack_from(self.buf, DATA + pos)[0]
+        if size == WRAP:
+            self._tail += self.size - pos
+            pos = 0
+            size = _U32.unpack_from(self.buf, DATA)[0]
+        offset = DATA + pos + 4
+        count = _U32.unpack_from(self.buf, offset)[0]
+        offset += 4
+        frames = []
+        for _ in range(count):
+            length = _U32.unpack_from(self.buf, offset)[0]
+            offset += 4
+            frames.append(bytes(self.buf[offset:offset + length]))
+            offset += length
+        self._tail += _align(4 + size)
+        _U64.pack_into(self.buf, self._slot + TAIL, self._tail)
+        return frames
+
+    def recv(self, copy=True):
+        return b''.join(self.recv_multipart())
+
+    def poll(self, timeout=None):
+        '''
+            Waits up to timeout ms (None forever) for a message, returns
+            True if one is available
+        '''
+        if self._available():
+            return True
+        deadline = None if timeout is None \
+            else time.monotonic() + timeout / 1000.0
+        _U32.pack_into(self.buf, self._slot + WAITING, 1)
+        with _barrier:
+            pass
+        try:
+            while not self._available():
+                sleep = MAX_SLEEP
+                if deadline is not None:
+                    sleep = min(sleep, deadline - time.monotonic())
+                    if sleep <= 0:
+                        break
+                readable, _, _ = select.select([self.fifo_fd], [], [], sleep)
+                if readable:
+                    try:
+                        os.read(self.fifo_fd, 4096)
+                    except BlockingIOError:
+                        pass
+        finally:
+            _U32.pack_into(self.buf, self._slot + WAITING, 0)
+        return self._available()
+
+    def close(self, unlink=False):
+        '''
+            Detaches from the ring, unlink removes it and the FIFOs
+        '''
+        if self.slot is not None:
+            _U32.pack_into(self.buf, self._slot + WAITING, 0)
+            _U32.pack_into(self.buf, self._slot + PID, 0)
+            self.slot = None
+        for fd in [self.fifo_fd, self._fifo_writer] + \
+                list(self._wake_fds.values()):
+            if fd is not None:
+                os.close(fd)
+        self.fifo_fd = self._fifo_writer = None
+        self._wake_fds = {}
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            for slot in range(MAX_CONSUMERS):
+                try:
+                    os.unlink(fifo_path(self.name, slot))
+                except FileNotFoundError:
+                    pass
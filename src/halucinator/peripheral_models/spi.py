@@ -4,12 +4,12 @@
 
 
 from . import peripheral_server
+from .. import hal_latency
 # from queue import Queue
-from threading import Event, Thread
+from threading import Condition, Event, Lock, Thread
 from collections import deque, defaultdict
 import sys
 import logging
-from itertools import repeat
 import time
 
 log = logging.getLogger(__name__)
@@ -50,6 +50,8 @@ class UARTModel(object):
 @peripheral_server.peripheral_model
 class SPIPublisher(object):
     rx_buffers = defaultdict(deque)
+    rx_conditions = {}  # spi_id: Condition, notified by rx_data
+    _conditions_lock = Lock()
 
     @classmethod
     @peripheral_server.tx_msg
@@ -58,30 +60,46 @@ class SPIPublisher(object):
            Publishes the data to sub/pub server
         '''
         log.debug("In: SPIPublisher.write")
-        msg = {'id': uart_id, 'chars': chars}
+        msg = {'id': spi_id, 'chars': chars}
         return msg
 
     @classmethod
-    def read(cls, spi_id, count=1, block=False):
+    def _get_condition(cls, spi_id):
+        with cls._conditions_lock:
+            if spi_id not in cls.rx_conditions:
+                cls.rx_conditions[spi_id] = Condition()
+            return cls.rx_conditions[spi_id]
+
+    @classmethod
+    def read(cls, spi_id, count=1, block=False, timeout=None):
         '''
             Gets data previously received from the sub/pub server
             Args:
                 spi_id:   A unique id for the spi
                 count:  Max number of chars to read
                 block(bool): Block if data is not available
+                timeout: Max seconds to block, None blocks until count
+                         chars are available
         '''
         log.debug("In: SPIPublisher.read id:%s count:%i, block:%s" %
                   (hex(spi_id), count, str(block)))
-        while block and (len(cls.rx_buffers[spi_id]) < count):
-            pass
-        log.debug("Done Blocking: SPIPublisher.read")
         buffer = cls.rx_buffers[spi_id]
+        if block:
+            condition = cls._get_condition(spi_id)
+            with condition:
+                if len(buffer) < count:
+                    start = hal_latency.now()
+                    if not condition.wait_for(lambda: len(buffer) >= count,
+                                              timeout):
+                        log.debug("SPIPublisher id:%s timed out" % hex(spi_id))
+                    hal_latency.add_wait(hal_latency.now() - start)
+        log.debug("Done Blocking: SPIPublisher.read")
         chars_available = len(buffer)
         if chars_available >= count:
-            chars = list(map(apply, repeat(buffer.popleft, count)))
+            chars = [buffer.popleft() for _ in range(count)]
             chars = ''.join(chars)
         else:
-            chars = list(map(apply, repeat(buffer.popleft, chars_available)))
+            chars = [buffer.popleft() for _ in range(chars_available)]
             chars = ''.join(chars)
 
         return chars
@@ -95,4 +113,7 @@ class SPIPublisher(object):
         log.debug("SPI rx_data got message: %s" % str(msg))
         spi_id = msg['id']
         data = msg['chars']
-        cls.rx_buffers[spi_id].extend(data)
\ No newline at end of file
+        condition = cls._get_condition(spi_id)
+        with condition:
+            cls.rx_buffers[spi_id].extend(data)
+            condition.notify_all()
@@ -3,11 +3,11 @@
 # certain rights in this software.
 
 from . import peripheral_server
+from . import timer_scheduler
 from collections import deque, defaultdict
+from functools import partial
 from .interrupts import Interrupts
-from threading import Thread, Event
 import logging
-import time
 log = logging.getLogger(__name__)
 
 
@@ -15,22 +15,42 @@ log = logging.getLogger(__name__)
 # Register the pub/sub calls and methods that need mapped
 @peripheral_server.peripheral_model
 class TimerModel(object):
+    '''
+        Periodic interrupts, all timers are run by timer_scheduler.scheduler
+    '''
+
+    active_timers = {}  # name: (isr_num, rate)
+    scheduler = timer_scheduler.scheduler
 
-    active_timers = {}
     @classmethod
     def start_timer(cls, name, isr_num, rate):
+        if cls.active_timers.get(name) == (isr_num, rate) and \
+                cls.scheduler.is_running(name):
+            return
         log.info("Starting timer: %s" % name)
-        if name not in cls.active_timers:
-            stop_event = Event()
-            t = TimerIRQ(stop_event, name, isr_num, rate)
-            cls.active_timers[name] = (stop_event, t)
-            t.start()
+        cls.active_timers[name] = (isr_num, rate)
+        cls.scheduler.add(name, rate, partial(cls._fire, name, isr_num))
+
+    @classmethod
+    def _fire(cls, name, isr_num):
+        log.info("Sending IRQ: %s" % isr_num)
+        Interrupts.trigger_interrupt(isr_num, name)
 
     @classmethod
     def stop_timer(cls, name):
         if name in cls.active_timers:
-            (stop_event, t) = cls.active_timers[name]
-            stop_event.set()
+            cls.scheduler.stop(name)
+
+    @classmethod
+    def delay(cls, seconds):
+        '''
+            Fast forwards a delay the firmware makes, up to the next timer
+            deadline, firing the timers that are due then. Only with a
+            virtual clock, see timer_scheduler.Scheduler.fast_forward
+
+            :returns Seconds fast forwarded, 0 with the wall clock
+        '''
+        return cls.scheduler.fast_forward(seconds)
 
     @classmethod
     def clear_timer(cls, irq_name):
@@ -39,21 +59,7 @@ class TimerModel(object):
 
     @classmethod
     def shutdown(cls):
-        for key, (stop_event, t) in list(cls.active_timers.items()):
-            stop_event.set()
-
-
-class TimerIRQ(Thread):
-    def __init__(self, event, irq_name, irq_num, rate):
-        Thread.__init__(self)
-        self.stopped = event
-        self.name = irq_name
-        self.irq_num = irq_num
-        self.rate = rate
-
-    def run(self):
-        while not self.stopped.wait(self.rate):
-            log.info("Sending IRQ: %s" % self.irq_num)
-            Interrupts.set_active(self.name)
-            Interrupts.trigger_interrupt(self.irq_num)
-            # call a function
+        cls.scheduler.shutdown()
+
+
+peripheral_server.add_stop_hook(TimerModel.shutdown)
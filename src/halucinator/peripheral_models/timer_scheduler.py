@@ -0,0 +1,289 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Periodic timers run from a single thread and a heap of deadlines.
+
+    A timer's next deadline is its previous deadline plus its period, not
+    the time it fired plus its period, so late wake ups don't accumulate
+    as drift. If the scheduler falls more than a period behind, the missed
+    ticks are counted and the timer fires once (in wall clock mode).
+
+    Adding, stopping and reprogramming a timer are O(log n), stopped
+    timers leave stale heap entries that are dropped when they reach the
+    top. How late each timer fires is exported to stats.yaml under
+    timers.
+
+    fast_forward and skip_to_next let delays and idle loops in the
+    firmware jump to the next deadline rather than wait for it.
+
+    Time is kept by virtual_clock. With a virtual clock, deadlines are in
+    virtual time and the scheduler skips the clock ahead to the next
+    deadline when nothing else moves it there, see virtual_clock.
+'''
+import heapq
+import itertools
+import logging
+import threading
+
+from . import virtual_clock
+from .. import hal_stats
+from ..util.histogram import LatencyHistogram
+
+log = logging.getLogger(__name__)
+
+TOLERANCE = 1e-9  # Seconds, absorbs float error in summed deadlines
+
+
+class Timer(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.period = None
+        self.callback = None
+        self.deadline = None  # None when stopped
+        self.generation = 0  # Heap entries of older generations are stale
+        self.fired = 0
+        self.missed = 0
+        self.lateness = LatencyHistogram()  # Microseconds past deadline
+
+    def counts(self):
+        return {'period': self.period, 'fired': self.fired,
+                'missed': self.missed, 'lateness_us': self.lateness.summary()}
+
+
+class Scheduler(object):
+    '''
+        Calls each timer's callback every period seconds, from one thread
+
+        :param clock:  virtual_clock.VirtualClock, the global clock if None
+    '''
+
+    def __init__(self, clock=None):
+        self.clock = virtual_clock.clock if clock is None else clock
+        self.timers = {}  # name: Timer
+        self._heap = []  # (deadline, seq, Timer, generation)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.delays = 0  # Calls to fast_forward
+        self.delayed = 0.0  # Seconds fast forwarded
+        self.clock.add_listener(self._clock_moved)
+
+    def _clock_moved(self):
+        '''
+            Wakes the scheduler if virtual time reached the next deadline
+        '''
+        with self._cond:
+            if self._heap and self._heap[0][0] <= self.clock.now():
+                self._cond.notify()
+
+    def _arm(self, timer, deadline):
+        timer.generation += 1
+        timer.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._seq), timer,
+                                    timer.generation))
+        if self._heap[0][2] is timer:
+            self._cond.notify()
+
+    def add(self, name, period, callback, delay=None):
+        '''
+            Starts timer name, or restarts it if it exists, calling
+            callback() every period seconds. The first call is after delay
+            seconds, period if None
+        '''
+        if period <= 0:
+            raise ValueError("Timer period must be positive: %s" % period)
+        with self._cond:
+            timer = self.timers.get(name)
+            if timer is None:
+                timer = Timer(name)
+                self.timers[name] = timer
+            timer.period = period
+            timer.callback = callback
+            self._arm(timer, self.clock.now() +
+                      (period if delay is None else delay))
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run,
+                                                name='TimerScheduler',
+                                                daemon=True)
+                self._thread.start()
+
+    def reprogram(self, name, period):
+        '''
+            Changes the period of a running timer, it next fires period
+            seconds from now
+        '''
+        with self._cond:
+            timer = self.timers[name]
+            if period <= 0:
+                raise ValueError("Timer period must be positive: %s" % period)
+            timer.period = period
+            if timer.deadline is not None:
+                self._arm(timer, self.clock.now() + period)
+
+    def stop(self, name):
+        with self._cond:
+            timer = self.timers.get(name)
+            if timer is not None:
+                timer.generation += 1
+                timer.deadline = None
+
+    def is_running(self, name):
+        timer = self.timers.get(name)
+        return timer is not None and timer.deadline is not None
+
+    def shutdown(self):
+        '''
+            Stops all timers and the scheduler thread
+        '''
+        with self._cond:
+            for timer in self.timers.values():
+                timer.generation += 1
+                timer.deadline = None
+            self._heap.clear()
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _next_due(self):
+        '''
+            Waits for the next timer that is due, re-arms it and returns
+            it. Returns None when shutting down. Called holding _cond
+        '''
+        heap = self._heap
+        while not self._stopping:
+            if not heap:
+                self._cond.wait()
+                continue
+            deadline, _, timer, generation = heap[0]
+            if generation != timer.generation:
+                heapq.heappop(heap)
+                continue
+            now = self.clock.now()
+            if now < deadline:
+                delay = self.clock.wall_delay(deadline - now)
+                if delay is None:
+                    self._cond.wait()
+                elif delay <= 0 or not self._cond.wait(delay):
+                    # Waited without being woken, a virtual clock skips
+                    # ahead to the deadline
+                    self.clock.skip_to(deadline)
+                continue
+            return self._fire_next(now)
+        return None
+
+    def _fire_next(self, now):
+        '''
+            Pops the timer at the top of the heap, records how late it is
+            and re-arms it. Called holding _cond
+        '''
+        deadline, _, timer, _ = heapq.heappop(self._heap)
+        late = now - deadline
+        # Virtual time jumps, every tick it jumps over is still fired
+        missed = 0 if self.clock.is_virtual else int(late // timer.period)
+        timer.fired += 1
+        timer.missed += missed
+        timer.lateness.record(late * 1000000)
+        self._arm(timer, deadline + (missed + 1) * timer.period)
+        return timer
+
+    def fast_forward(self, seconds):
+        '''
+            Skips part of a delay of seconds the firmware makes (e.g.,
+            HAL_Delay) with a virtual clock. Time jumps to the earlier of
+            the end of the delay and the next timer deadline, and the
+            timers due then are fired, in order. The caller lets the
+            firmware run their ISRs before skipping the rest of the delay,
+            so ISR driven tick counts see every tick. Does nothing with
+            the wall clock
+
+            :returns Seconds skipped
+        '''
+        if not self.clock.is_virtual or seconds <= 0:
+            return 0
+        with self._cond:
+            start = self.clock.now()
+            end = start + seconds
+            heap = self._heap
+            while heap and heap[0][3] != heap[0][2].generation:
+                heapq.heappop(heap)
+            if heap and heap[0][0] <= end + TOLERANCE:
+                end = max(heap[0][0], start)
+            self.clock.skip_to(end)
+            due = []
+            # Re-armed before the lock is released, so the scheduler
+            # thread doesn't fire them too
+            while heap and heap[0][0] <= end + TOLERANCE:
+                if heap[0][3] != heap[0][2].generation:
+                    heapq.heappop(heap)
+                    continue
+                due.append(self._fire_next(self.clock.now()))
+            self.delays += 1
+            self.delayed += end - start
+        for timer in due:
+            try:
+                timer.callback()
+            except Exception:
+                log.exception("Timer %s callback failed" % timer.name)
+        return end - start
+
+    def skip_to_next(self):
+        '''
+            Moves a virtual clock to the next timer deadline, so the
+            scheduler thread fires that timer now (e.g., when the firmware
+            is found polling in an idle loop). Does nothing with the wall
+            clock
+
+            :returns Seconds skipped
+        '''
+        if not self.clock.is_virtual:
+            return 0
+        with self._cond:
+            heap = self._heap
+            while heap and heap[0][3] != heap[0][2].generation:
+                heapq.heappop(heap)
+            if not heap:
+                return 0
+            now = self.clock.now()
+            deadline = heap[0][0]
+            if deadline <= now:
+                return 0
+            self.clock.skip_to(deadline)
+        return deadline - now
+
+    def _run(self):
+        while True:
+            with self._cond:
+                timer = self._next_due()
+                if timer is None:
+                    return
+                callback = timer.callback
+            try:
+                callback()
+            except Exception:
+                log.exception("Timer %s callback failed" % timer.name)
+
+    def counts(self):
+        return {str(name): timer.counts()
+                for name, timer in self.timers.items()}
+
+
+scheduler = Scheduler()
+
+
+def _export_stats():
+    if scheduler.timers:
+        hal_stats.stats['timers'] = scheduler.counts()
+    if scheduler.delays:
+        hal_stats.stats['fast_forward'] = {'delays': scheduler.delays,
+                                           'seconds': scheduler.delayed}
+
+
+hal_stats.add_export_hook(_export_stats)
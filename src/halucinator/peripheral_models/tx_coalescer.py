@@ -0,0 +1,178 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Coalesces consecutive tx messages of a topic into one message, like
+    Nagle's algorithm, so byte at a time output (e.g., putc) isn't
+    published one byte per message.
+
+    Consecutive messages that only differ in the coalesced field (e.g.,
+    'chars' of UARTPublisher.write, same 'id') have that field
+    concatenated. The pending message is published when the field reaches
+    max_size, contains a flush character (newline by default),
+    deadline_us microseconds after it was started, a message that can't
+    be merged arrives, or flush_all is called.
+'''
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Condition()  # Guards all coalescers, wakes the flusher
+_coalescers = {}  # topic: Coalescer
+_flusher = None
+
+
+class Coalescer(object):
+
+    def __init__(self, topic, publish, field='chars', max_size=4096,
+                 deadline_us=1000, flush_on='\n'):
+        self.topic = topic
+        self.publish = publish  # Called with (topic, msg)
+        self.field = field
+        self.max_size = max_size
+        self.deadline = deadline_us / 1000000.0
+        self.flush_on = flush_on
+        self.flush_on_bytes = flush_on.encode('latin-1') if flush_on else None
+        self.pending = None
+        self.pending_parts = []
+        self.pending_size = 0
+        self.pending_count = 0
+        self.flush_time = None
+        self.messages = 0  # Received from tx_msg
+        self.published = 0
+
+    def _can_merge(self, msg):
+        pending = self.pending
+        if pending is None or not isinstance(msg, dict) or \
+                len(msg) != len(pending) or self.field not in msg:
+            return False
+        for key, value in msg.items():
+            if key != self.field and \
+                    (key not in pending or pending[key] != value):
+                return False
+        return True
+
+    def _should_flush(self, data):
+        if self.pending_size >= self.max_size:
+            return True
+        if not self.flush_on:
+            return False
+        if isinstance(data, str):
+            return self.flush_on in data
+        return self.flush_on_bytes in data
+
+    def add(self, msg):
+        self.messages += 1
+        if not self._can_merge(msg):
+            self.flush()
+            if not isinstance(msg, dict) or self.field not in msg:
+                self._publish(msg)
+                return
+            self.pending = msg
+            self.flush_time = time.monotonic() + self.deadline
+            _lock.notify()
+        data = msg[self.field]
+        self.pending_parts.append(data)
+        self.pending_size += len(data)
+        self.pending_count += 1
+        if self._should_flush(data):
+            self.flush()
+
+    def _joined(self):
+        parts = self.pending_parts
+        if len(parts) == 1:
+            return parts[0]
+        if all(isinstance(part, str) for part in parts):
+            return ''.join(parts)
+        return b''.join(part.encode('latin-1') if isinstance(part, str)
+                        else part for part in parts)
+
+    def flush(self):
+        if self.pending is None:
+            return
+        msg = dict(self.pending)
+        msg[self.field] = self._joined()
+        self.pending = None
+        self.pending_parts = []
+        self.pending_size = 0
+        self.pending_count = 0
+        self.flush_time = None
+        self._publish(msg)
+
+    def _publish(self, msg):
+        self.published += 1
+        self.publish(self.topic, msg)
+
+    def counts(self):
+        return {'messages': self.messages, 'published': self.published,
+                'saved': self.messages - self.published - self.pending_count}
+
+
+def _flush_loop():
+    with _lock:
+        while True:
+            deadlines = [c.flush_time for c in _coalescers.values()
+                         if c.flush_time is not None]
+            if not deadlines:
+                _lock.wait()
+                continue
+            now = time.monotonic()
+            if min(deadlines) > now:
+                _lock.wait(min(deadlines) - now)
+                continue
+            for coalescer in _coalescers.values():
+                if coalescer.flush_time is not None and \
+                        coalescer.flush_time <= now:
+                    coalescer.flush()
+
+
+def configure(topic, publish, **kwargs):
+    '''
+        Coalesces messages of topic, kwargs are passed to Coalescer.
+        Messages are sent with publish(topic, msg)
+    '''
+    global _flusher
+    with _lock:
+        if topic in _coalescers:
+            _coalescers[topic].flush()
+        _coalescers[topic] = Coalescer(topic, publish, **kwargs)
+        log.info("Coalescing %s: %s" % (topic, kwargs))
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True,
+                                        name='tx_coalescer')
+            _flusher.start()
+
+
+def remove(topic):
+    with _lock:
+        if topic in _coalescers:
+            _coalescers.pop(topic).flush()
+
+
+def is_coalesced(topic):
+    return topic in _coalescers
+
+
+def add(topic, msg):
+    '''
+        Adds msg to the coalescer for topic, which publishes it when ready
+    '''
+    with _lock:
+        _coalescers[topic].add(msg)
+
+
+def flush_all():
+    with _lock:
+        for coalescer in _coalescers.values():
+            coalescer.flush()
+
+
+def counts():
+    '''
+        Returns {topic: {messages, published, saved}}
+    '''
+    with _lock:
+        return {topic: c.counts() for topic, c in _coalescers.items()}
@@ -3,8 +3,9 @@
 # certain rights in this software.
 
 from . import peripheral_server
+from .. import hal_latency
 #from queue import Queue
-from threading import Event, Thread
+from threading import Condition, Event, Lock, Thread
 from collections import deque, defaultdict
 import sys
 import logging
@@ -18,6 +19,8 @@ log = logging.getLogger(__name__)
 @peripheral_server.peripheral_model
 class UARTPublisher(object):
     rx_buffers = defaultdict(deque)
+    rx_conditions = {}  # uart_id: Condition, notified by rx_data
+    _conditions_lock = Lock()
 
     @classmethod
     @peripheral_server.tx_msg
@@ -30,18 +33,43 @@ class UARTPublisher(object):
         return msg
 
     @classmethod
-    def read(cls, uart_id, count=1, block=False):
+    def _get_condition(cls, uart_id):
+        with cls._conditions_lock:
+            if uart_id not in cls.rx_conditions:
+                cls.rx_conditions[uart_id] = Condition()
+            return cls.rx_conditions[uart_id]
+
+    @classmethod
+    def _wait_for(cls, uart_id, ready, timeout):
+        '''
+            Blocks until ready() is true or timeout seconds pass, time
+            spent blocked is reported to hal_latency as waiting
+        '''
+        condition = cls._get_condition(uart_id)
+        with condition:
+            if ready():
+                return
+            start = hal_latency.now()
+            if not condition.wait_for(ready, timeout):
+                log.debug("UARTPublisher id:%s timed out" % hex(uart_id))
+            hal_latency.add_wait(hal_latency.now() - start)
+
+    @classmethod
+    def read(cls, uart_id, count=1, block=False, timeout=None):
         '''
             Gets data previously received from the sub/pub server
             Args:
                 uart_id:   A unique id for the uart
                 count:  Max number of chars to read
                 block(bool): Block if data is not available
+                timeout: Max seconds to block, None blocks until count
+                         chars are available
         '''
         log.debug("In: UARTPublisher.read id:%s count:%i, block:%s" %
                   (hex(uart_id), count, str(block)))
-        while block and (len(cls.rx_buffers[uart_id]) < count):
-            pass
+        buffer = cls.rx_buffers[uart_id]
+        if block:
+            cls._wait_for(uart_id, lambda: len(buffer) >= count, timeout)
         log.debug("Done Blocking: UARTPublisher.read")
         buffer = cls.rx_buffers[uart_id]
         chars_available = len(buffer)
@@ -56,20 +84,22 @@ class UARTPublisher(object):
         return chars
 
     @classmethod
-    def read_line(cls, uart_id, count=1, block=False):
+    def read_line(cls, uart_id, count=1, block=False, timeout=None):
         '''
             Gets data previously received from the sub/pub server
             Args:
                 uart_id:   A unique id for the uart
                 count:  Max number of chars to read
                 block(bool): Block if data is not available
+                timeout: Max seconds to block, None blocks until count
+                         chars or a line are available
         '''
         log.debug("In: UARTPublisher.read id:%s count:%i, block:%s" %
                   (hex(uart_id), count, str(block)))
-        while block and (len(cls.rx_buffers[uart_id]) < count) :
-            if len(cls.rx_buffers[uart_id]) > 0:
-                if cls.rx_buffers[uart_id][-1] == '\n':
-                    break
+        buffer = cls.rx_buffers[uart_id]
+        if block:
+            cls._wait_for(uart_id, lambda: len(buffer) >= count or
+                          (len(buffer) > 0 and buffer[-1] == '\n'), timeout)
 
         log.debug("Done Blocking: UARTPublisher.read")
         log.debug("rx_buffers %s" % cls.rx_buffers[uart_id])
@@ -96,4 +126,7 @@ class UARTPublisher(object):
         log.debug("rx_data got message: %s" % str(msg))
         uart_id = msg['id']
         data = msg['chars']
-        cls.rx_buffers[uart_id].extend(data)
+        condition = cls._get_condition(uart_id)
+        with condition:
+            cls.rx_buffers[uart_id].extend(data)
+            condition.notify_all()
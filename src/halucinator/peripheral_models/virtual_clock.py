@@ -0,0 +1,181 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    The time seen by the firmware, used by TimerModel's timers, time
+    returning handlers (e.g., generic.Timer) and frame reception times.
+
+    Modes:
+        wall:     Host time, as if there was no clock
+        virtual:  Time only moves forward by:
+                    - per_intercept_us for each intercept hit
+                    - advance(), or the Peripheral.ClockModel.advance topic
+                      ({'seconds': float}) from an external device
+                    - Jumping to the next timer deadline once the timer
+                      scheduler has waited (time to deadline) / speed wall
+                      seconds without reaching it. speed 'max' jumps
+                      without waiting, 0 never jumps
+                  So runs are repeatable and long firmware timeouts take
+                  as little wall time as speed allows.
+'''
+import logging
+import threading
+import time as _time
+
+from . import peripheral_server
+from .. import hal_stats
+
+log = logging.getLogger(__name__)
+
+MODES = ('wall', 'virtual')
+
+
+class VirtualClock(object):
+
+    def __init__(self, mode='wall', per_intercept_us=0, speed=1.0):
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.configure(mode, per_intercept_us, speed)
+
+    def configure(self, mode='wall', per_intercept_us=0, speed=1.0):
+        '''
+            Sets the mode and restarts the clock at 0
+        '''
+        if mode not in MODES:
+            raise ValueError("Unknown clock mode %s" % mode)
+        if speed != 'max' and speed < 0:
+            raise ValueError("Clock speed must be 'max' or >= 0: %s" % speed)
+        self.mode = mode
+        self.per_intercept = per_intercept_us / 1000000.0
+        self.speed = speed
+        self.start_epoch = _time.time()
+        self.start_wall = _time.monotonic()
+        self.virtual = 0.0
+        self.intercepts = 0
+        self.skipped = 0.0  # Seconds jumped waiting for timers
+        self.advanced = 0.0  # Seconds added by advance()
+
+    @property
+    def is_virtual(self):
+        return self.mode == 'virtual'
+
+    def add_listener(self, listener):
+        '''
+            listener() is called after virtual time moves forward
+        '''
+        self._listeners.append(listener)
+
+    def now(self):
+        '''
+            Seconds since the clock started
+        '''
+        if self.mode == 'wall':
+            return _time.monotonic() - self.start_wall
+        return self.virtual
+
+    def time(self):
+        '''
+            Seconds since the epoch, like time.time()
+        '''
+        return self.start_epoch + self.now()
+
+    def _move_to(self, virtual=None, delta=0.0):
+        '''
+            Moves virtual time to virtual, or forward by delta. Both are
+            applied under the lock, so concurrent moves are not lost
+
+            :returns Seconds moved
+        '''
+        with self._lock:
+            if virtual is None:
+                virtual = self.virtual + delta
+            if virtual <= self.virtual:
+                return 0.0
+            delta = virtual - self.virtual
+            self.virtual = virtual
+        for listener in self._listeners:
+            listener()
+        return delta
+
+    def advance(self, seconds):
+        '''
+            Moves virtual time forward by seconds
+        '''
+        if self.is_virtual:
+            self.advanced += self._move_to(delta=seconds)
+
+    def skip_to(self, when):
+        '''
+            Moves virtual time forward to when (clock seconds), used by the
+            timer scheduler when nothing else reached its next deadline
+        '''
+        if self.is_virtual:
+            self.skipped += self._move_to(when)
+
+    def on_intercept(self):
+        self.intercepts += 1
+        if self.is_virtual and self.per_intercept:
+            self._move_to(delta=self.per_intercept)
+
+    def wall_delay(self, seconds):
+        '''
+            Wall seconds to wait for seconds of clock time to pass, before
+            skipping to it. None to wait until woken
+        '''
+        if self.mode == 'wall':
+            return seconds
+        if self.speed == 'max':
+            return 0
+        if self.speed == 0:
+            return None
+        return seconds / self.speed
+
+    def counts(self):
+        return {'mode': self.mode, 'seconds': self.now(),
+                'wall_seconds': _time.monotonic() - self.start_wall,
+                'intercepts': self.intercepts, 'skipped': self.skipped,
+                'advanced': self.advanced}
+
+
+clock = VirtualClock()
+
+
+def configure(mode='wall', per_intercept_us=0, speed=1.0):
+    clock.configure(mode, per_intercept_us, speed)
+
+
+def now():
+    return clock.now()
+
+
+def time():
+    return clock.time()
+
+
+def advance(seconds):
+    clock.advance(seconds)
+
+
+def on_intercept():
+    clock.on_intercept()
+
+
+@peripheral_server.peripheral_model
+class ClockModel(object):
+
+    @classmethod
+    @peripheral_server.reg_rx_handler
+    def advance(cls, msg):
+        '''
+            Moves virtual time forward by msg['seconds']
+        '''
+        clock.advance(float(msg['seconds']))
+
+
+def _export_stats():
+    if clock.is_virtual:
+        hal_stats.stats['virtual_clock'] = clock.counts()
+
+
+hal_stats.add_export_hook(_export_stats)
@@ -0,0 +1,158 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Compact binary encoding for peripheral server messages.
+
+    Each value is a one byte type tag followed by its data, all little
+    endian:
+        N           None
+        T / F       True / False
+        q <i64>     int that fits in 64 bits, else
+        L <u32> ... int as decimal ascii
+        d <f64>     float
+        b <u32> ... bytes (also bytearray, memoryview), sent unescaped
+        s <u32> ... utf-8 str
+        l <u32> ... list or tuple, followed by its items
+        m <u32> ... dict, followed by key, value pairs
+        x <u32>     bytes sent as a separate message part, value is the
+                    index of the part
+
+    When encoding with parts, bytes of at least min_part_size are not
+    copied into the encoding, they are appended to parts to be sent as
+    their own zero copy ZMQ message parts, and decode as memoryviews.
+
+    Encoded payloads start with MAGIC, which YAML text never does, so
+    receivers can tell the two apart.
+'''
+from struct import Struct
+
+MAGIC = b'\x00\x01'  # NUL + format version
+
+_U32 = Struct('<I')
+_I64 = Struct('<q')
+_F64 = Struct('<d')
+_I64_MIN = -(1 << 63)
+_I64_MAX = (1 << 63) - 1
+# Smallest bytes value sent as its own part, below this pyzmq's per part
+# overhead costs more than copying the bytes into the encoding
+ZERO_COPY_MIN = 32 * 1024
+
+
+def _encode(value, out, parts, min_part_size):
+    # bool before int as bool is a subclass of int
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        if _I64_MIN <= value <= _I64_MAX:
+            out += b'q'
+            out += _I64.pack(value)
+        else:
+            digits = str(value).encode('ascii')
+            out += b'L'
+            out += _U32.pack(len(digits))
+            out += digits
+    elif isinstance(value, float):
+        out += b'd'
+        out += _F64.pack(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        if parts is not None and len(value) >= min_part_size:
+            out += b'x'
+            out += _U32.pack(len(parts))
+            parts.append(value)
+            return
+        out += b'b'
+        out += _U32.pack(len(value))
+        out += value
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out += b's'
+        out += _U32.pack(len(data))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out += b'l'
+        out += _U32.pack(len(value))
+        for item in value:
+            _encode(item, out, parts, min_part_size)
+    elif isinstance(value, dict):
+        out += b'm'
+        out += _U32.pack(len(value))
+        for key, item in value.items():
+            _encode(key, out, parts, min_part_size)
+            _encode(item, out, parts, min_part_size)
+    else:
+        raise TypeError("Can't encode type %s" % type(value))
+
+
+def encode(value, parts=None, min_part_size=ZERO_COPY_MIN):
+    '''
+        Returns MAGIC followed by the encoded value
+
+        :param parts:  List to append large bytes values to, None to
+                       encode all bytes inline
+    '''
+    out = bytearray(MAGIC)
+    _encode(value, out, parts, min_part_size)
+    return bytes(out)
+
+
+def _decode(data, pos, parts):
+    tag = data[pos]
+    pos += 1
+    if tag == 0x4e:  # N
+        return None, pos
+    elif tag == 0x54:  # T
+        return True, pos
+    elif tag == 0x46:  # F
+        return False, pos
+    elif tag == 0x71:  # q
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    elif tag == 0x64:  # d
+        return _F64.unpack_from(data, pos)[0], pos + 8
+
+    length = _U32.unpack_from(data, pos)[0]
+    pos += 4
+    if tag == 0x78:  # x
+        return memoryview(parts[length]), pos
+    elif tag == 0x62:  # b
+        return bytes(data[pos:pos + length]), pos + length
+    elif tag == 0x73:  # s
+        return str(data[pos:pos + length], 'utf-8'), pos + length
+    elif tag == 0x4c:  # L
+        return int(str(data[pos:pos + length], 'ascii')), pos + length
+    elif tag == 0x6c:  # l
+        items = []
+        for _ in range(length):
+            item, pos = _decode(data, pos, parts)
+            items.append(item)
+        return items, pos
+    elif tag == 0x6d:  # m
+        items = {}
+        for _ in range(length):
+            key, pos = _decode(data, pos, parts)
+            items[key], pos = _decode(data, pos, parts)
+        return items, pos
+    raise ValueError("Invalid type tag %#x at %i" % (tag, pos - 1))
+
+
+def is_encoded(data):
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def decode(data, parts=()):
+    '''
+        Decodes data, which must start with MAGIC
+
+        :param parts:  Buffers of the message parts after data
+    '''
+    if not is_encoded(data):
+        raise ValueError("Data is not binary encoded")
+    value, pos = _decode(memoryview(data), len(MAGIC), parts)
+    if pos != len(data):
+        raise ValueError("%i trailing bytes" % (len(data) - pos))
+    return value
@@ -1,2 +1,3 @@
 from .arm_qemu import ARMQemuTarget
 from .armv7m_qemu import ARMv7mQemuTarget
+from .fake_target import FakeTarget
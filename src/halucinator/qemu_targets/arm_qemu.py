@@ -4,6 +4,14 @@
 
 
 from avatar2 import Avatar, QemuTarget
+from avatar2.protocols.gdb import GDB_PROT_DONE
+from .mem_transaction import MemoryTransaction
+import logging
+import threading
+log = logging.getLogger(__name__)
+
+BULK_CHUNK = 0x100  # Bytes per GDB memory request, as avatar2 uses
+
 
 class ARMQemuTarget(QemuTarget):
     '''
@@ -13,6 +21,238 @@ class ARMQemuTarget(QemuTarget):
     '''
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._reg_snapshot = None
+        self.reg_snapshot_hits = 0
+        self._mem_transaction = None
+        self.qmp_lock = threading.RLock()
+
+    def init(self, *args, **kwargs):
+        ret = super().init(*args, **kwargs)
+        # QMP is used from the interrupt sender, timer and handler threads,
+        # a request and its response must not interleave with another's
+        monitor = self.protocols.monitor
+        execute_command = monitor.execute_command
+
+        def locked_execute_command(*args, **kwargs):
+            with self.qmp_lock:
+                return execute_command(*args, **kwargs)
+        monitor.execute_command = locked_execute_command
+        return ret
+
+    def _get_reg_nr(self, reg):
+        try:
+            return self.regs._get_nr_from_name(reg)
+        except KeyError:
+            return self.avatar.arch.registers[reg]
+
+    def read_registers(self, reg_names):
+        '''
+            Reads multiple registers using a single GDB request
+
+            :param reg_names    List of register names to read
+            :returns            dict of {reg_name: value}
+        '''
+        nr2name = {self._get_reg_nr(r): r for r in reg_names}
+        req = ["-data-list-register-values", "x"]
+        req.extend(["%d" % nr for nr in sorted(nr2name)])
+        ret, resp = self.protocols.registers._sync_request(req, GDB_PROT_DONE)
+        if not ret:
+            log.warning("Batched register read failed, reading individually")
+            return {r: QemuTarget.read_register(self, r) for r in reg_names}
+
+        values = {}
+        for reg_value in resp['payload']['register-values']:
+            name = nr2name[int(reg_value['number'])]
+            values[name] = int(reg_value['value'], 16)
+        return values
+
+    def snapshot_registers(self):
+        '''
+            Reads the full register file in one request, subsequent
+            register reads are served from the snapshot until
+            release_registers is called.  Writing a register drops it
+            from the snapshot.
+        '''
+        self._reg_snapshot = self.read_registers(
+            list(self.avatar.arch.registers.keys()))
+        self.reg_snapshot_hits = 0
+
+    def registers_snapshot(self):
+        '''
+            Returns a copy of the register snapshot, {name: value}, or None
+            if there isn't one.  Registers written since the snapshot are
+            missing from it
+        '''
+        if self._reg_snapshot is None:
+            return None
+        return dict(self._reg_snapshot)
+
+    def release_registers(self):
+        '''
+            Drops the register snapshot
+
+            :returns Number of GDB round trips saved by the snapshot
+        '''
+        self._reg_snapshot = None
+        return max(self.reg_snapshot_hits - 1, 0)
+
+    def set_breakpoints(self, bps, window=64):
+        '''
+            Inserts many break points, sending up to window requests to
+            GDB before waiting for their responses
+
+            :param bps      List of (addr, temporary)
+            :param window   Max requests outstanding, keeps GDB's input
+                            pipe from filling
+            :returns        List of break point numbers, -1 if the insert
+                            failed
+        '''
+        if not self._can_pipeline():
+            return [self.set_breakpoint(addr, temporary=temp)
+                    for addr, temp in bps]
+
+        reqs = ["-break-insert %s*0x%x" % ("-t " if temp else "", addr)
+                for addr, temp in bps]
+        bp_nums = []
+        for resp in self._pipeline(reqs, window):
+            if resp is not None:
+                bp_nums.append(int(resp['payload']['bkpt']['number']))
+            else:
+                log.error("Break point insert failed")
+                bp_nums.append(-1)
+        return bp_nums
+
+    def _can_pipeline(self, address=None):
+        '''
+            Checks GDB requests can be pipelined, and if address is given
+            that it is in memory held by QEMU (not forwarded to python)
+        '''
+        if not hasattr(self.protocols.execution, '_communicator'):
+            return False
+        if address is None:
+            return True
+        try:
+            mem = self.avatar.get_memory_range(address)
+        except Exception:
+            mem = None
+        return mem is not None and not mem.forwarded
+
+    def _pipeline(self, reqs, window=64):
+        '''
+            Sends GDB/MI requests, up to window before waiting for their
+            responses
+
+            :param reqs     List of requests, without tokens
+            :returns        List of responses, None for failed requests
+        '''
+        proto = self.protocols.execution
+        resps = []
+        for i in range(0, len(reqs), window):
+            tokens = []
+            for req in reqs[i:i + window]:
+                token = proto._communicator.get_token()
+                proto._gdbmi.write("%d%s" % (token, req), read_response=False,
+                                   timeout_sec=0)
+                tokens.append(token)
+            for token in tokens:
+                try:
+                    resp = proto._communicator.get_sync_response(token)
+                except Exception:
+                    resp = None
+                if resp is not None and resp['message'] != GDB_PROT_DONE:
+                    log.debug("GDB request failed: %s" % resp)
+                    resp = None
+                resps.append(resp)
+        return resps
+
+    def read_memory_bulk(self, address, length):
+        '''
+            Reads length bytes using pipelined GDB requests of
+            BULK_CHUNK bytes, instead of waiting for each in turn
+        '''
+        reqs = ["-data-read-memory-bytes %d %d" %
+                (address + i, min(BULK_CHUNK, length - i))
+                for i in range(0, length, BULK_CHUNK)]
+        data = bytearray()
+        for resp in self._pipeline(reqs):
+            if resp is None:
+                raise Exception("Failed to read memory!")
+            data += bytes.fromhex(resp['payload']['memory'][0]['contents'])
+        return bytes(data)
+
+    def write_memory_bulk(self, address, data):
+        '''
+            Writes data using pipelined GDB requests of BULK_CHUNK bytes
+
+            :returns True on success else False
+        '''
+        view = memoryview(data).cast('B')
+        reqs = ["-data-write-memory-bytes %d %s" %
+                (address + i, view[i:i + BULK_CHUNK].hex())
+                for i in range(0, len(view), BULK_CHUNK)]
+        failed = self._pipeline(reqs).count(None)
+        if failed:
+            log.error("%i of %i memory writes at %#x failed" %
+                      (failed, len(reqs), address))
+        return not failed
+
+    def begin_mem_transaction(self, line_size=64):
+        '''
+            Starts caching memory reads and collecting memory writes,
+            see MemoryTransaction
+
+            :param line_size    Number of bytes read on first touch of a line
+        '''
+        self._mem_transaction = MemoryTransaction(self, line_size)
+
+    def end_mem_transaction(self, flush=True):
+        '''
+            Ends the active memory transaction
+
+            :param flush    Write collected writes to the target, if False
+                            they are discarded
+            :returns        The ended MemoryTransaction
+        '''
+        transaction = self._mem_transaction
+        self._mem_transaction = None
+        if flush and transaction is not None:
+            transaction.flush()
+        return transaction
+
+    def read_memory(self, address, size, num_words=1, raw=False):
+        if self._mem_transaction is not None:
+            return self._mem_transaction.read(address, size, num_words, raw)
+        return self.read_memory_uncached(address, size, num_words, raw)
+
+    def write_memory(self, address, size, value, num_words=1, raw=False):
+        if self._mem_transaction is not None:
+            return self._mem_transaction.write(address, size, value,
+                                               num_words, raw)
+        return self.write_memory_uncached(address, size, value, num_words,
+                                          raw)
+
+    def read_memory_uncached(self, address, size, num_words=1, raw=False):
+        if raw and size * num_words > BULK_CHUNK and \
+                self._can_pipeline(address):
+            return self.read_memory_bulk(address, size * num_words)
+        return super().read_memory(address, size, num_words, raw)
+
+    def write_memory_uncached(self, address, size, value, num_words=1,
+                              raw=False):
+        if raw and len(value) > BULK_CHUNK and self._can_pipeline(address):
+            return self.write_memory_bulk(address, value)
+        return super().write_memory(address, size, value, num_words, raw)
+
+    def read_register(self, register):
+        if self._reg_snapshot is not None and register in self._reg_snapshot:
+            self.reg_snapshot_hits += 1
+            return self._reg_snapshot[register]
+        return super().read_register(register)
+
+    def write_register(self, register, value):
+        if self._reg_snapshot is not None:
+            self._reg_snapshot.pop(register, None)
+        return super().write_register(register, value)
 
     def get_arg(self, idx):
         '''
@@ -62,14 +302,44 @@ class ARMQemuTarget(QemuTarget):
         '''
         self.regs.lr = ret_addr
 
+    def call_site(self, func_addr):
+        '''
+            Gets the address of the Thumb BL that called the function at
+            func_addr, from the return address
+
+            :returns Address, or None if the function wasn't called by a
+                     BL to it (e.g., it was tail called or called through
+                     a register)
+        '''
+        site = (self.get_ret_addr() & 0xFFFFFFFE) - 4
+        if site < 0 or site >= 0xF0000000:  # EXC_RETURN, not a call
+            return None
+        hw1, hw2 = self.read_memory(site, 2, 2)
+        if hw1 & 0xF800 != 0xF000 or hw2 & 0xD000 != 0xD000:
+            return None
+        sign = (hw1 >> 10) & 1
+        i1 = 1 ^ ((hw2 >> 13) & 1) ^ sign
+        i2 = 1 ^ ((hw2 >> 11) & 1) ^ sign
+        offset = (sign << 24) | (i1 << 23) | (i2 << 22) | \
+            ((hw1 & 0x3FF) << 12) | ((hw2 & 0x7FF) << 1)
+        if sign:
+            offset -= 1 << 25
+        if (site + 4 + offset) & 0xFFFFFFFF != func_addr & 0xFFFFFFFE:
+            return None
+        return site
+
     def execute_return(self, ret_value):
         if ret_value != None:
             # Puts ret value in r0
             self.regs.r0 = ret_value
         self.regs.pc = self.regs.lr
 
-
-    
+    def trigger_interrupts(self, interrupt_numbers, cpu_number=0):
+        '''
+            Triggers each interrupt in interrupt_numbers, in order
+        '''
+        for num in interrupt_numbers:
+            self.trigger_interrupt(num, cpu_number)
 
     def irq_set(self, irq_num=1, cpu=0):
         self.protocols.monitor.execute_command("avatar-set-irq", 
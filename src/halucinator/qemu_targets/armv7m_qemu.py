@@ -1,5 +1,11 @@
+import json
+import logging
+
 from .arm_qemu import ARMQemuTarget
 
+log = logging.getLogger(__name__)
+
+
 class ARMv7mQemuTarget(ARMQemuTarget):
 
     def trigger_interrupt(self, interrupt_number, cpu_number=0):
@@ -7,6 +13,33 @@ class ARMv7mQemuTarget(ARMQemuTarget):
             'avatar-armv7m-inject-irq',
             {'num_irq': interrupt_number, 'num_cpu': cpu_number})
 
+    def trigger_interrupts(self, interrupt_numbers, cpu_number=0):
+        '''
+            Injects several interrupts, writing all the QMP commands before
+            reading their responses, so a batch costs one round trip
+        '''
+        monitor = self.protocols.monitor
+        if len(interrupt_numbers) < 2 or not hasattr(monitor, '_telnet'):
+            return super().trigger_interrupts(interrupt_numbers, cpu_number)
+        with self.qmp_lock:
+            first_id = monitor.id
+            cmds = ''.join('%s\r\n' % json.dumps(
+                {'execute': 'avatar-armv7m-inject-irq',
+                 'arguments': {'num_irq': num, 'num_cpu': cpu_number},
+                 'id': first_id + i})
+                for i, num in enumerate(interrupt_numbers))
+            monitor._telnet.write(cmds.encode('ascii'))
+            remaining = len(interrupt_numbers)
+            while remaining:
+                resp = json.loads(monitor._telnet.read_until(
+                    '\r\n'.encode('ascii')).decode('ascii'))
+                if 'id' not in resp:
+                    continue  # Event
+                remaining -= 1
+                if 'error' in resp:
+                    log.error("Injecting IRQ failed: %s" % resp['error'])
+            monitor.id = first_id + len(interrupt_numbers)
+
     def set_vector_table_base(self, base, cpu_number=0):
         self.protocols.monitor.execute_command(
             'avatar-armv7m-set-vector-table-base',
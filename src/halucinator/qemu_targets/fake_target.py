@@ -0,0 +1,274 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    A target for running bp_handlers without QEMU or GDB.
+
+    Memory is a set of bytearrays and registers are a dict. Every
+    operation that would be a GDB request on ARMQemuTarget counts as a
+    round trip and busy waits for latency seconds, so handler costs can be
+    measured with a chosen transport delay. Calling convention helpers,
+    register snapshots and memory transactions are the ones used by
+    ARMQemuTarget.
+'''
+import logging
+import time
+import types
+from struct import pack, unpack
+
+from .arm_qemu import ARMQemuTarget
+from .mem_transaction import NUM2FMT
+
+log = logging.getLogger(__name__)
+
+REGISTERS = ['r0', 'r1', 'r2', 'r3', 'r4', 'r5', 'r6', 'r7', 'r8', 'r9',
+             'r10', 'r11', 'r12', 'sp', 'lr', 'pc', 'cpsr']
+
+
+class FakeRegs(object):
+    '''
+        target.regs, attributes are read and written through the target
+    '''
+
+    def __init__(self, target):
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        return self._target.read_register(name)
+
+    def __setattr__(self, name, value):
+        self._target.write_register(name, value)
+
+
+class FakeMemoryRange(object):
+
+    def __init__(self, address, size, name=None, forwarded=False,
+                 forwarded_to=None, permissions='rwx'):
+        self.address = address
+        self.size = size
+        self.name = name
+        self.forwarded = forwarded
+        self.forwarded_to = forwarded_to
+        self.permissions = permissions
+        self.data = bytearray(size)
+
+
+class FakeAvatar(object):
+    '''
+        The parts of avatar2.Avatar used by bp_handlers
+    '''
+
+    def __init__(self, config=None, output_directory=None):
+        self.arch = types.SimpleNamespace(
+            registers={name: num for num, name in enumerate(REGISTERS)})
+        self.config = config
+        self.output_directory = output_directory
+        self.memory_ranges = []
+        self.callables = {}
+
+    def get_memory_range(self, address):
+        for mem in self.memory_ranges:
+            if mem.address <= address < mem.address + mem.size:
+                return mem
+        return None
+
+
+class FakeTarget(object):
+    '''
+        Stand in for ARMQemuTarget, see module docstring
+
+        :param config:   HalucinatorConfig, used for get_symbol_name and
+                         options
+        :param latency:  Seconds each round trip to the target takes
+    '''
+
+    def __init__(self, config=None, latency=0.0, output_directory=None):
+        self.avatar = FakeAvatar(config, output_directory)
+        self.name = 'fake'
+        self.regs = FakeRegs(self)
+        self.latency = latency
+        self.registers = {name: 0 for name in REGISTERS}
+        self.state = 'STOPPED'
+        self.round_trips = 0
+        self.unmapped_accesses = 0
+        self.breakpoints = {}  # bp number: address
+        self.watchpoints = {}  # bp number: (address, write, read)
+        self.interrupts = []  # (kind, irq number), in order raised
+        self.vector_base = 0
+        self._next_bp = 1
+        self._reg_snapshot = None
+        self.reg_snapshot_hits = 0
+        self._mem_transaction = None
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            end = time.perf_counter() + self.latency
+            while time.perf_counter() < end:
+                pass
+
+    def add_memory_range(self, address, size, name=None, file=None,
+                         forwarded=False, forwarded_to=None,
+                         permissions='rwx', **kwargs):
+        '''
+            Adds memory, same arguments as Avatar.add_memory_range.
+            Forwarded ranges read as zeros and ignore writes
+        '''
+        mem = FakeMemoryRange(address, size, name, forwarded, forwarded_to,
+                              permissions)
+        if file is not None:
+            with open(file, 'rb') as infile:
+                contents = infile.read(size)
+            mem.data[:len(contents)] = contents
+        self.avatar.memory_ranges.append(mem)
+        return mem
+
+    def _find(self, address, length):
+        mem = self.avatar.get_memory_range(address)
+        if mem is None or mem.forwarded or \
+                address + length > mem.address + mem.size:
+            self.unmapped_accesses += 1
+            log.debug("Unmapped access %#x (%i bytes)" % (address, length))
+            return None, 0
+        return mem, address - mem.address
+
+    # Registers
+    def read_register(self, register):
+        if self._reg_snapshot is not None and register in self._reg_snapshot:
+            self.reg_snapshot_hits += 1
+            return self._reg_snapshot[register]
+        self._round_trip()
+        return self.registers[register]
+
+    def write_register(self, register, value):
+        if self._reg_snapshot is not None:
+            self._reg_snapshot.pop(register, None)
+        self._round_trip()
+        self.registers[register] = value & 0xFFFFFFFF
+        return True
+
+    def read_registers(self, reg_names):
+        self._round_trip()
+        return {name: self.registers[name] for name in reg_names}
+
+    def load_registers(self, values):
+        '''
+            Sets registers without counting round trips, e.g., to replay a
+            recorded intercept
+        '''
+        for name, value in values.items():
+            self.registers[name] = value & 0xFFFFFFFF
+
+    snapshot_registers = ARMQemuTarget.snapshot_registers
+    registers_snapshot = ARMQemuTarget.registers_snapshot
+    release_registers = ARMQemuTarget.release_registers
+
+    # Memory
+    def read_memory_uncached(self, address, size, num_words=1, raw=False):
+        self._round_trip()
+        length = size * num_words
+        mem, offset = self._find(address, length)
+        data = bytes(length) if mem is None else \
+            bytes(mem.data[offset:offset + length])
+        if raw:
+            return data
+        values = unpack('<%i%s' % (num_words, NUM2FMT[size]), data)
+        return values[0] if num_words == 1 else list(values)
+
+    def write_memory_uncached(self, address, size, value, num_words=1,
+                              raw=False):
+        self._round_trip()
+        if raw:
+            data = bytes(value)
+        elif num_words == 1:
+            data = pack('<%s' % NUM2FMT[size], value)
+        else:
+            data = pack('<%i%s' % (num_words, NUM2FMT[size]), *value)
+        mem, offset = self._find(address, len(data))
+        if mem is not None:
+            mem.data[offset:offset + len(data)] = data
+        return True
+
+    def read_memory(self, address, size, num_words=1, raw=False):
+        if self._mem_transaction is not None:
+            return self._mem_transaction.read(address, size, num_words, raw)
+        return self.read_memory_uncached(address, size, num_words, raw)
+
+    def write_memory(self, address, size, value, num_words=1, raw=False):
+        if self._mem_transaction is not None:
+            return self._mem_transaction.write(address, size, value,
+                                               num_words, raw)
+        return self.write_memory_uncached(address, size, value, num_words,
+                                          raw)
+
+    begin_mem_transaction = ARMQemuTarget.begin_mem_transaction
+    end_mem_transaction = ARMQemuTarget.end_mem_transaction
+
+    # Calling convention
+    get_arg = ARMQemuTarget.get_arg
+    set_arg = ARMQemuTarget.set_arg
+    get_ret_addr = ARMQemuTarget.get_ret_addr
+    set_ret_addr = ARMQemuTarget.set_ret_addr
+    execute_return = ARMQemuTarget.execute_return
+    call_site = ARMQemuTarget.call_site
+
+    # Execution
+    def cont(self, blocking=True):
+        self._round_trip()
+        self.state = 'RUNNING'
+
+    def stop(self, blocking=True):
+        self._round_trip()
+        self.state = 'STOPPED'
+
+    def set_breakpoint(self, address, temporary=False, **kwargs):
+        self._round_trip()
+        bp = self._next_bp
+        self._next_bp += 1
+        self.breakpoints[bp] = address
+        return bp
+
+    def set_breakpoints(self, bps, window=64):
+        return [self.set_breakpoint(addr, temporary=temp)
+                for addr, temp in bps]
+
+    def set_watchpoint(self, address, write=True, read=False, **kwargs):
+        self._round_trip()
+        bp = self._next_bp
+        self._next_bp += 1
+        self.watchpoints[bp] = (address, write, read)
+        return bp
+
+    # Interrupts
+    def trigger_interrupt(self, interrupt_number, cpu_number=0):
+        self._round_trip()
+        self.interrupts.append(('trigger', interrupt_number))
+
+    def trigger_interrupts(self, interrupt_numbers, cpu_number=0):
+        self._round_trip()
+        self.interrupts.extend(('trigger', num) for num in interrupt_numbers)
+
+    def irq_set(self, irq_num=1, cpu=0):
+        self._round_trip()
+        self.interrupts.append(('set', irq_num))
+
+    def irq_clear(self, irq_num=1, cpu=0):
+        self._round_trip()
+        self.interrupts.append(('clear', irq_num))
+
+    def irq_pulse(self, irq_num=1, cpu=0):
+        self._round_trip()
+        self.interrupts.append(('pulse', irq_num))
+
+    def set_vector_table_base(self, base, cpu_number=0):
+        self._round_trip()
+        self.vector_base = base
+
+    def enable_interrupt(self, interrupt_number, cpu_number=0):
+        self._round_trip()
+
+    def get_symbol_name(self, addr):
+        if self.avatar.config is None:
+            return None
+        return self.avatar.config.get_symbol_name(addr)
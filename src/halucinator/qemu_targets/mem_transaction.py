@@ -0,0 +1,177 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+from struct import pack, unpack
+import logging
+log = logging.getLogger(__name__)
+
+NUM2FMT = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class MemoryTransaction(object):
+    '''
+        Caches guest memory for the duration of an intercept.
+
+        Reads fetch a whole line of memory on first touch and are served
+        from that buffer afterwards. Writes are collected and flushed
+        as one write per contiguous range when the transaction ends.
+        Only lines fully inside a non forwarded memory range are cached,
+        accesses to MMIO go straight to the target.
+    '''
+
+    def __init__(self, target, line_size=64):
+        if line_size & (line_size - 1):
+            raise ValueError("line_size must be a power of 2: %i" % line_size)
+        self.target = target
+        self.line_size = line_size
+        self.lines = {}  # line_addr: bytearray
+        self.cacheable = {}  # line_addr: bool
+        self.writes = []  # [start_addr, bytearray] sorted by start_addr
+        self.reads_saved = 0
+        self.writes_saved = 0
+
+    def _line_addr(self, addr):
+        return addr & ~(self.line_size - 1)
+
+    def _is_cacheable(self, line_addr):
+        if line_addr not in self.cacheable:
+            try:
+                mem = self.target.avatar.get_memory_range(line_addr)
+            except Exception:
+                mem = None
+            self.cacheable[line_addr] = mem is not None and \
+                not mem.forwarded and \
+                mem.address <= line_addr and \
+                line_addr + self.line_size <= mem.address + mem.size
+        return self.cacheable[line_addr]
+
+    def _in_cache(self, addr, length):
+        '''
+            Checks that every line addr to addr+length touches is cacheable
+        '''
+        line = self._line_addr(addr)
+        while line < addr + length:
+            if not self._is_cacheable(line):
+                return False
+            line += self.line_size
+        return True
+
+    def _get_line(self, line_addr):
+        line = self.lines.get(line_addr)
+        if line is None:
+            data = self.target.read_memory_uncached(line_addr, 1,
+                                                    self.line_size, raw=True)
+            line = bytearray(data)
+            # Pending writes take precedence over what is in the target
+            for start, buf in self.writes:
+                lo = max(start, line_addr)
+                hi = min(start + len(buf), line_addr + self.line_size)
+                if lo < hi:
+                    line[lo - line_addr:hi - line_addr] = \
+                        buf[lo - start:hi - start]
+            self.lines[line_addr] = line
+        else:
+            self.reads_saved += 1
+        return line
+
+    def read(self, address, size, num_words=1, raw=False):
+        length = size * num_words
+        if not self._in_cache(address, length):
+            # Part may be cached, the target must see pending writes to it
+            self._flush_range(address, length)
+            return self.target.read_memory_uncached(address, size,
+                                                    num_words, raw)
+        data = bytearray()
+        addr = address
+        while addr < address + length:
+            line_addr = self._line_addr(addr)
+            line = self._get_line(line_addr)
+            end = min(address + length, line_addr + self.line_size)
+            data += line[addr - line_addr:end - line_addr]
+            addr = end
+
+        if raw:
+            return bytes(data)
+        mem = list(unpack('<%d%s' % (num_words, NUM2FMT[size]), data))
+        return mem[0] if num_words == 1 else mem
+
+    def write(self, address, size, value, num_words=1, raw=False):
+        if raw:
+            data = bytes(value)
+        elif num_words == 1:
+            data = pack('<%d%s' % (num_words, NUM2FMT[size]), value)
+        else:
+            data = pack('<%d%s' % (num_words, NUM2FMT[size]), *value)
+
+        in_cache = self._in_cache(address, len(data))
+        if not in_cache:
+            # Older pending writes to the cached part must land first
+            self._flush_range(address, len(data))
+            self.target.write_memory_uncached(address, size, value,
+                                              num_words, raw)
+
+        # Keep cached lines coherent
+        addr = address
+        while addr < address + len(data):
+            line_addr = self._line_addr(addr)
+            end = min(address + len(data), line_addr + self.line_size)
+            if line_addr in self.lines:
+                self.lines[line_addr][addr - line_addr:end - line_addr] = \
+                    data[addr - address:end - address]
+            addr = end
+
+        if in_cache:
+            self._add_write(address, data)
+        return True
+
+    def _flush_range(self, address, length):
+        '''
+            Writes the pending writes that overlap address to
+            address+length to the target
+        '''
+        pending = []
+        for start, buf in self.writes:
+            if start < address + length and address < start + len(buf):
+                log.debug("Flushing %i bytes to %#x" % (len(buf), start))
+                self.target.write_memory_uncached(start, 1, bytes(buf),
+                                                  len(buf), raw=True)
+            else:
+                pending.append([start, buf])
+        self.writes = pending
+
+    def _add_write(self, address, data):
+        '''
+            Adds write to the pending writes, merging it with any
+            overlapping or adjacent writes
+        '''
+        start = address
+        buf = bytearray(data)
+        merged = []
+        for w_start, w_buf in self.writes:
+            w_end = w_start + len(w_buf)
+            if w_end < start or w_start > start + len(buf):
+                merged.append([w_start, w_buf])
+                continue
+            # Overlapping or adjacent, new data wins where they overlap
+            self.writes_saved += 1
+            new_start = min(start, w_start)
+            new_end = max(start + len(buf), w_end)
+            new_buf = bytearray(new_end - new_start)
+            new_buf[w_start - new_start:w_end - new_start] = w_buf
+            new_buf[start - new_start:start - new_start + len(buf)] = buf
+            start, buf = new_start, new_buf
+        merged.append([start, buf])
+        merged.sort(key=lambda w: w[0])
+        self.writes = merged
+
+    def flush(self):
+        '''
+            Writes all pending writes to the target, one write per
+            contiguous range
+        '''
+        for start, buf in self.writes:
+            log.debug("Flushing %i bytes to %#x" % (len(buf), start))
+            self.target.write_memory_uncached(start, 1, bytes(buf),
+                                              len(buf), raw=True)
+        self.writes = []
@@ -3,7 +3,7 @@
 # certain rights in this software.
 
 
-from struct import unpack
+from struct import pack, unpack
 
 
 def get_sp_and_entry(binary_filename):
@@ -20,3 +20,96 @@ def get_sp_and_entry(binary_filename):
         sp, entry = unpack('<II', bin_file.read(8))
 
     return sp, entry
+
+
+# Thumb-2 instruction encoders used to write code into the emulated system.
+# Each returns the little endian bytes of the instruction
+IP = 12
+SP = 13
+LR = 14
+PC = 15
+
+
+def _halfwords(*hws):
+    return pack('<%iH' % len(hws), *hws)
+
+
+def thumb_movs_imm(rd, imm):
+    ''' MOVS <rd>, #<imm> (imm 0-255, rd r0-r7) '''
+    if imm < 0 or imm > 0xFF:
+        raise ValueError("Immediate out of range %#x" % imm)
+    return _halfwords(0x2000 | (rd << 8) | imm)
+
+
+def thumb_adds_imm(rd, imm):
+    ''' ADDS <rd>, #<imm> (imm 0-255, rd r0-r7) '''
+    return _halfwords(0x3000 | (rd << 8) | imm)
+
+
+def _thumb_mov16(opcode, rd, imm):
+    imm4 = (imm >> 12) & 0xF
+    i = (imm >> 11) & 1
+    imm3 = (imm >> 8) & 0x7
+    imm8 = imm & 0xFF
+    return _halfwords(opcode | (i << 10) | imm4, (imm3 << 12) | (rd << 8) | imm8)
+
+
+def thumb_movw(rd, imm):
+    ''' MOVW <rd>, #<imm> sets rd to 16 bit imm '''
+    return _thumb_mov16(0xF240, rd, imm & 0xFFFF)
+
+
+def thumb_movt(rd, imm):
+    ''' MOVT <rd>, #<imm> sets top 16 bits of rd '''
+    return _thumb_mov16(0xF2C0, rd, imm & 0xFFFF)
+
+
+def thumb_mov32(rd, value):
+    ''' MOVW/MOVT pair that sets rd to 32 bit value '''
+    return thumb_movw(rd, value & 0xFFFF) + thumb_movt(rd, value >> 16)
+
+
+def thumb_ldr_imm(rt, rn, offset):
+    ''' LDR.W <rt>, [<rn>, #<offset>] (offset 0-4095) '''
+    return _halfwords(0xF8D0 | rn, (rt << 12) | offset)
+
+
+def thumb_str_imm(rt, rn, offset):
+    ''' STR.W <rt>, [<rn>, #<offset>] (offset 0-4095) '''
+    return _halfwords(0xF8C0 | rn, (rt << 12) | offset)
+
+
+def thumb_ldr_literal(rt, instr_addr, literal_addr):
+    '''
+        LDR.W <rt>, [pc, #<offset>] for instruction at instr_addr loading
+        the word at literal_addr (must be 4 byte aligned and after instr)
+    '''
+    offset = literal_addr - ((instr_addr + 4) & ~3)
+    if offset < 0 or offset > 0xFFF or literal_addr & 3:
+        raise ValueError("Invalid literal address %#x" % literal_addr)
+    return _halfwords(0xF8DF, (rt << 12) | offset)
+
+
+def thumb_bx_lr():
+    return _halfwords(0x4770)
+
+
+def thumb_nop():
+    return _halfwords(0xBF00)
+
+
+def thumb_long_jump(addr, dest):
+    '''
+        Code placed at addr that jumps to dest (LDR.W pc, [pc] with
+        literal). Is 8 bytes if addr is 4 byte aligned else 10 bytes
+
+        :param addr:    Address code is to be placed at
+        :param dest:    Address to jump to (Thumb bit is set)
+    '''
+    code = b''
+    literal_addr = (addr + 4 + 3) & ~3
+    code += thumb_ldr_literal(PC, addr, literal_addr)
+    if literal_addr != addr + 4:
+        code += thumb_nop()
+    code += pack('<I', dest | 1)
+    return code
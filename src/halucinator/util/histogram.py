@@ -0,0 +1,94 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+
+class LatencyHistogram(object):
+    '''
+        Fixed size histogram of integer values (HDR histogram style).
+
+        Values below 2**sub_bucket_bits get their own bucket, above that
+        each power of 2 is split into 2**(sub_bucket_bits-1) buckets, so
+        the relative error of a recorded value is below 2**-(sub_bucket_bits-1).
+        Values above max_value are counted in the last bucket.
+    '''
+
+    def __init__(self, max_value=100000000, sub_bucket_bits=4):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.max_value = max_value
+        self.counts = [0] * (self._index(max_value) + 1)
+        self.total_count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return shift * self.half_count + (value >> shift)
+
+    def _highest_value(self, idx):
+        '''
+            Highest value that is counted in bucket idx
+        '''
+        if idx < self.sub_bucket_count:
+            return idx
+        shift = idx // self.half_count - 1
+        sub = idx % self.half_count + self.half_count
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        self.counts[self._index(min(value, self.max_value))] += 1
+        self.total_count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        '''
+            Adds the values recorded in other, which must use the same
+            max_value and sub_bucket_bits
+        '''
+        for idx, count in enumerate(other.counts):
+            self.counts[idx] += count
+        self.total_count += other.total_count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        '''
+            Returns the value below which percent of recorded values fall
+        '''
+        if self.total_count == 0:
+            return 0
+        target = max(1, int(round(self.total_count * percent / 100.0)))
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_value(idx), self.max)
+        return self.max
+
+    def summary(self):
+        '''
+            Dictionary of count, min, mean, p50, p95, p99, and max
+        '''
+        if self.total_count == 0:
+            return {'count': 0}
+        return {'count': self.total_count,
+                'min': self.min,
+                'mean': self.total // self.total_count,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.max}
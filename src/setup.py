@@ -43,4 +43,5 @@ setup(name='halucinator',
       requires=['avatar2',    
                 'zeromq',
                 'PyYAML',
-                'IPython' ])
+                'IPython',
+                'numpy' ])
@@ -0,0 +1,102 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Compares throughput of the yaml and binary peripheral server codecs.
+
+    Encodes and decodes EthernetModel style frames with each codec, then
+    sends them over a ZMQ PUB/SUB pair on localhost and reports
+    messages/sec for both, and for binary with frames sent as zero copy
+    message parts.
+
+    Example:
+        python codec_benchmark.py -n 20000 -s 1514
+'''
+import os
+import threading
+import time
+import zmq
+from argparse import ArgumentParser
+
+from halucinator.peripheral_models.peripheral_server import \
+    encode_zmq_msg, decode_zmq_msg, send_zmq_msg, recv_zmq_msg, set_zero_copy
+
+TOPIC = 'Peripheral.EthernetModel.rx_frame'
+
+
+def make_msg(frame_size):
+    return {'interface_id': 0, 'frame': os.urandom(frame_size)}
+
+
+def bench_codec(codec, msg, count):
+    '''
+        Returns msgs/sec to encode and decode msg
+    '''
+    start = time.time()
+    for _ in range(count):
+        encoded = encode_zmq_msg(TOPIC, msg, codec)
+        if isinstance(encoded, str):
+            encoded = encoded.encode('utf-8')
+        decode_zmq_msg(encoded)
+    return count / (time.time() - start)
+
+
+def bench_zmq(codec, msg, count, port, zero_copy=False):
+    '''
+        Returns msgs/sec sent through a PUB/SUB pair, including encoding
+        and decoding
+    '''
+    context = zmq.Context()
+    pub = context.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, 0)
+    set_zero_copy(pub)
+    pub.bind("tcp://*:%i" % port)
+    sub = context.socket(zmq.SUB)
+    sub.setsockopt(zmq.RCVHWM, 0)
+    sub.connect("tcp://localhost:%i" % port)
+    sub.setsockopt_string(zmq.SUBSCRIBE, TOPIC)
+    time.sleep(0.5)  # Let subscription propagate
+
+    received = [0]
+
+    def receiver():
+        while received[0] < count:
+            decode_zmq_msg(recv_zmq_msg(sub))
+            received[0] += 1
+
+    rx_thread = threading.Thread(target=receiver)
+    rx_thread.start()
+    start = time.time()
+    for _ in range(count):
+        send_zmq_msg(pub, encode_zmq_msg(TOPIC, msg, codec, zero_copy))
+    rx_thread.join()
+    elapsed = time.time() - start
+    pub.close()
+    sub.close()
+    context.term()
+    return count / elapsed
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-n', '--count', default=20000, type=int,
+                   help='Number of messages per test')
+    p.add_argument('-s', '--frame_size', default=1514, type=int,
+                   help='Size of frame in each message')
+    p.add_argument('-p', '--port', default=5599, type=int,
+                   help='Port used for the ZMQ test')
+    args = p.parse_args()
+
+    msg = make_msg(args.frame_size)
+    print("%-12s %16s %16s" % ("Codec", "Codec msgs/sec", "ZMQ msgs/sec"))
+    for codec in ('yaml', 'binary'):
+        codec_rate = bench_codec(codec, msg, args.count)
+        zmq_rate = bench_zmq(codec, msg, args.count, args.port)
+        print("%-12s %16.1f %16.1f" % (codec, codec_rate, zmq_rate))
+    zmq_rate = bench_zmq('binary', msg, args.count, args.port, True)
+    print("%-12s %16s %16.1f" % ('binary+parts', '', zmq_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Compares intercept throughput of break point and hypercall intercepts.
+
+    Runs halucinator twice on the same configs, once as given and once
+    with the listed functions using hypercalls, and reports calls/sec
+    for those functions from each run's stats.yaml.  Startup time is
+    included in the duration, so use a duration well above startup time.
+
+    Example:
+        python hypercall_benchmark.py -c test/STM32/example/Uart_Hyperterminal_IT_O0_config.yaml \\
+            -c test/STM32/example/Uart_Hyperterminal_IT_O0_addrs.yaml \\
+            -c test/STM32/example/Uart_Hyperterminal_IT_O0_memory.yaml \\
+            -f HAL_GetTick -d 30
+'''
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+from argparse import ArgumentParser
+
+
+def run(configs, functions, duration, name, extra_args):
+    '''
+        Runs halucinator for duration seconds and returns the total
+        number of calls made to functions
+    '''
+    cmd = [sys.executable, '-m', 'halucinator.main', '-n', name]
+    for config in configs:
+        cmd += ['-c', config]
+    cmd += extra_args
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    time.sleep(duration)
+    proc.send_signal(signal.SIGINT)
+    proc.wait()
+
+    with open(os.path.join('tmp', name, 'stats.yaml'), 'r') as infile:
+        stats = yaml.safe_load(infile)
+    total = 0
+    for value in stats.values():
+        if type(value) == dict and value.get('function') in functions:
+            total += value.get('count', 0)
+    return total
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-c', '--config', action='append', required=True,
+                   help='Config file(s) passed to halucinator')
+    p.add_argument('-f', '--function', action='append', required=True,
+                   help='Intercepted function(s) to use hypercalls for')
+    p.add_argument('-d', '--duration', default=30, type=float,
+                   help='Seconds to run each mode')
+    p.add_argument('-n', '--name', default='hypercall_bench',
+                   help='Prefix for the tmp/<name> output directories')
+    args, extra_args = p.parse_known_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml',
+                                     delete=False) as outfile:
+        yaml.safe_dump({'options': {'hypercall_functions': args.function}},
+                       outfile)
+        hypercall_config = outfile.name
+
+    try:
+        results = []
+        modes = (('breakpoint', args.config),
+                 ('hypercall', args.config + [hypercall_config]))
+        for mode, configs in modes:
+            calls = run(configs, args.function, args.duration,
+                        "%s_%s" % (args.name, mode), extra_args)
+            results.append((mode, calls, calls / args.duration))
+    finally:
+        os.remove(hypercall_config)
+
+    print("%-12s %12s %12s" % ("Mode", "Calls", "Calls/sec"))
+    for mode, calls, rate in results:
+        print("%-12s %12i %12.1f" % (mode, calls, rate))
+    if results[0][1]:
+        print("Speedup: %.2fx" % (results[1][1] / float(results[0][1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Peripheral I/O throughput and latency benchmarks.
+
+    Drives IOServer and ViruatalEthHub with synthetic Ethernet, UART and
+    interrupt loads against a mock target (no QEMU), see mock_target,
+    and reports sustained throughput, drops and latency percentiles.
+
+    Example:
+        python -m tools.io_benchmark -l ethernet uart -r 5000 -s 1514
+'''
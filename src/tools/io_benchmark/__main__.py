@@ -0,0 +1,84 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Runs the I/O benchmarks, see tools.io_benchmark
+'''
+import multiprocessing
+import time
+import yaml
+from argparse import ArgumentParser
+
+from halucinator.external_devices.ioserver import IOServer
+from halucinator.external_devices.ethernet_virt_hub import ViruatalEthHub
+from .loads import LOADS, uart_writes
+from .mock_target import run_target
+
+COLUMNS = ('load', 'sent', 'received', 'dropped', 'msgs_per_sec',
+           'MB_per_sec', 'p50_us', 'p99_us')
+
+
+def main():
+    p = ArgumentParser(prog='python -m tools.io_benchmark')
+    p.add_argument('-l', '--loads', nargs='+', default=list(LOADS),
+                   choices=list(LOADS), help='Loads to run, one at a time')
+    p.add_argument('-r', '--rate', default=1000, type=float,
+                   help='Messages per second, 0 for as fast as possible')
+    p.add_argument('-d', '--duration', default=5, type=float,
+                   help='Seconds to run each load')
+    p.add_argument('-s', '--size', default=64, type=int,
+                   help='Bytes per Ethernet frame or UART block')
+    p.add_argument('-p', '--port', default=5755, type=int,
+                   help='Target rx port, its tx port is port+1')
+    p.add_argument('-c', '--codec', default='binary',
+                   choices=('yaml', 'binary'))
+    p.add_argument('-T', '--transport', default='tcp',
+                   choices=('tcp', 'ipc', 'shm'))
+    p.add_argument('-q', '--queue_capacity', default=None, type=int,
+                   help='Capacity of the target\'s Ethernet rx queue')
+    p.add_argument('--queue_policy', default='tail_drop',
+                   choices=('tail_drop', 'head_drop', 'backpressure'))
+    p.add_argument('-o', '--out', default=None,
+                   help='Also write results to this yaml file')
+    args = p.parse_args()
+
+    stop = multiprocessing.Event()
+    target = multiprocessing.Process(
+        target=run_target,
+        args=(args.port, args.port + 1, stop, args.codec, args.transport,
+              args.size, args.queue_capacity, args.queue_policy))
+    target.start()
+
+    loads = [LOADS[name](args.rate, args.duration, args.size)
+             for name in args.loads]
+    io_server = IOServer(args.port + 1, args.port, codec=args.codec,
+                         transport=args.transport)
+    hub = ViruatalEthHub([io_server])
+    for load in loads:
+        load.attach(io_server, hub)
+    io_server.register_topic('Peripheral.UARTPublisher.write',
+                             uart_writes(loads))
+    io_server.start()
+    time.sleep(1)  # Let the target start and subscriptions connect
+
+    results = []
+    print(("%-10s" + " %12s" * (len(COLUMNS) - 1)) % COLUMNS)
+    for load in loads:
+        load.run()
+        result = load.results()
+        results.append(result)
+        print("%-10s %12i %12i %12i %12.1f %12.2f %12i %12i" % tuple(
+            result[column] for column in COLUMNS))
+
+    hub.shutdown()
+    io_server.join()
+    stop.set()
+    target.join()
+    if args.out is not None:
+        with open(args.out, 'w') as outfile:
+            yaml.safe_dump(results, outfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Synthetic I/O loads. Each sends messages at a fixed rate, matches the
+    firmware's replies to them, and records round trip latency and drops.
+'''
+import threading
+import time
+from collections import deque
+
+from halucinator.util.histogram import LatencyHistogram
+from .mock_target import ETH_ID, UART_ID, IRQ_ACK_ID
+
+SEQ_BYTES = 8
+
+
+class Load(object):
+    '''
+        Base class, subclasses implement send(seq) and call replied(seq)
+    '''
+    name = None
+
+    def __init__(self, rate, duration, size):
+        '''
+            :param rate:  Messages per second, 0 sends as fast as possible
+            :param duration:  Seconds to send for
+            :param size:  Payload bytes per message
+        '''
+        self.rate = rate
+        self.duration = duration
+        self.size = max(size, SEQ_BYTES)
+        self.sent_times = {}
+        self.latency = LatencyHistogram()
+        self.sent = 0
+        self.received = 0
+        self.elapsed = 0
+        self.sent_all = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def attach(self, ioserver, hub):
+        '''
+            Registers for replies, called before the IOServer starts
+        '''
+        raise NotImplementedError()
+
+    def send(self, seq):
+        raise NotImplementedError()
+
+    def replied(self, seq):
+        now = time.perf_counter()
+        with self.lock:
+            start = self.sent_times.pop(seq, None)
+            if start is None:
+                return
+            self.received += 1
+            self.latency.record((now - start) * 1000000)
+            if not self.sent_times and self.sent_all:
+                self.done.set()
+
+    def run(self, drain=1.0):
+        '''
+            Sends for duration, then waits up to drain seconds for replies
+        '''
+        self.sent_all = False
+        interval = 1.0 / self.rate if self.rate else 0
+        start = time.perf_counter()
+        end = start + self.duration
+        next_send = start
+        seq = 0
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            if now < next_send:
+                time.sleep(next_send - now)
+            with self.lock:
+                self.sent_times[seq] = time.perf_counter()
+            self.send(seq)
+            seq += 1
+            next_send += interval
+        self.sent = seq
+        with self.lock:
+            self.sent_all = True
+            if not self.sent_times:
+                self.done.set()
+        self.done.wait(drain)
+        self.elapsed = time.perf_counter() - start
+
+    def results(self):
+        summary = self.latency.summary()
+        return {'load': self.name, 'sent': self.sent,
+                'received': self.received,
+                'dropped': self.sent - self.received,
+                'msgs_per_sec': self.received / self.elapsed,
+                'MB_per_sec': self.received * self.size / self.elapsed / 1e6,
+                'p50_us': summary.get('p50', 0),
+                'p99_us': summary.get('p99', 0)}
+
+
+class _HubPort(object):
+    '''
+        Connects a load to ViruatalEthHub as if it was another emulator
+    '''
+
+    def __init__(self, on_frame):
+        self.on_frame = on_frame
+
+    def register_topic(self, topic, method):
+        pass
+
+    def send_msg(self, topic, msg):
+        self.on_frame(msg)
+
+    def shutdown(self):
+        pass
+
+
+class EthernetLoad(Load):
+    '''
+        Frames of size bytes sent through ViruatalEthHub, the firmware's
+        echo is forwarded back by the hub
+    '''
+    name = 'ethernet'
+
+    def attach(self, ioserver, hub):
+        self.hub = hub
+        self.port = _HubPort(self.on_frame)
+        hub.add_server(self.port)
+        self.padding = bytes(self.size - SEQ_BYTES)
+
+    def on_frame(self, msg):
+        self.replied(int.from_bytes(bytes(msg['frame'][:SEQ_BYTES]), 'little'))
+
+    def send(self, seq):
+        frame = seq.to_bytes(SEQ_BYTES, 'little') + self.padding
+        self.hub.received_frame(self.port, {'interface_id': ETH_ID,
+                                            'frame': frame})
+
+
+class UartLoad(Load):
+    '''
+        Blocks of size chars sent to the UART, which the firmware echoes
+        back in blocks of the same size
+    '''
+    name = 'uart'
+
+    def attach(self, ioserver, hub):
+        self.ioserver = ioserver
+        self.padding = '.' * (self.size - SEQ_BYTES)
+
+    def on_write(self, msg):
+        self.replied(int(bytes(msg['chars'][:SEQ_BYTES])))
+
+    def send(self, seq):
+        self.ioserver.send_msg('Peripheral.UARTPublisher.rx_data',
+                               {'id': UART_ID,
+                                'chars': '%08i' % seq + self.padding})
+
+
+class InterruptLoad(Load):
+    '''
+        Interrupt.Trigger messages, the firmware's ISR acknowledges each by
+        writing its number to a UART. Replies are matched in order
+    '''
+    name = 'interrupt'
+    FIRST_IRQ = 16
+
+    def attach(self, ioserver, hub):
+        self.ioserver = ioserver
+        self.pending = deque()
+
+    def on_write(self, msg):
+        with self.lock:
+            if not self.pending:
+                return
+            seq = self.pending.popleft()
+        self.replied(seq)
+
+    def send(self, seq):
+        with self.lock:
+            self.pending.append(seq)
+        self.ioserver.send_msg('Interrupt.Trigger',
+                               {'num': self.FIRST_IRQ + seq % 16})
+
+
+LOADS = {'ethernet': EthernetLoad, 'uart': UartLoad,
+         'interrupt': InterruptLoad}
+
+
+def uart_writes(loads):
+    '''
+        Returns a handler for Peripheral.UARTPublisher.write that passes
+        each message to the load using its UART id
+    '''
+    by_id = {}
+    for load in loads:
+        if isinstance(load, UartLoad):
+            by_id[UART_ID] = load
+        elif isinstance(load, InterruptLoad):
+            by_id[IRQ_ACK_ID] = load
+
+    def handler(ioserver, msg):
+        load = by_id.get(msg['id'])
+        if load is not None:
+            load.on_write(msg)
+    return handler
@@ -0,0 +1,133 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Stand in for QEMU and the firmware, so peripheral I/O can be measured
+    without an emulator.
+
+    The real peripheral server and models (EthernetModel, UARTPublisher)
+    are used. MockFirmware plays the firmware side through them:
+        - Ethernet frames raise the model's rx interrupt, whose ISR
+          echoes every queued frame back with tx_frame
+        - A main loop thread echoes UART data back, reading blocks of
+          chunk_size chars
+        - Any other interrupt is acknowledged by writing its number to
+          UART IRQ_ACK_ID
+'''
+import logging
+import os
+import queue
+import sys
+import threading
+import types
+
+from halucinator.peripheral_models import peripheral_server
+from halucinator.peripheral_models import frame_queue
+from halucinator.peripheral_models.ethernet import EthernetModel
+from halucinator.peripheral_models.uart import UARTPublisher
+
+log = logging.getLogger(__name__)
+
+ETH_ID = 0
+ETH_IRQ = 42
+UART_ID = 0x40004400
+IRQ_ACK_ID = 0xFFFF0000
+
+
+class MockTarget(object):
+    '''
+        The parts of the QEMU target used by the peripheral server,
+        interrupts are handed to firmware
+    '''
+
+    def __init__(self, firmware, output_directory=None):
+        self.firmware = firmware
+        self.avatar = types.SimpleNamespace(output_directory=output_directory)
+        self.vector_base = 0
+
+    def trigger_interrupt(self, num):
+        self.firmware.irqs.put(num)
+
+    def trigger_interrupts(self, nums):
+        for num in nums:
+            self.trigger_interrupt(num)
+
+    def irq_set(self, irq_num=1, cpu=0):
+        self.trigger_interrupt(irq_num)
+
+    def irq_clear(self, irq_num=1, cpu=0):
+        pass
+
+    def irq_pulse(self, irq_num=1, cpu=0):
+        self.trigger_interrupt(irq_num)
+
+    def set_vector_table_base(self, base):
+        self.vector_base = base
+
+
+class MockFirmware(object):
+
+    def __init__(self, chunk_size=16):
+        self.chunk_size = chunk_size
+        self.irqs = queue.Queue()
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self.isr_loop, daemon=True),
+                        threading.Thread(target=self.uart_loop, daemon=True)]
+
+    def start(self):
+        EthernetModel.rx_frame_isr = ETH_IRQ
+        EthernetModel.enable_rx_isr(ETH_ID)
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.irqs.put(None)
+
+    def isr_loop(self):
+        while not self.stopped.is_set():
+            num = self.irqs.get()
+            if num is None:
+                continue
+            if num == ETH_IRQ:
+                self.eth_isr()
+            else:
+                UARTPublisher.write(IRQ_ACK_ID, b'%i' % num)
+
+    def eth_isr(self):
+        while True:
+            frame = EthernetModel.get_rx_frame(ETH_ID)
+            if frame is None:
+                return
+            EthernetModel.tx_frame(ETH_ID, frame)
+
+    def uart_loop(self):
+        while not self.stopped.is_set():
+            chars = UARTPublisher.read(UART_ID, self.chunk_size, block=True,
+                                       timeout=0.1)
+            if chars:
+                UARTPublisher.write(UART_ID, chars)
+
+
+def run_target(rx_port, tx_port, stop, codec='auto', transport='tcp',
+               chunk_size=16, queue_capacity=None, queue_policy='tail_drop'):
+    '''
+        Runs the peripheral server and MockFirmware until stop (a
+        multiprocessing.Event) is set, use as a Process target
+    '''
+    # EthernetModel prints every frame it sends
+    sys.stdout = open(os.devnull, 'w')
+    frame_queue.configure('EthernetModel', queue_capacity, queue_policy)
+    firmware = MockFirmware(chunk_size)
+    target = MockTarget(firmware)
+    peripheral_server.start(rx_port, tx_port, target, codec=codec,
+                            transport=transport)
+    firmware.start()
+
+    def wait_for_stop():
+        stop.wait()
+        firmware.stop()
+        peripheral_server.stop()
+    threading.Thread(target=wait_for_stop, daemon=True).start()
+    peripheral_server.run_server()
@@ -0,0 +1,169 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Replays intercepts through the bp_handlers without QEMU, to measure
+    handler cost in isolation.
+
+    The config's handlers are registered on a FakeTarget, whose memories
+    are loaded from the config's memory files and whose every GDB style
+    request costs --latency microseconds. Each hit is dispatched through
+    intercepts.interceptor, so latency is recorded as in a real run.
+
+    Hits come from an intercept_trace.jsonl, written by halucinator when
+    the record_intercepts option is set, which holds the registers at each
+    hit. Without a trace every intercept is hit --count times with zeroed
+    registers. Guest memory is not recorded, handlers see the memory files
+    and their own writes.
+
+    Handlers that wait for input (e.g., a blocking UART read) will block,
+    leave them out with --skip.
+
+    Example:
+        python replay_intercepts.py -c config.yaml -t tmp/HALucinator/intercept_trace.jsonl -l 50
+'''
+import json
+import time
+import yaml
+from argparse import ArgumentParser
+
+from halucinator import hal_config, hal_latency, hal_stats
+from halucinator.bp_handlers import intercepts
+from halucinator.peripheral_models import peripheral_server
+from halucinator.qemu_targets import FakeTarget
+
+
+class BreakpointHitMessage(object):
+
+    def __init__(self, breakpoint_number, origin):
+        self.breakpoint_number = breakpoint_number
+        self.origin = origin
+
+
+def make_target(config, latency, skip):
+    '''
+        Returns a FakeTarget with the config's memories and break point
+        handlers registered
+    '''
+    target = FakeTarget(config, latency)
+    for mem in config.memories.values():
+        target.add_memory_range(mem.base_addr, mem.size, name=mem.name,
+                                file=mem.file, forwarded=mem.emulate is not None,
+                                permissions=mem.permissions)
+    replayed = []
+    for intercept in config.intercepts:
+        if intercept.function in skip or intercept.watchpoint:
+            continue
+        # Every hit has to go through interceptor
+        intercept.hypercall = False
+        intercept.static = False
+        replayed.append(intercept)
+    config.options['static_stubs'] = False
+    intercepts.register_bp_handlers(target, replayed)
+    return target
+
+
+def load_trace(filename):
+    with open(filename) as infile:
+        return [json.loads(line) for line in infile if line.strip()]
+
+
+def synthetic_trace(target, count):
+    return [{'function': hal_stats.stats[bp]['function'], 'addr': addr,
+             'regs': {}}
+            for bp, addr in target.breakpoints.items() for _ in range(count)]
+
+
+def replay(target, trace, repeat):
+    '''
+        Dispatches each hit of trace, repeat times
+
+        :returns: (hits, errors, skipped, seconds)
+    '''
+    addr2bp = {addr: bp for bp, addr in target.breakpoints.items()}
+    hits = errors = skipped = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for entry in trace:
+            bp = addr2bp.get(entry['addr'])
+            if bp is None:
+                skipped += 1
+                continue
+            target.load_registers(dict.fromkeys(target.registers, 0))
+            target.load_registers(entry['regs'])
+            target.registers['pc'] = entry['addr'] | 1
+            try:
+                intercepts.interceptor(target.avatar,
+                                       BreakpointHitMessage(bp, target))
+            except Exception:
+                errors += 1
+            hits += 1
+    return hits, errors, skipped, time.perf_counter() - start
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-c', '--config', action='append', required=True,
+                   help='Config file(s), as given to halucinator')
+    p.add_argument('-s', '--symbols', action='append', default=[],
+                   help='CSV file with each row having symbol, first_addr, '
+                        'last_addr')
+    p.add_argument('-t', '--trace', default=None,
+                   help='intercept_trace.jsonl to replay, if not given '
+                        'every intercept is hit --count times')
+    p.add_argument('-n', '--count', default=1000, type=int,
+                   help='Hits per intercept without a trace')
+    p.add_argument('-r', '--repeat', default=1, type=int,
+                   help='Times to replay the trace')
+    p.add_argument('-l', '--latency', default=0.0, type=float,
+                   help='Microseconds each round trip to the target takes')
+    p.add_argument('--skip', nargs='+', default=[],
+                   help='Functions not to register, e.g., ones that block')
+    p.add_argument('--tx_port', default=5599, type=int,
+                   help='Port handlers publish peripheral messages on')
+    p.add_argument('-o', '--out', default=None,
+                   help='Also write the latency summary to this yaml file')
+    args = p.parse_args()
+
+    config = hal_config.HalucinatorConfig()
+    for conf_file in args.config:
+        config.add_yaml(conf_file)
+    for csv_file in args.symbols:
+        config.add_csv_symbols(csv_file)
+    if not config.prepare_and_validate():
+        print("Config invalid")
+        exit(-1)
+
+    target = make_target(config, args.latency / 1000000, set(args.skip))
+    peripheral_server.start_tx(args.tx_port, target)
+    if args.trace is not None:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(target, args.count)
+    setup_trips = target.round_trips
+
+    hits, errors, skipped, secs = replay(target, trace, args.repeat)
+    trips = target.round_trips - setup_trips
+    print("Hits: %i in %.3fs, errors: %i, not registered: %i" %
+          (hits, secs, errors, skipped))
+    print("Round trips per hit: %.2f, unmapped accesses: %i" %
+          (trips / max(hits, 1), target.unmapped_accesses))
+
+    summary = hal_latency.summary()
+    print("%-30s %8s %10s %10s %10s" % ('function', 'count', 'p50 us',
+                                        'p99 us', 'return us'))
+    for func, phases in sorted(summary.items()):
+        handler = phases['handler']
+        if not handler.get('count'):
+            continue
+        print("%-30s %8i %10.1f %10.1f %10.1f" % (
+            func, handler['count'], handler['p50'], handler['p99'],
+            phases['return'].get('p50', 0)))
+    if args.out is not None:
+        with open(args.out, 'w') as outfile:
+            yaml.safe_dump(summary, outfile)
+
+
+if __name__ == '__main__':
+    main()
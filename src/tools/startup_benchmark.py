@@ -0,0 +1,162 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Measures the startup cost of large intercept configs.
+
+    Generates a synthetic config with many intercepts and times loading,
+    validating and registering the handlers (without QEMU).  The old
+    dir()/getattr handler lookup and uncached validation are timed on
+    the same config for comparison.
+
+    Example:
+        python startup_benchmark.py -n 10000
+'''
+import importlib
+import inspect
+import os
+import tempfile
+import time
+import yaml
+from argparse import ArgumentParser
+
+from halucinator import hal_config
+from halucinator.bp_handlers import intercepts
+
+BASE_CLASS = 'halucinator.bp_handlers.stm32f4.stm32f4_base.STM32F4_Base'
+CLASSES = ('halucinator.bp_handlers.ReturnZero',
+           'halucinator.bp_handlers.ReturnConstant',
+           'halucinator.bp_handlers.SkipFunc',
+           BASE_CLASS)
+
+
+def make_config(filename, num_intercepts):
+    '''
+        Writes a config with num_intercepts intercepts, resolved
+        through the symbols section
+    '''
+    base_funcs = sorted(hal_config._get_class(
+        *BASE_CLASS.rsplit('.', 1)).bp_handlers)
+    config = {'intercepts': [], 'symbols': {}}
+    for i in range(num_intercepts):
+        cls = CLASSES[i % len(CLASSES)]
+        inter = {'class': cls}
+        if cls == BASE_CLASS:
+            inter['function'] = base_funcs[i % len(base_funcs)]
+            inter['symbol'] = 'func_%i' % i
+        else:
+            inter['function'] = 'func_%i' % i
+        if cls.endswith('ReturnConstant'):
+            inter['registration_args'] = {'ret_value': i, 'silent': True}
+        config['intercepts'].append(inter)
+        config['symbols'][0x08000000 + 4 * i] = 'func_%i' % i
+    with open(filename, 'w') as outfile:
+        yaml.safe_dump(config, outfile)
+
+
+def legacy_check_handler(intercept):
+    '''
+        Validation as done before classes and signatures were cached
+    '''
+    split_str = intercept.cls.split('.')
+    module = importlib.import_module(".".join(split_str[:-1]))
+    cls_obj = getattr(module, split_str[-1])
+    args = inspect.getfullargspec(cls_obj.__init__).args
+    valid = set(intercept.class_args).issubset(set(args))
+    args = inspect.getfullargspec(cls_obj.register_handler).args
+    return valid and set(intercept.registration_args).issubset(set(args))
+
+
+def legacy_lookup(bp_cls, func_name):
+    '''
+        Handler lookup as done before the metaclass built tables
+    '''
+    canidate_methods = [getattr(bp_cls.__class__, x) for x in dir(
+        bp_cls.__class__) if hasattr(getattr(bp_cls.__class__, x), 'bp_func_list')]
+    for canidate in canidate_methods:
+        if func_name in canidate.bp_func_list:
+            return canidate
+
+
+def legacy_symbol_addr(config, sym_name):
+    for sym in config.symbols:
+        if sym_name == sym.name:
+            return sym.addr
+    return None
+
+
+def timed(results, name, func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    results.append((name, time.perf_counter() - start))
+    return ret
+
+
+def run_current(config_file):
+    results = []
+    config = hal_config.HalucinatorConfig()
+    timed(results, 'load', config.add_yaml, config_file)
+    timed(results, 'validate', config.prepare_and_validate)
+
+    def register():
+        for inter in config.intercepts:
+            bp_cls = intercepts.get_bp_handler(inter)
+            bp_cls.register_handler(None, inter.bp_addr, inter.function,
+                                    **inter.registration_args)
+    timed(results, 'register', register)
+    return results, config
+
+
+def run_legacy(config):
+    results = []
+
+    def resolve():
+        for inter in config.intercepts:
+            sym_name = inter.symbol if inter.symbol is not None \
+                else inter.function
+            legacy_symbol_addr(config, sym_name)
+    timed(results, 'resolve symbols', resolve)
+
+    def validate():
+        for inter in config.intercepts:
+            legacy_check_handler(inter)
+    timed(results, 'validate handlers', validate)
+
+    def lookup():
+        for inter in config.intercepts:
+            if inter.cls == BASE_CLASS:
+                legacy_lookup(intercepts.get_bp_handler(inter), inter.function)
+    timed(results, 'handler lookup', lookup)
+    return results
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-n', '--num_intercepts', default=10000, type=int,
+                   help='Number of intercepts in the synthetic config')
+    args = p.parse_args()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml',
+                                     delete=False) as outfile:
+        config_file = outfile.name
+    try:
+        make_config(config_file, args.num_intercepts)
+        current, config = run_current(config_file)
+    finally:
+        os.remove(config_file)
+    legacy = run_legacy(config)
+
+    print("Intercepts: %i" % args.num_intercepts)
+    print("Current:")
+    for name, secs in current:
+        print("  %-20s %8.3f s" % (name, secs))
+    print("  %-20s %8.3f s" % ('total', sum(s for _, s in current)))
+    print("Legacy (on the loaded config):")
+    for name, secs in legacy:
+        print("  %-20s %8.3f s" % (name, secs))
+    print("  %-20s %8.3f s" % ('total', sum(s for _, s in legacy)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Rebuilds the set statistics (e.g., MMIO_addresses, used_intercepts)
+    of a halucinator run from its stats journal, at any point in the run.
+
+    Example:
+        python stats_journal.py -j tmp/Uart_Example/stats.journal -t 30
+'''
+import sys
+import yaml
+from argparse import ArgumentParser
+
+from halucinator import hal_stats
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-j', '--journal', required=True,
+                   help='Stats journal (tmp/<name>/stats.journal)')
+    p.add_argument('-t', '--time', default=None, type=float,
+                   help='Seconds after start to rebuild stats at, '
+                        'default end of the journal')
+    p.add_argument('-o', '--out', default=None,
+                   help='Yaml file to write, default stdout')
+    args = p.parse_args()
+
+    stats = hal_stats.read_journal(args.journal, args.time)
+    if args.out is None:
+        yaml.safe_dump(stats, sys.stdout)
+    else:
+        with open(args.out, 'w') as outfile:
+            yaml.safe_dump(stats, outfile)
+
+
+if __name__ == '__main__':
+    main()
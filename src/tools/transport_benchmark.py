@@ -0,0 +1,124 @@
+# Copyright 2020 National Technology & Engineering Solutions of Sandia, LLC (NTESS).
+# Under the terms of Contract DE-NA0003525 with NTESS, the U.S. Government retains
+# certain rights in this software.
+
+'''
+    Measures UART echo round trip latency over each peripheral transport
+    (tcp, ipc, shm).
+
+    An IOServer, as used by external devices, sends a character on
+    Peripheral.UARTPublisher.rx_data and times how long until it is echoed
+    back on Peripheral.UARTPublisher.write.
+
+    By default the echo is done by a process standing in for halucinator,
+    so only the transport is measured. With --halucinator the echo comes
+    from a running halucinator, e.g. test/SAMR21/UART-Echo with the
+    peripheral_transport option set to the transport given by -T, which
+    includes the firmware and intercepts in the round trip.
+
+    Example:
+        python transport_benchmark.py -n 5000
+        python transport_benchmark.py --halucinator -T shm -i 0x20000ab0
+'''
+import multiprocessing
+import threading
+import time
+import zmq
+from argparse import ArgumentParser
+
+from halucinator.external_devices.ioserver import IOServer
+from halucinator.peripheral_models.peripheral_server import \
+    open_socket, encode_zmq_msg, decode_zmq_msg, send_zmq_msg, recv_zmq_msg
+from halucinator.util.histogram import LatencyHistogram
+
+RX_TOPIC = 'Peripheral.UARTPublisher.rx_data'
+TX_TOPIC = 'Peripheral.UARTPublisher.write'
+
+
+def echo_target(transport, rx_port, tx_port, stop):
+    '''
+        Echoes UART rx_data back as write, like UART-Echo in halucinator
+    '''
+    context = zmq.Context()
+    rx = open_socket(context, zmq.SUB, rx_port, transport)
+    tx = open_socket(context, zmq.PUB, tx_port, transport)
+    while not stop.is_set():
+        if not rx.poll(100):
+            continue
+        topic, msg = decode_zmq_msg(recv_zmq_msg(rx))
+        if topic == RX_TOPIC:
+            send_zmq_msg(tx, encode_zmq_msg(TX_TOPIC, msg, 'binary'))
+    rx.close()
+    tx.close()
+
+
+def bench(transport, count, uart_id, port, spawn_target=True):
+    '''
+        Returns a LatencyHistogram of round trip times in microseconds
+    '''
+    target_rx, target_tx = port, port + 1
+    stop = multiprocessing.Event()
+    if spawn_target:
+        target = multiprocessing.Process(
+            target=echo_target, args=(transport, target_rx, target_tx, stop))
+        target.start()
+    io_server = IOServer(target_tx, target_rx, transport=transport)
+    echoed = threading.Event()
+    io_server.register_topic(TX_TOPIC, lambda server, msg: echoed.set())
+    io_server.start()
+
+    msg = {'id': uart_id, 'chars': b'a'}
+    # Wait until the target is connected and echoing
+    while True:
+        echoed.clear()
+        io_server.send_msg(RX_TOPIC, msg)
+        if echoed.wait(0.5):
+            break
+
+    hist = LatencyHistogram()
+    for _ in range(count):
+        echoed.clear()
+        start = time.perf_counter()
+        io_server.send_msg(RX_TOPIC, msg)
+        echoed.wait()
+        hist.record((time.perf_counter() - start) * 1000000)
+
+    io_server.shutdown()
+    io_server.join()
+    if spawn_target:
+        stop.set()
+        target.join()
+    return hist
+
+
+def main():
+    p = ArgumentParser()
+    p.add_argument('-n', '--count', default=5000, type=int,
+                   help='Number of round trips per transport')
+    p.add_argument('-T', '--transport', nargs='+',
+                   default=['tcp', 'ipc', 'shm'],
+                   choices=('tcp', 'ipc', 'shm'), help='Transports to test')
+    p.add_argument('-p', '--port', default=5655, type=int,
+                   help='Port of the target\'s rx socket, tx is port+1')
+    p.add_argument('-i', '--id', default=0x20000ab0, type=lambda x: int(x, 0),
+                   help='UART id to send to')
+    p.add_argument('--halucinator', default=False, action='store_true',
+                   help='Echo with a running halucinator instead of a '
+                        'stand in process, -p is its rx_port (e.g. 5555)')
+    args = p.parse_args()
+
+    print("%-6s %10s %10s %10s %10s" % ('', 'p50 us', 'p99 us', 'mean us',
+                                        'max us'))
+    for idx, transport in enumerate(args.transport):
+        # Separate ports so sockets of the previous test don't interfere
+        port = args.port if args.halucinator else args.port + 2 * idx
+        hist = bench(transport, args.count, args.id, port,
+                     not args.halucinator)
+        summary = hist.summary()
+        print("%-6s %10.1f %10.1f %10.1f %10.1f" % (
+            transport, summary['p50'], summary['p99'], summary['mean'],
+            summary['max']))
+
+
+if __name__ == '__main__':
+    main()